@@ -0,0 +1,131 @@
+"""Primary/replica database routing.
+
+Reads made while serving a GET/HEAD request go to one of the
+``DATABASE_REPLICAS``; everything else (writes, unsafe requests, management
+commands, background work) uses the primary. Once a request has written, the
+rest of it reads from the primary, and so do the same client's requests for
+the next ``REPLICA_STICKY_SECONDS``, so users always read their own writes
+despite replication lag. The deadline is returned in the ``X-Primary-Until``
+header, which cross-origin clients send back, and in a cookie for
+same-origin ones.
+
+Responses stored in a cache must not be read from a replica: the cache key
+carries the current versions, so lagging data would be served as fresh to
+every client. Code that fills such a cache calls ``read_from_primary``.
+
+Queries for a tenant's data bypass all of this and go to the tenant's
+database (see ``customers.tenants``).
+"""
+
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+from customers.tenants import TENANT_APPS, current_tenant, tenant_database
+
+STICKY_COOKIE = "primary_until"
+STICKY_HEADER = "X-Primary-Until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Per-request routing state: {"use_replica": bool, "wrote": bool}, or None
+# outside of a request
+_routing = ContextVar("db_routing", default=None)
+
+
+def _tenant_database(model):
+    if model._meta.app_label in TENANT_APPS and current_tenant():
+        return tenant_database()
+    return None
+
+
+def read_from_primary():
+    """Send the rest of the current request's reads to the primary"""
+    state = _routing.get()
+    if state:
+        state["use_replica"] = False
+
+
+def commit_lag(using):
+    """Seconds an id-ordered reader of ``using`` must stay behind the writers.
+
+    SQLite runs one write transaction at a time, so ids commit in order;
+    elsewhere a lower id can commit after a higher one for as long as its
+    transaction stays open.
+    """
+    if connections[using].vendor == "sqlite":
+        return 0
+    return settings.COMMIT_LAG_SECONDS
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        tenant_db = _tenant_database(model)
+        if tenant_db:
+            return tenant_db
+        state = _routing.get()
+        if state and state["use_replica"] and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state:
+            state["use_replica"] = False
+            state["wrote"] = True
+        return _tenant_database(model) or DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary; tenants share nothing
+        tenant_dbs = settings.TENANTS.values()
+        if obj1._state.db in tenant_dbs or obj2._state.db in tenant_dbs:
+            return obj1._state.db == obj2._state.db
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS:
+            return True
+        return db in settings.TENANTS.values() and app_label in TENANT_APPS
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """Set up read routing for the request and keep writers on the primary"""
+
+    def process_request(self, request):
+        until = request.headers.get(STICKY_HEADER) or request.COOKIES.get(
+            STICKY_COOKIE, 0
+        )
+        try:
+            sticky = float(until) > time.time()
+        except ValueError:
+            sticky = False
+        request._db_routing = {
+            "use_replica": request.method in SAFE_METHODS and not sticky,
+            "wrote": False,
+        }
+        _routing.set(request._db_routing)
+
+    def process_response(self, request, response):
+        state = getattr(request, "_db_routing", None)
+        if state is None:
+            return response
+        # Streaming responses (exports) read while being consumed, after the
+        # middleware has returned, so their routing is left in place. Under
+        # ASGI the hooks run in separate contexts, so the state is cleared
+        # rather than reset with a token.
+        if not response.streaming:
+            _routing.set(None)
+        if state and state["wrote"] and settings.REPLICA_STICKY_SECONDS:
+            until = f"{time.time() + settings.REPLICA_STICKY_SECONDS:.3f}"
+            response[STICKY_HEADER] = until
+            response.set_cookie(
+                STICKY_COOKIE,
+                until,
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
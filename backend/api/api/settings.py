@@ -1,5 +1,8 @@
 import os
+import sys
 from pathlib import Path
+
+import environ
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,6 +18,20 @@ ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost,127.0.0.1").split(",")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # GEMINI_API_KEY is optional - fallback to rule-based generation if not provided
 
+# Backend for the generate endpoints: a key of AI_PROVIDERS, or "auto" for
+# Gemini when GEMINI_API_KEY is set and rule-based generation otherwise.
+# Providers are imported on first use (customers/ai.py).
+AI_PROVIDER = os.getenv("AI_PROVIDER", "auto")
+AI_PROVIDERS = {
+    "gemini": "customers.ai.GeminiProvider",
+    "rule_based": "customers.ai.RuleBasedProvider",
+}
+# POST /api/generate/batch/: prompts per request, prompts packed into one
+# Gemini call, and concurrent calls
+AI_BATCH_MAX_PROMPTS = int(os.getenv("AI_BATCH_MAX_PROMPTS", "100"))
+AI_BATCH_PACK_SIZE = int(os.getenv("AI_BATCH_PACK_SIZE", "5"))
+AI_BATCH_WORKERS = int(os.getenv("AI_BATCH_WORKERS", "10"))
+
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -30,6 +47,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "customers.tenants.TenantMiddleware",
+    "api.db_routing.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -54,7 +73,11 @@ CORS_ALLOW_HEADERS = [
     "user-agent",
     "x-csrftoken",
     "x-requested-with",
+    "x-tenant",
+    "x-primary-until",
 ]
+# Read-your-writes deadline, echoed back by the frontend (api/db_routing.py)
+CORS_EXPOSE_HEADERS = ["x-primary-until"]
 
 CORS_ALLOW_METHODS = [
     "DELETE",
@@ -84,12 +107,157 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "api.wsgi.application"
 
+# DATABASE_URL configures the primary (SQLite file by default) and the
+# comma-separated DATABASE_REPLICA_URLS any read replicas, e.g.
+# sqlite:////path/to/replica.sqlite3 locally (see sync_sqlite_replica).
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds.
+DATABASE_CONN_MAX_AGE = int(os.getenv("DATABASE_CONN_MAX_AGE", "60"))
+
+# Run on every new SQLite connection: WAL lets readers proceed during a
+# write, busy_timeout waits for the write lock instead of failing with
+# "database is locked", and IMMEDIATE transactions take the lock up front
+# so two writers can't deadlock upgrading from a read lock
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+}
+
+
+def _database(url):
+    config = environ.Env.db_url_config(url)
+    config.setdefault("CONN_MAX_AGE", DATABASE_CONN_MAX_AGE)
+    config["CONN_HEALTH_CHECKS"] = True
+    if config["ENGINE"] == "django.db.backends.sqlite3":
+        options = config.setdefault("OPTIONS", {})
+        options.setdefault(
+            "init_command",
+            ";".join(
+                f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()
+            ),
+        )
+        options.setdefault("transaction_mode", "IMMEDIATE")
+    return config
+
+
 DATABASES = {
+    "default": _database(
+        os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
+    )
+}
+DATABASE_REPLICAS = []
+for index, url in enumerate(
+    filter(None, os.getenv("DATABASE_REPLICA_URLS", "").split(","))
+):
+    alias = f"replica{index}"
+    DATABASES[alias] = _database(url.strip())
+    # Tests run against the primary's test database
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    DATABASE_REPLICAS.append(alias)
+
+# Tenants with their own database (customers/tenants.py), as comma-separated
+# name=url pairs, e.g. "acme=sqlite:////srv/acme.sqlite3,globex=postgres://...".
+# Several tenants can share a Postgres server as separate databases, or one
+# database as separate schemas (?options=-c%20search_path%3Dglobex). Create
+# their tables with `migrate --database tenant_<name>`.
+TENANTS = {}
+for entry in filter(None, os.getenv("TENANT_DATABASE_URLS", "").split(",")):
+    name, url = (part.strip() for part in entry.split("=", 1))
+    TENANTS[name] = f"tenant_{name}"
+    DATABASES[TENANTS[name]] = _database(url)
+# The tenant isolation tests (customers/tests.py) run against two tenant
+# databases of their own; the test runner only creates them for those tests
+if sys.argv[1:2] == ["test"]:
+    for name in ("acme", "globex"):
+        TENANTS.setdefault(name, f"tenant_{name}")
+        DATABASES.setdefault(
+            TENANTS[name], _database(f"sqlite:///{BASE_DIR / f'{name}.sqlite3'}")
+        )
+# Requests name their tenant in this header, or by host ("host=tenant,...")
+TENANT_HEADER = os.getenv("TENANT_HEADER", "X-Tenant")
+TENANT_HOSTS = dict(
+    (part.strip() for part in entry.split("=", 1))
+    for entry in filter(None, os.getenv("TENANT_HOSTS", "").split(","))
+)
+
+DATABASE_ROUTERS = ["api.db_routing.PrimaryReplicaRouter"]
+# After a write, the client keeps reading from the primary this long
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+# Longest a write transaction is expected to stay open. Outside SQLite, ids
+# can commit out of order, so consumers that read by id (event rollups, the
+# change feed) hold back rows this much newer than the last commit window
+COMMIT_LAG_SECONDS = int(os.getenv("COMMIT_LAG_SECONDS", "60"))
+
+# Small writes go through a per-process writer thread (customers/writer.py)
+WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE_ENABLED", "True").lower() in [
+    "true",
+    "1",
+    "yes",
+]
+WRITE_QUEUE_BATCH_SIZE = int(os.getenv("WRITE_QUEUE_BATCH_SIZE", "100"))
+WRITE_QUEUE_MAX_DELAY = float(os.getenv("WRITE_QUEUE_MAX_DELAY", "0.002"))
+# Customers enrolled per queued operation by the campaign enroll endpoint
+ENROLL_CHUNK_SIZE = int(os.getenv("ENROLL_CHUNK_SIZE", "5000"))
+
+# Local-memory cache by default; point CACHE_BACKEND at FileBasedCache (or
+# Redis) so that invalidation is shared between worker processes.
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "myecommerceagent"),
     }
 }
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", "300"))
+
+# Seconds before a segment's membership bitmap is recomputed on use
+SEGMENT_BITMAP_MAX_AGE = int(os.getenv("SEGMENT_BITMAP_MAX_AGE", "300"))
+# Relative-date segment conditions (in_last_days) measure from "now" floored
+# to this many seconds, so previews and counts can be cached in between
+# (0 = exact, uncached). Cached results expire after SEGMENT_RESULT_CACHE_TIMEOUT.
+SEGMENT_DATE_BUCKET_SECONDS = int(os.getenv("SEGMENT_DATE_BUCKET_SECONDS", "3600"))
+SEGMENT_RESULT_CACHE_TIMEOUT = int(os.getenv("SEGMENT_RESULT_CACHE_TIMEOUT", "3600"))
+# Processes used to evaluate segments over customer id partitions (1 = inline).
+# Each process using them keeps a pool this size, so only raise it for
+# management commands, not for the processes serving requests
+SEGMENT_EVALUATION_WORKERS = int(os.getenv("SEGMENT_EVALUATION_WORKERS", "1"))
+
+# Memory-mapped customer feature matrix used for lookalike audiences
+LOOKALIKE_FEATURES_DIR = os.getenv(
+    "LOOKALIKE_FEATURES_DIR", str(BASE_DIR / "var" / "lookalike")
+)
+LOOKALIKE_MAX_SIZE = int(os.getenv("LOOKALIKE_MAX_SIZE", "10000"))
+# Matrix age after which a lookalike search starts a background refresh
+LOOKALIKE_REFRESH_SECONDS = int(os.getenv("LOOKALIKE_REFRESH_SECONDS", "300"))
+
+# Event log writer: flush after this many buffered events or seconds
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "5000"))
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "1.0"))
+EVENT_RETENTION_DAYS = int(os.getenv("EVENT_RETENTION_DAYS", "180"))
+# Change-data-capture feed entries are kept this long for consumers to catch up
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "14"))
+
+# Marketing sends allowed per customer across all campaigns in the window
+FREQUENCY_CAP_MAX_SENDS = int(os.getenv("FREQUENCY_CAP_MAX_SENDS", "3"))
+FREQUENCY_CAP_WINDOW_DAYS = int(os.getenv("FREQUENCY_CAP_WINDOW_DAYS", "7"))
+SUPPRESSION_BLOOM_ERROR_RATE = float(os.getenv("SUPPRESSION_BLOOM_ERROR_RATE", "0.01"))
+
+# Send-time optimization: engagement history used and the local hour used
+# for customers without any
+SEND_TIME_LOOKBACK_DAYS = int(os.getenv("SEND_TIME_LOOKBACK_DAYS", "90"))
+DEFAULT_SEND_HOUR = int(os.getenv("DEFAULT_SEND_HOUR", "10"))
+# Send-volume forecasts (customers/forecast.py): default and maximum days
+FORECAST_DAYS = int(os.getenv("FORECAST_DAYS", "30"))
+FORECAST_MAX_DAYS = int(os.getenv("FORECAST_MAX_DAYS", "365"))
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "customers.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
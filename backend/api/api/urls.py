@@ -18,7 +18,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from customers import views
+from customers import async_views, views
 from . import views as api_views
 
 router = DefaultRouter()
@@ -33,4 +33,30 @@ urlpatterns = [
     path("health/", api_views.health_check, name="health_check"),
     path("api/", include(router.urls)),
     path("api/generate/", views.generate_segment_and_campaign, name="generate"),
+    path(
+        "api/generate/batch/",
+        views.generate_segment_and_campaign_batch,
+        name="generate_batch",
+    ),
+    path("api/events/batch/", views.ingest_events, name="ingest_events"),
+    path("api/changes/", views.list_changes, name="list_changes"),
+    # Async mirrors of the hot read paths, for ASGI deployments
+    path("api/async/health/", async_views.health_check, name="async_health"),
+    path("api/async/customers/", async_views.customer_list, name="async_customer_list"),
+    path(
+        "api/async/segments/<int:pk>/preview/",
+        async_views.segment_preview,
+        name="async_segment_preview",
+    ),
+    path(
+        "api/async/segments/<int:pk>/count/",
+        async_views.segment_count,
+        name="async_segment_count",
+    ),
+    path("api/async/campaigns/", async_views.campaign_list, name="async_campaign_list"),
+    path(
+        "api/async/generate/",
+        async_views.generate_segment_and_campaign,
+        name="async_generate",
+    ),
 ]
@@ -0,0 +1,215 @@
+"""AI providers behind the generate endpoints.
+
+``get_provider()`` returns the provider named by ``AI_PROVIDER`` (a key of
+``AI_PROVIDERS``, which maps names to dotted class paths), or with "auto"
+Gemini when ``GEMINI_API_KEY`` is set and the rule-based generator otherwise.
+Provider classes are imported and instantiated on first use and then reused
+for the life of the process, so workers and management commands that never
+generate anything don't pay for importing the Gemini SDK.
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Customer
+
+_providers = {}
+_lock = threading.Lock()
+
+
+class AIProvider:
+    """Interface of a generation backend.
+
+    ``generate_campaign`` returns ``{"segment": ..., "campaign": ...}`` and
+    ``generate_flow`` a flow definition. ``note``, when set, is passed on to
+    API clients with the result. For batches, ``generate_campaigns`` answers
+    up to ``pack_size`` prompts at once, and ``concurrent`` says whether
+    batches are worth spreading over threads (remote calls) or not (local
+    generation).
+    """
+
+    name = None
+    note = None
+    pack_size = 1
+    concurrent = True
+
+    def generate_campaign(self, prompt):
+        raise NotImplementedError
+
+    def generate_campaigns(self, prompts):
+        return [self.generate_campaign(prompt) for prompt in prompts]
+
+    async def agenerate_campaign(self, prompt):
+        return await sync_to_async(self.generate_campaign)(prompt)
+
+    def generate_flow(self, prompt):
+        raise NotImplementedError
+
+
+class GeminiProvider(AIProvider):
+    name = "gemini"
+
+    def __init__(self):
+        from .gemini import GeminiCampaignAgent
+
+        self.agent = GeminiCampaignAgent(gemini_api_key=settings.GEMINI_API_KEY)
+
+    @property
+    def pack_size(self):
+        return settings.AI_BATCH_PACK_SIZE
+
+    def generate_campaign(self, prompt):
+        return self.agent.generate_complete_campaign(prompt)
+
+    def generate_campaigns(self, prompts):
+        if len(prompts) == 1:
+            return [self.generate_campaign(prompts[0])]
+        try:
+            results = self.agent.generate_complete_campaigns(prompts)
+        except ValueError:
+            results = [None] * len(prompts)
+        # Prompts the packed answer left out are asked for on their own
+        return [
+            result or self.generate_campaign(prompt)
+            for prompt, result in zip(prompts, results)
+        ]
+
+    async def agenerate_campaign(self, prompt):
+        return await self.agent.agenerate_complete_campaign(prompt)
+
+    def generate_flow(self, prompt):
+        return self.agent.generate_flow(prompt)
+
+
+class RuleBasedProvider(AIProvider):
+    """Deterministic local generation, used when Gemini isn't configured"""
+
+    name = "rule_based"
+    note = "Using rule-based generation. Set GEMINI_API_KEY for AI-powered generation."
+    concurrent = False
+
+    def generate_campaign(self, prompt):
+        return {
+            "segment": analyze_prompt_for_segment(prompt),
+            "campaign": generate_campaign_from_prompt(prompt),
+        }
+
+    def generate_flow(self, prompt):
+        return generate_rule_based_flow(prompt)
+
+
+def get_provider(name=None):
+    """Return the shared instance of the named (or configured) provider"""
+    name = name or settings.AI_PROVIDER
+    if name == "auto":
+        name = "gemini" if settings.GEMINI_API_KEY else "rule_based"
+    try:
+        path = settings.AI_PROVIDERS[name]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown AI provider: {name}")
+
+    provider = _providers.get(path)
+    if provider is None:
+        with _lock:
+            provider = _providers.get(path)
+            if provider is None:
+                provider = _providers[path] = import_string(path)()
+    return provider
+
+
+def analyze_prompt_for_segment(prompt):
+    """Simple rule-based segment generation"""
+    conditions = []
+
+    if "high lifetime value" in prompt.lower() or "ltv" in prompt.lower():
+        # Get 75th percentile LTV
+        customers = Customer.objects.all()
+        if customers.exists():
+            ltv_values = [c.lifetime_value for c in customers]
+            percentile_75 = sorted(ltv_values)[int(len(ltv_values) * 0.75)]
+            conditions.append(
+                {
+                    "field": "lifetime_value",
+                    "operator": "greater_than",
+                    "value": float(percentile_75),
+                }
+            )
+
+    if "subscribed" in prompt.lower():
+        conditions.append(
+            {"field": "email_subscribed", "operator": "equals", "value": True}
+        )
+
+    if "haven't purchased" in prompt.lower() or "not ordered" in prompt.lower():
+        days = 60  # default
+        if "60 days" in prompt:
+            days = 60
+        elif "30 days" in prompt:
+            days = 30
+        elif "90 days" in prompt:
+            days = 90
+
+        conditions.append(
+            {
+                "field": "last_order_date",
+                "operator": "less_than",
+                "value": (timezone.now() - timedelta(days=days)).isoformat(),
+            }
+        )
+
+    return {
+        "name": "High LTV Inactive Customers",
+        "description": "Customers with high lifetime value who haven't purchased recently",
+        "conditions": conditions,
+    }
+
+
+def generate_campaign_from_prompt(prompt):
+    """Generate campaign elements"""
+    return {
+        "subject": "We Miss You! Special Offer Inside",
+        "send_time": "10:00",
+        "send_date": (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
+        "content_ideas": [
+            "Personalized product recommendations based on past purchases",
+            "Exclusive discount code for returning customers",
+            "Highlight new arrivals in their favorite categories",
+            "Social proof with customer reviews and testimonials",
+        ],
+    }
+
+
+def generate_rule_based_flow(prompt):
+    """Generate a simple rule-based flow for fallback"""
+    steps = [
+        {
+            "step_number": 1,
+            "email_subject": "We Miss You!",
+            "email_content_guidelines": "Send a friendly reminder about your brand with a special offer",
+            "delay_days": 0,
+        },
+        {
+            "step_number": 2,
+            "email_subject": "Exclusive Just for You",
+            "email_content_guidelines": "Provide a personalized discount code to encourage return purchase",
+            "delay_days": 5,
+        },
+        {
+            "step_number": 3,
+            "email_subject": "Last Chance!",
+            "email_content_guidelines": "Create urgency with a time-limited offer highlighting bestsellers",
+            "delay_days": 5,
+        },
+    ]
+
+    return {
+        "flow_name": "Win-Back Campaign",
+        "description": "Multi-step campaign to re-engage inactive customers",
+        "steps": steps,
+    }
@@ -0,0 +1,126 @@
+"""Async versions of the hot read endpoints, served under ``/api/async/``.
+
+Under ASGI a synchronous DRF view occupies a worker thread for the whole
+request. These plain Django async views await the ORM (``acount``,
+``aiterator``) and the Gemini calls instead, so one ASGI worker can keep
+many slow requests in flight. Payloads match the DRF endpoints they mirror.
+"""
+
+import json
+from datetime import datetime
+
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .ai import get_provider
+from .models import Customer, Segment
+from .renderers import FastJSONRenderer
+from .serializers import CampaignSerializer, CustomerSerializer
+from .views import CampaignViewSet, CustomerViewSet
+
+CHUNK_SIZE = 2000
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        FastJSONRenderer().render(data),
+        status=status,
+        content_type="application/json",
+    )
+
+
+def not_found():
+    return json_response({"detail": "No Segment matches the given query."}, 404)
+
+
+@require_GET
+async def health_check(request):
+    return json_response(
+        {
+            "status": "healthy",
+            "timestamp": datetime.now().isoformat(),
+            "service": "e-commerce-api",
+        }
+    )
+
+
+@require_GET
+async def customer_list(request):
+    """Same rows as the fast list path of ``CustomerViewSet``"""
+    fields = [
+        name
+        for name, field in CustomerSerializer().fields.items()
+        if not field.write_only
+    ]
+    view = CustomerViewSet()
+    rows = (
+        Customer.objects.annotate(**view.get_fast_list_annotations())
+        .values(*fields)
+        .aiterator(chunk_size=CHUNK_SIZE)
+    )
+    converters = view.fast_list_converters
+    result = []
+    async for row in rows:
+        for name, convert in converters.items():
+            row[name] = convert(row[name])
+        result.append(row)
+    return json_response(result)
+
+
+async def _get_segment(pk):
+    try:
+        return await Segment.objects.aget(pk=pk)
+    except Segment.DoesNotExist:
+        return None
+
+
+@require_GET
+async def segment_preview(request, pk):
+    segment = await _get_segment(pk)
+    if segment is None:
+        return not_found()
+    customers = segment.get_customers()
+    return json_response(
+        {
+            "count": await customers.acount(),
+            "customers": CustomerSerializer(
+                [customer async for customer in customers[:10]], many=True
+            ).data,
+        }
+    )
+
+
+@require_GET
+async def segment_count(request, pk):
+    segment = await _get_segment(pk)
+    if segment is None:
+        return not_found()
+    return json_response({"count": await segment.get_customers().acount()})
+
+
+@require_GET
+async def campaign_list(request):
+    # Iterating the queryset runs the select_related/prefetch queries up front,
+    # so serializing doesn't touch the database
+    campaigns = [campaign async for campaign in CampaignViewSet.queryset.all()]
+    return json_response(CampaignSerializer(campaigns, many=True).data)
+
+
+@csrf_exempt
+@require_POST
+async def generate_segment_and_campaign(request):
+    try:
+        prompt = json.loads(request.body or b"{}").get("prompt", "")
+    except (ValueError, AttributeError):
+        return json_response({"error": "Invalid JSON body"}, 400)
+
+    if not prompt:
+        return json_response({"error": "Prompt is required"}, 400)
+
+    provider = get_provider()
+    result = await provider.agenerate_campaign(prompt)
+    data = {"segment": result["segment"], "campaign": result["campaign"]}
+    if provider.note:
+        data["note"] = provider.note
+    return json_response(data)
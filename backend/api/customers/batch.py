@@ -0,0 +1,84 @@
+"""Generation for many prompts at once.
+
+Prompts are deduplicated (ignoring surrounding and repeated whitespace),
+packed ``provider.pack_size`` at a time into a single provider call, and
+the packs are fanned out over ``AI_BATCH_WORKERS`` threads. Results are
+yielded as each pack completes, so callers can stream them; a failed pack
+is retried prompt by prompt so one bad prompt doesn't fail its neighbours.
+"""
+
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections
+
+from .ai import get_provider
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split())
+
+
+def _generate(provider, prompts):
+    """Return ``(prompt, result, error)`` for each prompt of a pack"""
+    try:
+        return [
+            (prompt, result, None)
+            for prompt, result in zip(prompts, provider.generate_campaigns(prompts))
+        ]
+    except Exception as e:
+        if len(prompts) == 1:
+            logger.warning("Generation failed for prompt %r: %s", prompts[0], e)
+            return [(prompts[0], None, e)]
+        return [item for prompt in prompts for item in _generate(provider, [prompt])]
+
+
+def _generate_in_thread(provider, prompts):
+    try:
+        return _generate(provider, prompts)
+    finally:
+        # Rule-based generation may query the database from this thread
+        connections.close_all()
+
+
+def _iter_packs(provider, packs):
+    workers = min(settings.AI_BATCH_WORKERS, len(packs))
+    if not provider.concurrent or workers <= 1:
+        for pack in packs:
+            yield _generate(provider, pack)
+        return
+
+    pool = ThreadPoolExecutor(workers, thread_name_prefix="ai-batch")
+    try:
+        # Threads run in a copy of the request's context, so they see its tenant
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run, _generate_in_thread, provider, pack
+            )
+            for pack in packs
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Stop outstanding work if the client goes away mid-stream
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def generate_batch(prompts, provider=None):
+    """Yield ``(index, result, error)`` for every prompt as results complete"""
+    provider = provider or get_provider()
+    positions = {}
+    for index, prompt in enumerate(prompts):
+        positions.setdefault(normalize_prompt(prompt), []).append(index)
+
+    unique = list(positions)
+    size = max(1, provider.pack_size)
+    packs = [unique[i : i + size] for i in range(0, len(unique), size)]
+    for results in _iter_packs(provider, packs):
+        for prompt, result, error in results:
+            for index in positions[prompt]:
+                yield index, result, error
@@ -0,0 +1,166 @@
+"""Response caching for the read endpoints.
+
+Rendered JSON responses are stored in Django's cache framework, keyed by
+the full request path (including query params), the Accept header and the
+current "version" of every model the endpoint depends on. Saving or
+deleting one of those models bumps its version, so stale entries are
+simply never looked up again and expire on their own.
+
+Versions start with the time they were set. A replica may not have
+replayed a write yet for a while after it, so entries filled in that
+window read from the primary (see ``read_from_primary_if_changed``);
+otherwise replicas serve the fill like any other read.
+"""
+
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+
+from api.db_routing import read_from_primary
+
+from .tenants import current_tenant, tenant_database
+
+VERSION_KEY_PREFIX = "model-version"
+RESPONSE_KEY_PREFIX = "response"
+
+
+def _version_key(model):
+    # Each tenant's data, and so each tenant's cache entries, are separate
+    tenant = current_tenant()
+    prefix = f"{VERSION_KEY_PREFIX}:{tenant}" if tenant else VERSION_KEY_PREFIX
+    return f"{prefix}:{model._meta.label_lower}"
+
+
+def _field_version_key(model, field):
+    return f"{_version_key(model)}:{field}"
+
+
+def _new_version():
+    # Milliseconds, truncated so a version never looks set in the future
+    return f"{int(time.time() * 1000)}-{uuid.uuid4().hex}"
+
+
+def _get_versions(keys):
+    versions = cache.get_many(keys)
+    # A version that went missing may have been dropped by a recent write
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def get_model_versions(models):
+    return _get_versions([_version_key(model) for model in models])
+
+
+def get_field_versions(model, fields):
+    """Versions of individual columns, for caches that depend on only a few"""
+    return _get_versions([_field_version_key(model, field) for field in fields])
+
+
+def invalidate_model(model, fields=None):
+    """Invalidate every cached response that depends on ``model``
+
+    ``fields`` names the columns that changed; None (rows were added or
+    removed, or it isn't known what changed) invalidates every column.
+    """
+    if fields is None:
+        fields = [field.name for field in model._meta.concrete_fields]
+    # Keys are resolved now: the commit may run outside the writer's tenant
+    keys = [_field_version_key(model, field) for field in fields]
+    keys.append(_version_key(model))
+
+    def bump():
+        version = _new_version()
+        cache.set_many({key: version for key in keys}, timeout=None)
+
+    bump()
+    using = tenant_database()
+    if connections[using].in_atomic_block:
+        # Until the write commits, readers still see the old rows and may
+        # cache them under the version just set; bump it again once they
+        # can see the write
+        transaction.on_commit(bump, using=using)
+
+
+def read_from_primary_if_changed(versions):
+    """Read from the primary if any of ``versions`` was set too recently.
+
+    Call before filling a cache entry keyed by ``versions``: a replica
+    still missing the write that set them would have its stale data cached
+    under the new versions.
+    """
+    changed_after = (time.time() - settings.REPLICA_STICKY_SECONDS) * 1000
+    for version in versions:
+        try:
+            set_at = int(version.split("-", 1)[0])
+        except ValueError:
+            continue
+        if set_at > changed_after:
+            read_from_primary()
+            return
+
+
+class CachedResponseMixin:
+    """Serve GET requests from the response cache with strong ETags.
+
+    Viewsets list the models their payloads are built from in
+    ``cache_dependencies``; any write to one of them invalidates the cache.
+    """
+
+    cache_dependencies = ()
+    # Actions whose responses change without writes to the dependencies
+    uncached_actions = ()
+
+    def get_response_cache_key(self, request, versions):
+        raw = "|".join(
+            [request.get_full_path(), request.META.get("HTTP_ACCEPT", ""), *versions]
+        )
+        return f"{RESPONSE_KEY_PREFIX}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, "action_map", {}).get(request.method.lower())
+        if (
+            request.method not in ("GET", "HEAD")
+            or not self.cache_dependencies
+            or action in self.uncached_actions
+        ):
+            return super().dispatch(request, *args, **kwargs)
+
+        versions = get_model_versions(self.cache_dependencies)
+        key = self.get_response_cache_key(request, versions)
+        cached = cache.get(key)
+
+        if cached is None:
+            read_from_primary_if_changed(versions)
+            response = super().dispatch(request, *args, **kwargs)
+            # Only cache successful JSON payloads, not the browsable API
+            media_type = getattr(response, "accepted_media_type", None)
+            if response.status_code != 200 or media_type != "application/json":
+                return response
+            response.render()
+            cached = {
+                "content": response.content,
+                "content_type": response["Content-Type"],
+                "etag": quote_etag(hashlib.sha256(response.content).hexdigest()),
+            }
+            cache.set(key, cached, settings.RESPONSE_CACHE_TIMEOUT)
+        else:
+            response = HttpResponse(
+                cached["content"], content_type=cached["content_type"]
+            )
+
+        if cached["etag"] in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            response = HttpResponseNotModified()
+
+        response["ETag"] = cached["etag"]
+        patch_vary_headers(response, ["Accept"])
+        return response
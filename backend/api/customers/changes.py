@@ -0,0 +1,119 @@
+"""Change-data-capture feed for customers, segments and campaigns.
+
+Every write to a tracked model appends a ``ChangeLog`` row inside the
+writing transaction: single-object saves and deletes through signals,
+queryset/bulk paths by calling ``record_changes`` themselves. Consumers keep
+the id of the last change they processed and read the rows after it, each
+joined with the object's current column values (``None`` once deleted), so a
+sync only ever reads what changed. Customer data includes the profile fields,
+and profile writes are logged as updates of the customer.
+
+Outside SQLite a lower id can commit after a higher one, and a consumer that
+had moved past it would never see it. The feed therefore stops before the
+first change newer than ``COMMIT_LAG_SECONDS``: everything older has
+committed, so the cursor only moves over ids that can't still appear.
+"""
+
+from datetime import timedelta
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from api.db_routing import commit_lag
+
+from .models import PROFILE_FIELDS, Campaign, ChangeLog, Customer, Segment
+from .tenants import tenant_database
+
+TRACKED_MODELS = {"customer": Customer, "segment": Segment, "campaign": Campaign}
+MODEL_NAMES = {model: name for name, model in TRACKED_MODELS.items()}
+INSERT_BATCH_SIZE = 5000
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+
+def record_changes(model, object_ids, operation=ChangeLog.UPDATE):
+    """Append one change per id; use from paths that bypass model signals"""
+    using = tenant_database()
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    sql = "INSERT INTO {} ({}, {}, {}, {}) VALUES (%s, %s, %s, %s)".format(
+        quote_name(ChangeLog._meta.db_table),
+        *(
+            quote_name(ChangeLog._meta.get_field(name).column)
+            for name in ("model", "object_id", "operation", "changed_at")
+        ),
+    )
+    name = MODEL_NAMES[model]
+    changed_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = [(name, pk, operation, changed_at) for pk in object_ids]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for start in range(0, len(params), INSERT_BATCH_SIZE):
+            cursor.executemany(sql, params[start : start + INSERT_BATCH_SIZE])
+
+
+def _fields(model):
+    # Bitmaps and other binary caches aren't useful downstream
+    fields = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.get_internal_type() != "BinaryField"
+    ]
+    if model is Customer:
+        fields += [f"profile__{field}" for field in PROFILE_FIELDS]
+    return fields
+
+
+def _data(values):
+    """Current values keyed like the API, profile fields included"""
+    data = {}
+    for key, value in values.items():
+        if key.startswith("profile__"):
+            # Customers without a profile have blank details, as in the API
+            key, value = key[len("profile__") :], value or ""
+        data[key] = value
+    return data
+
+
+def changes_since(since=0, limit=DEFAULT_LIMIT, models=None):
+    """Changes with an id above ``since``, oldest first.
+
+    Current values are loaded with one query per model in the page.
+    """
+    changes = ChangeLog.objects.filter(pk__gt=since).order_by("pk")
+    lag = commit_lag(tenant_database())
+    if lag:
+        cutoff = timezone.now() - timedelta(seconds=lag)
+        recent = (
+            changes.filter(changed_at__gt=cutoff).values_list("pk", flat=True).first()
+        )
+        if recent is not None:
+            changes = changes.filter(pk__lt=recent)
+    if models:
+        changes = changes.filter(model__in=models)
+    rows = list(
+        changes.values_list("pk", "model", "object_id", "operation", "changed_at")[
+            :limit
+        ]
+    )
+
+    ids_by_model = {}
+    for _, name, object_id, operation, _ in rows:
+        if operation != ChangeLog.DELETE:
+            ids_by_model.setdefault(name, set()).add(object_id)
+    current = {}
+    for name, ids in ids_by_model.items():
+        model = TRACKED_MODELS[name]
+        for values in model.objects.filter(pk__in=ids).values(*_fields(model)):
+            current[name, values["id"]] = _data(values)
+
+    return [
+        {
+            "id": pk,
+            "model": name,
+            "object_id": object_id,
+            "operation": operation,
+            "changed_at": changed_at,
+            "data": current.get((name, object_id)),
+        }
+        for pk, name, object_id, operation, changed_at in rows
+    ]
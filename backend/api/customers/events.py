@@ -0,0 +1,238 @@
+"""In-process buffered writer for the event log.
+
+Events are appended to a per-process buffer and written in one transaction
+once ``EVENT_BUFFER_SIZE`` events are waiting or every
+``EVENT_FLUSH_INTERVAL`` seconds, whichever comes first, by a background
+flusher thread. Repeated opens/unsubscribes for the same message that are
+still in the buffer are coalesced into one row.
+"""
+
+import atexit
+import logging
+import threading
+from collections import defaultdict, namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Event
+from .tenants import tenant_database
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = {value for value, _ in Event.EVENT_TYPES}
+# Event types where a duplicate within the buffer carries no information
+COALESCED_TYPES = {Event.OPEN, Event.UNSUBSCRIBE}
+INSERT_BATCH_SIZE = 2000
+_revenue_field = Event._meta.get_field("revenue")
+# Also rejects NaN and infinities
+validate_revenue = DecimalValidator(
+    _revenue_field.max_digits, _revenue_field.decimal_places
+)
+
+# Buffered events are kept as plain tuples and inserted with executemany();
+# building model instances for bulk_create() costs more than the insert
+EventRow = namedtuple(
+    "EventRow",
+    [
+        "event_type",
+        "campaign_id",
+        "flow_step_id",
+        "customer_id",
+        "revenue",
+        "occurred_at",
+    ],
+)
+
+
+def _optional_id(data, field):
+    value = data.get(field)
+    if value in (None, ""):
+        return None
+    if isinstance(value, bool) or not str(value).isdigit():
+        raise ValueError(f"'{field}' must be an integer id")
+    return int(value)
+
+
+def parse_event(data):
+    """Build an EventRow from an ingestion payload, or raise ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("Each event must be an object")
+    event_type = data.get("event_type")
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"Unknown event_type {event_type!r}")
+    customer_id = _optional_id(data, "customer")
+    if customer_id is None:
+        raise ValueError("'customer' is required")
+
+    occurred_at = timezone.now()
+    if data.get("occurred_at"):
+        occurred_at = parse_datetime(str(data["occurred_at"]))
+        if occurred_at is None:
+            raise ValueError("'occurred_at' must be an ISO 8601 datetime")
+        if timezone.is_naive(occurred_at):
+            occurred_at = timezone.make_aware(occurred_at)
+
+    revenue = None
+    if data.get("revenue") not in (None, ""):
+        try:
+            revenue = Decimal(str(data["revenue"]))
+            validate_revenue(revenue)
+        except (InvalidOperation, ValidationError):
+            raise ValueError(
+                f"'revenue' must be a number with at most "
+                f"{_revenue_field.max_digits} digits and "
+                f"{_revenue_field.decimal_places} decimal places"
+            )
+
+    return EventRow(
+        event_type=event_type,
+        campaign_id=_optional_id(data, "campaign"),
+        flow_step_id=_optional_id(data, "flow_step"),
+        customer_id=customer_id,
+        revenue=revenue,
+        occurred_at=occurred_at,
+    )
+
+
+def insert_events(rows, using=None):
+    """Insert EventRows with one prepared statement per batch"""
+    using = using or tenant_database()
+    connection = connections[using]
+    fields = [Event._meta.get_field(name) for name in EventRow._fields]
+    revenue_field = Event._meta.get_field("revenue")
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        connection.ops.quote_name(Event._meta.db_table),
+        ", ".join(connection.ops.quote_name(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    params = [
+        (
+            row.event_type,
+            row.campaign_id,
+            row.flow_step_id,
+            row.customer_id,
+            connection.ops.adapt_decimalfield_value(
+                row.revenue, revenue_field.max_digits, revenue_field.decimal_places
+            ),
+            adapt_datetime(row.occurred_at),
+        )
+        for row in rows
+    ]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for start in range(0, len(params), INSERT_BATCH_SIZE):
+            cursor.executemany(sql, params[start : start + INSERT_BATCH_SIZE])
+
+
+class EventBuffer:
+    """Buffered events, kept apart per tenant database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = defaultdict(list)
+        self._coalesce_keys = set()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return sum(len(events) for events in self._events.values())
+
+    def add(self, events):
+        """Queue events for writing; returns how many were not coalesced"""
+        using = tenant_database()
+        added = 0
+        with self._lock:
+            pending = self._events[using]
+            for event in events:
+                if event.event_type in COALESCED_TYPES:
+                    key = (
+                        using,
+                        event.event_type,
+                        event.campaign_id,
+                        event.flow_step_id,
+                        event.customer_id,
+                    )
+                    if key in self._coalesce_keys:
+                        continue
+                    self._coalesce_keys.add(key)
+                pending.append(event)
+                added += 1
+            full = len(pending) >= settings.EVENT_BUFFER_SIZE
+
+        if settings.EVENT_FLUSH_INTERVAL <= 0:
+            # No background flusher: write inline once the buffer fills up
+            if full:
+                self.flush()
+        else:
+            self._ensure_flusher()
+            if full:
+                self._wakeup.set()
+        return added
+
+    def flush(self):
+        """Write every buffered event; returns the number written.
+
+        Events whose insert fails are put back in the buffer for the next
+        flush, and the error is raised.
+        """
+        with self._lock:
+            pending, self._events = self._events, defaultdict(list)
+            self._coalesce_keys = set()
+        written, error = 0, None
+        for using, events in pending.items():
+            try:
+                insert_events(events, using=using)
+                written += len(events)
+            except Exception as e:
+                self._requeue(using, events)
+                error = error or e
+        if error is not None:
+            raise error
+        return written
+
+    def _requeue(self, using, events):
+        with self._lock:
+            # Ahead of anything added meanwhile, which can then coalesce
+            # with them again
+            self._events[using][:0] = events
+            self._coalesce_keys.update(
+                (
+                    using,
+                    event.event_type,
+                    event.campaign_id,
+                    event.flow_step_id,
+                    event.customer_id,
+                )
+                for event in events
+                if event.event_type in COALESCED_TYPES
+            )
+
+    def _ensure_flusher(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name="event-flusher", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(settings.EVENT_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush buffered events")
+            finally:
+                close_old_connections()
+
+
+event_buffer = EventBuffer()
+atexit.register(event_buffer.flush)
@@ -0,0 +1,113 @@
+"""Deterministic A/B variant and holdout assignment.
+
+A customer's bucket (0-9999) within a campaign is a hash of the campaign id
+and customer id, computed in SQL so assignments can be used as queryset
+filters and counted in one aggregate without storing anything per customer.
+Because the bucket only depends on the two ids, recomputing the segment or
+re-enrolling never moves a customer to another variant.
+
+The first ``holdout_percent`` of the bucket space is the holdout group; the
+rest is divided between ``Campaign.variants`` in proportion to their
+weights.
+"""
+
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import Mod
+
+BUCKETS = 10000
+HOLDOUT = "holdout"
+# 2**26 - 5 is prime, so multiplying by a non-zero residue is a permutation.
+# SQLite evaluates MOD() with floating point fmod, which is exact only up to
+# 2**53; with every factor reduced below 2**26 no intermediate value gets
+# there, so SQLite, Postgres and Python all compute the same bucket
+PRIME = 67108859
+CUSTOMER_MULTIPLIER = 1103515245 % PRIME
+CAMPAIGN_MULTIPLIER = 48271
+
+
+def _campaign_keys(campaign_id):
+    offset = campaign_id % PRIME
+    multiplier = (campaign_id * CAMPAIGN_MULTIPLIER) % (PRIME - 1) + 1
+    return offset, multiplier
+
+
+def assignment_bucket(campaign_id, customer_id):
+    """Python twin of ``bucket_expression``"""
+    offset, multiplier = _campaign_keys(campaign_id)
+    mixed = (customer_id % PRIME * CUSTOMER_MULTIPLIER + offset) % PRIME
+    return (mixed * multiplier) % PRIME % BUCKETS
+
+
+def bucket_expression(campaign_id, customer_field="pk"):
+    """SQL expression for the bucket of ``customer_field`` in a campaign"""
+    offset, multiplier = _campaign_keys(campaign_id)
+    mixed = Mod(Mod(F(customer_field), PRIME) * CUSTOMER_MULTIPLIER + offset, PRIME)
+    return Mod(Mod(mixed * multiplier, PRIME), BUCKETS)
+
+
+def variant_ranges(campaign):
+    """``(name, first bucket, end bucket)`` for the holdout and each variant"""
+    holdout_end = campaign.holdout_percent * BUCKETS // 100
+    ranges = [(HOLDOUT, 0, holdout_end)] if holdout_end else []
+    variants = campaign.variants or [{"name": "control", "weight": 1}]
+    total = sum(variant["weight"] for variant in variants)
+
+    start, cumulative = holdout_end, 0
+    for variant in variants:
+        cumulative += variant["weight"]
+        end = holdout_end + (BUCKETS - holdout_end) * cumulative // total
+        ranges.append((variant["name"], start, end))
+        start = end
+    return ranges
+
+
+def _range_q(field, start, end):
+    return Q(**{f"{field}__gte": start, f"{field}__lt": end})
+
+
+def annotate_variant(queryset, campaign, customer_field="pk"):
+    """Annotate ``assignment_bucket`` and ``variant`` (name or "holdout")"""
+    queryset = queryset.annotate(
+        assignment_bucket=bucket_expression(campaign.pk, customer_field)
+    )
+    return queryset.annotate(
+        variant=Case(
+            *[
+                When(_range_q("assignment_bucket", start, end), then=Value(name))
+                for name, start, end in variant_ranges(campaign)
+            ]
+        )
+    )
+
+
+def filter_variant(queryset, campaign, variant, customer_field="pk"):
+    """Keep the rows assigned to ``variant`` (or the holdout group)"""
+    for name, start, end in variant_ranges(campaign):
+        if name == variant:
+            return queryset.alias(
+                assignment_bucket=bucket_expression(campaign.pk, customer_field)
+            ).filter(_range_q("assignment_bucket", start, end))
+    raise ValueError(f"Campaign {campaign.pk} has no variant {variant!r}")
+
+
+def exclude_holdout(queryset, campaign, customer_field="pk"):
+    holdout_end = campaign.holdout_percent * BUCKETS // 100
+    if not holdout_end:
+        return queryset
+    return queryset.alias(
+        assignment_bucket=bucket_expression(campaign.pk, customer_field)
+    ).filter(assignment_bucket__gte=holdout_end)
+
+
+def variant_counts(campaign, queryset, customer_field="pk"):
+    """Rows per variant (and holdout) of ``queryset`` in one aggregate query"""
+    ranges = variant_ranges(campaign)
+    counts = queryset.alias(
+        assignment_bucket=bucket_expression(campaign.pk, customer_field)
+    ).aggregate(
+        **{
+            f"v{i}": Count("pk", filter=_range_q("assignment_bucket", start, end))
+            for i, (_, start, end) in enumerate(ranges)
+        }
+    )
+    return {name: counts[f"v{i}"] for i, (name, _, _) in enumerate(ranges)}
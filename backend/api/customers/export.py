@@ -0,0 +1,77 @@
+"""Streaming CSV/NDJSON export of customer querysets."""
+
+import csv
+import io
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+
+EXPORT_FIELDS = [
+    "id",
+    "email",
+    "first_name",
+    "last_name",
+    "phone",
+    "city",
+    "state",
+    "country",
+    "total_orders",
+    "lifetime_value",
+    "avg_order_value",
+    "last_order_date",
+    "email_subscribed",
+    "acquisition_source",
+    "created_at",
+]
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _iter_row_batches(queryset, chunk_size):
+    """Yield lists of value tuples without loading the queryset in memory"""
+    # Phone numbers live in CustomerProfile
+    rows = (
+        queryset.annotate(phone=Coalesce("profile__phone", Value("")))
+        .order_by("pk")
+        .values_list(*EXPORT_FIELDS)
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for batch in _iter_row_batches(queryset, chunk_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def iter_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    encoder = DjangoJSONEncoder()
+    for batch in _iter_row_batches(queryset, chunk_size):
+        yield "".join(
+            encoder.encode(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in batch
+        ).encode()
+
+
+def gzip_stream(chunks):
+    """Compress a byte stream on the fly"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,49 @@
+"""Serializer-free list path for large read-only listings."""
+
+from rest_framework.response import Response
+
+
+class FastListMixin:
+    """Build ``list`` rows straight from ``QuerySet.values()``.
+
+    Enable per viewset with ``fast_list = True``. The row keys are the
+    serializer's field names, so the payload matches the regular list
+    response; fields that aren't model columns must be provided as database
+    annotations by ``get_fast_list_annotations``. ``fast_list_converters``
+    maps a field name to a callable applied to its value when the database
+    can't produce the final value itself. Many-to-many fields aren't
+    supported, since ``values()`` would return one row per relation.
+    """
+
+    fast_list = False
+    fast_list_converters = {}
+
+    def get_fast_list_annotations(self):
+        return {}
+
+    def get_fast_list_queryset(self, queryset):
+        fields = [
+            name
+            for name, field in self.get_serializer().fields.items()
+            if not field.write_only
+        ]
+        return queryset.annotate(**self.get_fast_list_annotations()).values(*fields)
+
+    def convert_fast_list_rows(self, rows):
+        converters = self.fast_list_converters
+        rows = list(rows)
+        if converters:
+            for row in rows:
+                for name, convert in converters.items():
+                    row[name] = convert(row[name])
+        return rows
+
+    def list(self, request, *args, **kwargs):
+        if not self.fast_list:
+            return super().list(request, *args, **kwargs)
+
+        rows = self.get_fast_list_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.convert_fast_list_rows(page))
+        return Response(self.convert_fast_list_rows(rows))
@@ -0,0 +1,157 @@
+"""Send-volume forecasts for capacity planning.
+
+A flow sends each step ``delay_days`` after the previous one (the first
+step that long after enrollment). Sends already made are read per step and
+day from the daily event rollups; each day's cohort then moves through the
+remaining steps by shifting the per-day counts by the step delays, in NumPy
+over the whole day range. Recipients who haven't had the first step yet
+are treated as enrolled today, and cohorts whose next step is overdue get
+it today. Daily volumes are spread over UTC hours like the recipients'
+send hours (see ``sendtime.send_schedule``). That per-hour recipient
+count is the only query that grows with the number of enrolled customers,
+and it is cached until enrollment or the recipients' send hours change.
+
+Inactive campaigns without enrollments are forecast as if their segment
+were enrolled today.
+"""
+
+import hashlib
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cache import get_field_versions, get_model_versions, read_from_primary_if_changed
+from .experiments import exclude_holdout
+from .models import Campaign, Customer, EventRollup, Segment
+from .segment_cache import result_cache_key, result_versions
+from .sendtime import HOURS, send_schedule
+
+HOURS_KEY_PREFIX = "forecast-hours"
+
+
+def forecast_start():
+    """Midnight UTC today, the first forecast day"""
+    return timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def recipient_hours(campaign):
+    """Recipients per UTC send hour, cached"""
+    versions = [
+        *get_model_versions([Campaign, Segment]),
+        *get_field_versions(Customer, ["id", "state", "best_send_hour"]),
+    ]
+    parts = [str(campaign.pk), *versions]
+    if campaign.is_active or campaign.customers.exists():
+        recipients = campaign.get_recipients()
+    else:
+        recipients = exclude_holdout(campaign.segment.get_customers(), campaign)
+        parts.append(result_cache_key(campaign.segment.conditions))
+        versions += result_versions(campaign.segment.conditions)
+    if None in parts:
+        return send_schedule(recipients)
+
+    key = f"{HOURS_KEY_PREFIX}:{hashlib.sha256('|'.join(parts).encode()).hexdigest()}"
+    schedule = cache.get(key)
+    if schedule is None:
+        read_from_primary_if_changed(versions)
+        schedule = send_schedule(recipients)
+        cache.set(key, schedule, settings.SEGMENT_RESULT_CACHE_TIMEOUT)
+    return schedule
+
+
+def forecast_campaign(campaign, days, start=None):
+    """Projected sends of ``campaign`` per day and UTC hour, (days, 24)"""
+    start = start or forecast_start()
+    hourly = np.zeros((days, HOURS), dtype=np.int64)
+    steps = list(
+        campaign.flow.steps.order_by("step_number").values_list("pk", "delay_days")
+    )
+    if not steps:
+        return hourly
+    schedule = np.array(recipient_hours(campaign), dtype=np.float64)
+    recipients = schedule.sum()
+    if not recipients:
+        return hourly
+
+    step_ids = [pk for pk, _ in steps]
+    delays = np.maximum([delay for _, delay in steps], 0)
+    # Cohorts that got their first step longer ago than this have finished
+    lookback = int(delays[1:].sum()) + 1
+    since = start - timedelta(days=lookback)
+    rollups = EventRollup.objects.filter(
+        period=EventRollup.DAY,
+        campaign_id=campaign.pk,
+        flow_step_id__in=step_ids,
+        bucket__lt=start,
+    )
+    index = {pk: i for i, pk in enumerate(step_ids)}
+    sent = np.zeros((len(steps), lookback))
+    for step_id, bucket, count in rollups.filter(bucket__gte=since).values_list(
+        "flow_step_id", "bucket", "sent"
+    ):
+        sent[index[step_id], (bucket - since).days] += count
+    first_sent = (
+        rollups.filter(flow_step_id=step_ids[0]).aggregate(total=Sum("sent"))["total"]
+        or 0
+    )
+
+    # counts[k, d]: step k sends on day d, where day ``lookback`` is today
+    total_days = lookback + days
+    counts = np.zeros((len(steps), total_days))
+    counts[0, :lookback] = sent[0]
+    if lookback + delays[0] < total_days:
+        counts[0, lookback + delays[0]] += max(recipients - first_sent, 0)
+    for k in range(1, len(steps)):
+        expected = np.zeros(total_days)
+        if delays[k] < total_days:
+            expected[delays[k] :] = counts[k - 1, : total_days - delays[k]]
+        counts[k, :lookback] = sent[k]
+        counts[k, lookback:] = expected[lookback:]
+        counts[k, lookback] += max(expected[:lookback].sum() - sent[k].sum(), 0)
+
+    daily = counts[:, lookback:].sum(axis=0)
+    return np.rint(np.outer(daily, schedule / recipients)).astype(np.int64)
+
+
+def total_forecast(campaigns, days, start=None):
+    """Sum of the campaigns' forecasts, (days, 24)"""
+    start = start or forecast_start()
+    hourly = np.zeros((days, HOURS), dtype=np.int64)
+    for campaign in campaigns:
+        hourly += forecast_campaign(campaign, days, start)
+    return hourly
+
+
+def summarize(hourly, start):
+    """JSON-friendly daily totals, hourly volumes and the peak hour"""
+    day, hour = np.unravel_index(hourly.argmax(), hourly.shape)
+    return {
+        "daily": hourly.sum(axis=1).tolist(),
+        "hourly": hourly.tolist(),
+        "peak": {
+            "date": (start + timedelta(days=int(day))).date().isoformat(),
+            "hour": int(hour),
+            "sends": int(hourly[day, hour]),
+        },
+    }
+
+
+def campaign_forecast(campaign, days):
+    """Forecast of ``campaign`` alone and together with the active campaigns"""
+    start = forecast_start()
+    own = forecast_campaign(campaign, days, start)
+    others = (
+        Campaign.objects.filter(is_active=True)
+        .exclude(pk=campaign.pk)
+        .select_related("segment", "flow")
+    )
+    return {
+        "start": start.date().isoformat(),
+        "days": days,
+        "campaign": summarize(own, start),
+        "combined": summarize(own + total_forecast(others, days, start), start),
+    }
@@ -0,0 +1,255 @@
+"""Gemini campaign agent.
+
+Importing this module loads ``google.generativeai``, which is slow, so the
+app only imports it from ``customers.ai.GeminiProvider`` on first use. It
+doesn't depend on Django and can be used from standalone scripts.
+"""
+
+import asyncio
+import os
+import json
+import re
+from typing import Dict, Any, List, Optional
+import google.generativeai as genai
+
+
+class GeminiCampaignAgent:
+    def __init__(self, gemini_api_key: Optional[str] = None):
+        self.gemini_api_key = gemini_api_key or os.getenv("GEMINI_API_KEY")
+        if not self.gemini_api_key:
+            raise ValueError(
+                "Gemini API key not provided. Set GEMINI_API_KEY environment variable."
+            )
+
+        genai.configure(api_key=self.gemini_api_key)
+        self.model = genai.GenerativeModel("gemini-1.5-pro")
+
+    def _segment_prompt(self, prompt: str) -> str:
+        # Create prompt for segment generation
+        return f"""
+Generate a detailed customer segment for a marketing campaign based on the following business objective:
+
+Business Objective: {prompt}
+
+Requirements:
+1. The segment should be specific and actionable
+2. Include clear criteria (demographic, behavioral, transactional)
+3. Use standard marketing metrics (LTV, purchase frequency, recency, etc.)
+4. Provide exact thresholds and conditions
+5. Make it implementable in a marketing automation system
+
+Output Format:
+Return only the segment definition in JSON format like:
+[
+  {{
+    "segment_name": "Descriptive name",
+    "criteria": [
+      {{"field": "metric_name", "operator": "condition", "value": "threshold"}},
+      {{"field": "metric_name", "operator": "condition", "value": "threshold"}}
+    ],
+    "description": "Brief explanation of the segment"
+  }}
+]
+"""
+
+    def generate_segment(self, prompt: str) -> Dict[str, Any]:
+        response = self.model.generate_content(self._segment_prompt(prompt))
+
+        # Extract JSON segment from response
+        return self._extract_json_from_response(response.text)
+
+    async def agenerate_segment(self, prompt: str) -> Dict[str, Any]:
+        response = await self.model.generate_content_async(self._segment_prompt(prompt))
+        return self._extract_json_from_response(response.text)
+
+    def _campaign_prompt(self, prompt: str) -> str:
+        # Create prompt for campaign elements generation
+        return f"""
+Generate complete campaign elements for an email marketing campaign based on the following business objective:
+
+Business Objective: {prompt}
+
+Requirements:
+1. Generate an engaging email subject line (max 50 characters)
+2. Suggest optimal send time (hour of day in 24-hour format)
+3. Suggest optimal send date (relative to today, e.g., "tomorrow", "next Monday")
+4. Provide 3 plain-text content ideas for the email body
+5. Include specific product recommendations or offers if applicable
+6. Make suggestions data-driven and relevant to the segment
+
+Output Format:
+Return only the campaign elements in JSON format like:
+[
+  {{
+    "subject": "Engaging subject line",
+    "send_time": "14:00",
+    "send_date": "tomorrow",
+    "content_ideas": [
+      "First content idea with specific details",
+      "Second content idea with specific details",
+      "Third content idea with specific details"
+    ],
+    "recommendations": "Any additional recommendations"
+  }}
+]
+"""
+
+    def generate_campaign_elements(self, prompt: str) -> Dict[str, Any]:
+        response = self.model.generate_content(self._campaign_prompt(prompt))
+
+        # Extract JSON campaign elements from response
+        return self._extract_json_from_response(response.text)
+
+    async def agenerate_campaign_elements(self, prompt: str) -> Dict[str, Any]:
+        response = await self.model.generate_content_async(
+            self._campaign_prompt(prompt)
+        )
+        return self._extract_json_from_response(response.text)
+
+    def generate_complete_campaign(self, prompt: str) -> Dict[str, Any]:
+        segment = self.generate_segment(prompt)
+        campaign_elements = self.generate_campaign_elements(prompt)
+
+        return {"segment": segment, "campaign": campaign_elements}
+
+    async def agenerate_complete_campaign(self, prompt: str) -> Dict[str, Any]:
+        # The two generations are independent, so they run concurrently
+        segment, campaign_elements = await asyncio.gather(
+            self.agenerate_segment(prompt), self.agenerate_campaign_elements(prompt)
+        )
+
+        return {"segment": segment, "campaign": campaign_elements}
+
+    def _batch_prompt(self, prompts: List[str]) -> str:
+        objectives = "\n".join(
+            f"{number}. {prompt}" for number, prompt in enumerate(prompts, 1)
+        )
+        return f"""
+Generate a customer segment and email campaign elements for each of the following numbered business objectives:
+
+{objectives}
+
+Requirements:
+1. Treat every objective independently
+2. Segments need clear criteria with exact thresholds, using standard marketing metrics
+3. Campaigns need a subject line (max 50 characters), send time, send date and 3 content ideas
+
+Output Format:
+Return only a JSON array with one object per objective, like:
+[
+  {{
+    "index": 1,
+    "segment": {{
+      "segment_name": "Descriptive name",
+      "criteria": [
+        {{"field": "metric_name", "operator": "condition", "value": "threshold"}}
+      ],
+      "description": "Brief explanation of the segment"
+    }},
+    "campaign": {{
+      "subject": "Engaging subject line",
+      "send_time": "14:00",
+      "send_date": "tomorrow",
+      "content_ideas": ["First idea", "Second idea", "Third idea"],
+      "recommendations": "Any additional recommendations"
+    }}
+  }}
+]
+"""
+
+    def generate_complete_campaigns(
+        self, prompts: List[str]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Answer several prompts with one model request.
+
+        Results are in prompt order; prompts the model left out are None.
+        """
+        response = self.model.generate_content(self._batch_prompt(prompts))
+        text = response.text
+        try:
+            items = json.loads(text[text.index("[") : text.rindex("]") + 1])
+        except ValueError as e:
+            raise ValueError(f"Error extracting JSON from response: {str(e)}")
+
+        results = [None] * len(prompts)
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict) or "segment" not in item:
+                continue
+            index = item.get("index")
+            if isinstance(index, int) and 1 <= index <= len(prompts):
+                results[index - 1] = {
+                    "segment": item["segment"],
+                    "campaign": item.get("campaign"),
+                }
+        return results
+
+    def _flow_prompt(self, prompt: str) -> str:
+        return f"""
+        Generate a multi-step email marketing flow based on the following business objective:
+
+        Business Objective: {prompt}
+
+        Requirements:
+        1. Create a sequence of 3-5 email steps with delays between them
+        2. Each step should have an email subject and content guidelines
+        3. Include specific delays (in days) between steps
+        4. Make each step progressively move the customer toward the goal
+        5. Each step should have a clear purpose (e.g., awareness, engagement, conversion, retention)
+
+        Output Format:
+        Return only the flow definition in JSON format like:
+        {{
+          "flow_name": "Descriptive name for the flow",
+          "description": "Brief description of the flow's purpose",
+          "steps": [
+            {{
+              "step_number": 1,
+              "email_subject": "Engaging subject line (max 50 chars)",
+              "email_content_guidelines": "Specific guidelines for email content",
+              "delay_days": 0  // Days to wait before this step (0 for first step)
+            }},
+            {{
+              "step_number": 2,
+              "email_subject": "Engaging subject line (max 50 chars)",
+              "email_content_guidelines": "Specific guidelines for email content",
+              "delay_days": 10  // Days to wait after step 1
+            }}
+          ]
+        }}
+        """
+
+    def generate_flow(self, prompt: str) -> Dict[str, Any]:
+        response = self.model.generate_content(self._flow_prompt(prompt))
+        return self._extract_json_from_response(response.text)
+
+    def _extract_json_from_response(self, response: str) -> Dict[str, Any]:
+        try:
+            json_pattern = r"\{.*?\}"
+            matches = re.findall(json_pattern, response, re.DOTALL)
+
+            if matches:
+                for match in matches:
+                    try:
+                        return json.loads(match)
+                    except json.JSONDecodeError:
+                        continue
+
+            raise ValueError(
+                f"Could not extract JSON from response: {response[:200]}..."
+            )
+
+        except Exception as e:
+            raise ValueError(f"Error extracting JSON from response: {str(e)}")
+
+
+# Example usage
+if __name__ == "__main__":
+    agent = GeminiCampaignAgent()
+
+    prompt = "I want to improve revenue from high lifetime value (total order value of a customer across their lifetime journey with a brand) customers that haven't purchased recently."
+
+    campaign = agent.generate_complete_campaign(prompt)
+
+    print("=== GENERATED CAMPAIGN ===")
+    print(f"Segment: {campaign['segment']}")
+    print(f"Campaign Elements: {campaign['campaign']}")
@@ -0,0 +1,352 @@
+"""Lookalike audiences over a memory-mapped customer feature matrix.
+
+Every customer is described by a normalized float32 vector (log-scaled
+LTV/orders/AOV, last order date, subscription flag and one-hot state and
+acquisition source). The matrix lives in ``LOOKALIKE_FEATURES_DIR`` as a
+``.npy`` file that is memory-mapped on use, and is refreshed incrementally
+from ``Customer.updated_at``: changed rows are patched in place and new
+customers appended. A lookalike search ranks non-members by their distance
+to the seed segment's centroid, scanning the matrix in batches.
+
+The matrix is built by ``build_lookalike_features``; searches only start a
+background refresh once it is older than ``LOOKALIKE_REFRESH_SECONDS``.
+Writers are serialized with a lock file and write new files under unique
+names before swapping them in, while readers hold a shared lock, so a
+reader never pairs the ids of one version with the matrix of another.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Customer
+from .tenants import current_tenant
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to locking within this process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FEATURE_COLUMNS = [
+    "pk",
+    "lifetime_value",
+    "total_orders",
+    "avg_order_value",
+    "last_order_date",
+    "email_subscribed",
+    "state",
+    "acquisition_source",
+]
+NUMERIC_FEATURES = ["log_ltv", "log_orders", "log_aov", "last_order_days"]
+MAX_CATEGORIES = 50
+SEARCH_BATCH_SIZE = 100000
+READ_CHUNK_SIZE = 50000
+
+_process_lock = threading.Lock()
+# Directories with a background refresh running in this process
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _top_values(field):
+    """Most common non-blank values of ``field``, used for one-hot columns"""
+    rows = (
+        Customer.objects.exclude(**{field: ""})
+        .values(field)
+        .annotate(customers=Count("pk"))
+        .order_by("-customers", field)
+    )
+    return [row[field] for row in rows[:MAX_CATEGORIES]]
+
+
+@contextmanager
+def _file_lock(path, shared=False):
+    """Hold an advisory lock on ``path``, shared or exclusive, across processes"""
+    if fcntl is None:
+        with _process_lock:
+            yield
+        return
+    with open(path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+
+
+class FeatureStore:
+    def __init__(self, directory=None):
+        if directory is None:
+            # Each tenant has its own matrix
+            directory = Path(settings.LOOKALIKE_FEATURES_DIR, current_tenant() or "")
+        self.directory = Path(directory)
+        self.meta_path = self.directory / "meta.json"
+        self.ids_path = self.directory / "ids.npy"
+        self.matrix_path = self.directory / "features.npy"
+        # Held by the one process rebuilding or refreshing the matrix
+        self.write_lock_path = self.directory / "write.lock"
+        # Held shared by readers and exclusively while files are swapped
+        self.swap_lock_path = self.directory / "swap.lock"
+
+    def exists(self):
+        return self.meta_path.exists()
+
+    def load_meta(self):
+        return json.loads(self.meta_path.read_text())
+
+    def load(self, mode="r"):
+        """Return (sorted ids, memory-mapped feature matrix, metadata)"""
+        with _file_lock(self.swap_lock_path, shared=True):
+            return (
+                np.load(self.ids_path),
+                np.load(self.matrix_path, mmap_mode=mode),
+                self.load_meta(),
+            )
+
+    def _temp_path(self, suffix):
+        """A new, uniquely named file next to the live ones"""
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=suffix, delete=False
+        ) as tmp:
+            return Path(tmp.name)
+
+    def _swap(self, files, meta):
+        """Move the written ``{live path: temp path}`` files and ``meta`` in"""
+        meta_tmp = self._temp_path(".json")
+        meta_tmp.write_text(json.dumps(meta))
+        files = {**files, self.meta_path: meta_tmp}
+        with _file_lock(self.swap_lock_path):
+            for path, tmp in files.items():
+                os.replace(tmp, path)
+
+    def _save(self, arrays, meta):
+        """Write ``{live path: array}`` to temp files and swap them in"""
+        files = {}
+        try:
+            for path, array in arrays.items():
+                files[path] = self._temp_path(".npy")
+                np.save(files[path], array)
+            self._swap(files, meta)
+        except BaseException:
+            for tmp in files.values():
+                tmp.unlink(missing_ok=True)
+            raise
+
+    def _raw_features(self, rows, meta):
+        """Unnormalized numeric columns plus one-hot categories for ``rows``"""
+        states = {value: i for i, value in enumerate(meta["states"])}
+        sources = {value: i for i, value in enumerate(meta["sources"])}
+        n = len(rows)
+        numeric = np.empty((n, len(NUMERIC_FEATURES)), dtype=np.float64)
+        flags = np.zeros((n, 1 + len(states) + len(sources)), dtype=np.float32)
+
+        for i, row in enumerate(rows):
+            _, ltv, orders, aov, last_order, subscribed, state, source = row
+            numeric[i] = (
+                ltv,
+                orders,
+                aov,
+                last_order.timestamp() / 86400 if last_order else np.nan,
+            )
+            flags[i, 0] = subscribed
+            if state in states:
+                flags[i, 1 + states[state]] = 1
+            if source in sources:
+                flags[i, 1 + len(states) + sources[source]] = 1
+
+        numeric[:, :3] = np.log1p(np.clip(numeric[:, :3], 0, None))
+        return numeric, flags
+
+    def _normalize(self, numeric, flags, meta):
+        numeric = numeric.copy()
+        # Customers who never ordered look like the oldest known order
+        missing = np.isnan(numeric[:, 3])
+        numeric[missing, 3] = meta["last_order_fill"]
+        numeric = (numeric - meta["mean"]) / meta["std"]
+        return np.hstack([numeric.astype(np.float32), flags])
+
+    def _read_rows(self, queryset):
+        rows = queryset.order_by("pk").values_list(*FEATURE_COLUMNS)
+        return list(rows.iterator(chunk_size=READ_CHUNK_SIZE))
+
+    def build(self):
+        """Rebuild the whole matrix; returns the number of customers"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with _file_lock(self.write_lock_path):
+            return self._build()
+
+    def _build(self):
+        started_at = timezone.now()
+        meta = {
+            "states": _top_values("state"),
+            "sources": _top_values("acquisition_source"),
+        }
+        rows = self._read_rows(Customer.objects.all())
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        numeric, flags = self._raw_features(rows, meta)
+
+        last_orders = numeric[:, 3][~np.isnan(numeric[:, 3])]
+        meta["last_order_fill"] = float(last_orders.min()) if last_orders.size else 0.0
+        filled = numeric.copy()
+        filled[np.isnan(filled[:, 3]), 3] = meta["last_order_fill"]
+        std = filled.std(axis=0) if len(rows) else np.ones(len(NUMERIC_FEATURES))
+        meta["mean"] = (filled.mean(axis=0) if len(rows) else std * 0).tolist()
+        meta["std"] = np.where(std > 0, std, 1).tolist()
+        meta["watermark"] = started_at.isoformat()
+
+        self._save(
+            {
+                self.ids_path: ids,
+                self.matrix_path: self._normalize(numeric, flags, meta),
+            },
+            meta,
+        )
+        return len(ids)
+
+    def refresh(self):
+        """Patch rows of customers updated since the last build or refresh.
+
+        Rows of new customers are appended. Falls back to a full rebuild
+        when the store is missing or a new customer's id sorts before the
+        last row, which appending can't keep in order. Returns the number
+        of rows written.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with _file_lock(self.write_lock_path):
+            if not self.exists():
+                return self._build()
+
+            ids, matrix, meta = self.load(mode="r+")
+            started_at = timezone.now()
+            changed = self._read_rows(
+                Customer.objects.filter(
+                    updated_at__gt=parse_datetime(meta["watermark"])
+                )
+            )
+            if not changed:
+                return 0
+
+            changed_ids = np.array([row[0] for row in changed], dtype=np.int64)
+            positions = np.searchsorted(ids, changed_ids)
+            known = positions < len(ids)
+            known[known] = ids[positions[known]] == changed_ids[known]
+            added = ~known
+            if added.any() and len(ids) and changed_ids[added][0] < ids[-1]:
+                return self._build()
+
+            numeric, flags = self._raw_features(changed, meta)
+            rows = self._normalize(numeric, flags, meta)
+            meta["watermark"] = started_at.isoformat()
+            with _file_lock(self.swap_lock_path):
+                matrix[positions[known]] = rows[known]
+                matrix.flush()
+            if added.any():
+                self._append(ids, matrix, changed_ids[added], rows[added], meta)
+            else:
+                self._swap({}, meta)
+            return len(changed)
+
+    def _append(self, ids, matrix, new_ids, rows, meta):
+        """Swap in a copy of the matrix with ``rows`` added at the end"""
+        ids_tmp = self._temp_path(".npy")
+        matrix_tmp = self._temp_path(".npy")
+        try:
+            np.save(ids_tmp, np.concatenate([ids, new_ids]))
+            grown = np.lib.format.open_memmap(
+                matrix_tmp,
+                mode="w+",
+                dtype=matrix.dtype,
+                shape=(len(ids) + len(new_ids), matrix.shape[1]),
+            )
+            for start in range(0, len(ids), SEARCH_BATCH_SIZE):
+                stop = min(start + SEARCH_BATCH_SIZE, len(ids))
+                grown[start:stop] = matrix[start:stop]
+            grown[len(ids) :] = rows
+            grown.flush()
+            del grown
+            self._swap({self.ids_path: ids_tmp, self.matrix_path: matrix_tmp}, meta)
+        except BaseException:
+            ids_tmp.unlink(missing_ok=True)
+            matrix_tmp.unlink(missing_ok=True)
+            raise
+
+    def refresh_in_background(self, max_age):
+        """Refresh in a thread if the matrix is older than ``max_age`` seconds.
+
+        Does nothing while a refresh of this store is already running in
+        this process. Returns the started thread, if any.
+        """
+        watermark = parse_datetime(self.load_meta()["watermark"])
+        if (timezone.now() - watermark).total_seconds() < max_age:
+            return None
+        key = str(self.directory)
+        with _refreshing_lock:
+            if key in _refreshing:
+                return None
+            _refreshing.add(key)
+        # In a copy of the caller's context, so it refreshes the same tenant
+        thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._refresh_in_thread,),
+            name="lookalike-refresh",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def _refresh_in_thread(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Failed to refresh lookalike features")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(str(self.directory))
+            connections.close_all()
+
+    def search(self, member_mask, size, batch_size=SEARCH_BATCH_SIZE):
+        """Ids of the ``size`` non-members closest to the members' centroid.
+
+        ``member_mask`` is a boolean array indexed by customer id. Returns a
+        list of ``(customer_id, distance)`` sorted by distance.
+        """
+        ids, matrix, _ = self.load()
+        in_range = ids < len(member_mask)
+        is_member = np.zeros(len(ids), dtype=bool)
+        is_member[in_range] = member_mask[ids[in_range]]
+        if not is_member.any():
+            return []
+
+        centroid = np.asarray(matrix[is_member].mean(axis=0), dtype=np.float32)
+        best_ids = np.zeros(0, dtype=np.int64)
+        best_distances = np.zeros(0, dtype=np.float32)
+        for start in range(0, len(ids), batch_size):
+            batch = np.asarray(matrix[start : start + batch_size])
+            distances = ((batch - centroid) ** 2).sum(axis=1)
+            distances[is_member[start : start + batch_size]] = np.inf
+            # Keep only the running top ``size`` candidates
+            candidate_ids = np.concatenate([best_ids, ids[start : start + batch_size]])
+            candidate_distances = np.concatenate([best_distances, distances])
+            if len(candidate_ids) > size:
+                keep = np.argpartition(candidate_distances, size - 1)[:size]
+                candidate_ids = candidate_ids[keep]
+                candidate_distances = candidate_distances[keep]
+            best_ids, best_distances = candidate_ids, candidate_distances
+
+        order = np.argsort(best_distances, kind="stable")
+        return [
+            (int(pk), float(np.sqrt(distance)))
+            for pk, distance in zip(best_ids[order], best_distances[order])
+            if np.isfinite(distance)
+        ]
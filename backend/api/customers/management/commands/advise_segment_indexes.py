@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, migrations, models
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from customers.models import Customer, Segment
+from customers.planner import recommend_indexes
+
+
+class Command(BaseCommand):
+    help = 'Recommend composite Customer indexes for the conditions segments use'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-segments',
+            type=int,
+            default=1,
+            help='Only recommend indexes that would serve this many segments',
+        )
+        parser.add_argument(
+            '--generate',
+            action='store_true',
+            help='Write a migration adding the recommended indexes',
+        )
+
+    def handle(self, *args, **options):
+        recommendations = [
+            (columns, names)
+            for columns, names in recommend_indexes(Segment.objects.all())
+            if len(names) >= options['min_segments']
+        ]
+        if not recommendations:
+            self.stdout.write('Existing indexes cover the indexable segment conditions')
+            return
+
+        columns_to_fields = {
+            field.column: field.name for field in Customer._meta.concrete_fields
+        }
+        indexes = []
+        for columns, names in recommendations:
+            index = models.Index(fields=[columns_to_fields[c] for c in columns])
+            index.set_name_with_model(Customer)
+            indexes.append(index)
+            examples = ', '.join(names[:3]) + (', ...' if len(names) > 3 else '')
+            self.stdout.write(
+                f"({', '.join(columns)}) serves {len(names)} segment(s): {examples}"
+            )
+
+        if options['generate']:
+            self.write_migration(indexes)
+        else:
+            self.stdout.write('Run with --generate to write a migration for these')
+
+    def write_migration(self, indexes):
+        loader = MigrationLoader(connection, ignore_no_migrations=True)
+        leaf = loader.graph.leaf_nodes('customers')[0]
+        number = int(leaf[1].split('_')[0]) + 1
+        migration = migrations.Migration(f'{number:04d}_segment_indexes', 'customers')
+        migration.dependencies = [leaf]
+        migration.operations = [
+            migrations.AddIndex(model_name='customer', index=index) for index in indexes
+        ]
+
+        writer = MigrationWriter(migration)
+        with open(writer.path, 'w') as f:
+            f.write(writer.as_string())
+        self.stdout.write(self.style.SUCCESS(f'Wrote {writer.path}'))
+        # Otherwise makemigrations would see the indexes as removed
+        self.stdout.write('Add the indexes to Customer.Meta.indexes as well:')
+        for index in indexes:
+            self.stdout.write(
+                f'    models.Index(fields={index.fields!r}, name={index.name!r}),'
+            )
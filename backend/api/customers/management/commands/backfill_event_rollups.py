@@ -0,0 +1,44 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from customers.models import Event
+from customers.rollups import rebuild_days
+
+
+class Command(BaseCommand):
+    help = 'Rebuild event rollups day by day, in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--workers', type=int, default=1)
+
+    def _day(self, value):
+        try:
+            day = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date: {value}')
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    def handle(self, *args, **options):
+        bounds = Event.objects.aggregate(first=Min('occurred_at'), last=Max('occurred_at'))
+        if bounds['first'] is None and not (options['start'] and options['end']):
+            self.stdout.write('No events to roll up')
+            return
+
+        start = self._day(options['start']) if options['start'] else None
+        end = self._day(options['end']) if options['end'] else None
+        start = start or self._day(bounds['first'].strftime('%Y-%m-%d'))
+        end = end or self._day(bounds['last'].strftime('%Y-%m-%d'))
+
+        days = []
+        while start <= end:
+            days.append(start)
+            start += timedelta(days=1)
+
+        rows = rebuild_days(days, workers=options['workers'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {len(days)} days ({rows} rollup rows)')
+        )
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from customers.ai import AIProvider
+from customers.models import Segment
+
+
+class SimulatedProvider(AIProvider):
+    """Stands in for Gemini with a fixed upstream latency"""
+
+    latency = 0.0
+
+    def generate_campaign(self, prompt):
+        time.sleep(self.latency)
+        return {'segment': {}, 'campaign': {}}
+
+    async def agenerate_campaign(self, prompt):
+        await asyncio.sleep(self.latency)
+        return {'segment': {}, 'campaign': {}}
+
+
+class Command(BaseCommand):
+    help = 'Compare request throughput of the sync (WSGI) and async (ASGI) endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--threads', type=int, default=8, help='WSGI worker threads'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=100, help='In-flight ASGI requests'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.5,
+            help='Simulated Gemini latency in seconds for the generate endpoints',
+        )
+
+    def run_sync(self, method, url, count, threads):
+        def request(_):
+            client = Client()
+            if method == 'post':
+                response = client.post(
+                    url, {'prompt': 'bench'}, content_type='application/json'
+                )
+            else:
+                response = client.get(url)
+            connection.close()
+            return response.status_code
+
+        with ThreadPoolExecutor(threads) as pool:
+            return list(pool.map(request, range(count)))
+
+    async def run_async(self, method, url, count, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request():
+            async with semaphore:
+                if method == 'post':
+                    response = await client.post(
+                        url, {'prompt': 'bench'}, content_type='application/json'
+                    )
+                else:
+                    response = await client.get(url)
+                return response.status_code
+
+        return await asyncio.gather(*(request() for _ in range(count)))
+
+    def timed(self, func, *args):
+        start = time.perf_counter()
+        statuses = func(*args)
+        elapsed = time.perf_counter() - start
+        if set(statuses) != {200}:
+            self.stderr.write(f'  unexpected statuses: {sorted(set(statuses))}')
+        return len(statuses) / elapsed
+
+    def handle(self, *args, **options):
+        segment = Segment.objects.order_by('pk').first()
+        endpoints = [
+            ('health', 'get', '/health/', '/api/async/health/'),
+            ('customer list', 'get', '/api/customers/', '/api/async/customers/'),
+            ('campaign list', 'get', '/api/campaigns/', '/api/async/campaigns/'),
+            ('generate', 'post', '/api/generate/', '/api/async/generate/'),
+        ]
+        if segment is not None:
+            endpoints.insert(
+                3,
+                (
+                    'segment preview',
+                    'get',
+                    f'/api/segments/{segment.pk}/preview/',
+                    f'/api/async/segments/{segment.pk}/preview/',
+                ),
+            )
+        connection.close()
+
+        count = options['requests']
+        SimulatedProvider.latency = options['latency']
+        self.stdout.write(
+            f"{count} requests per endpoint; WSGI: {options['threads']} threads, "
+            f"ASGI: {options['concurrency']} in flight on one event loop; "
+            f"generate latency {options['latency']}s"
+        )
+        # Response caching is left out so both sides do the same work
+        with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+            },
+            AI_PROVIDER='simulated',
+            AI_PROVIDERS={'simulated': f'{__name__}.SimulatedProvider'},
+        ):
+            for name, method, sync_url, async_url in endpoints:
+                wsgi = self.timed(
+                    self.run_sync, method, sync_url, count, options['threads']
+                )
+                asgi = self.timed(
+                    lambda: asyncio.run(
+                        self.run_async(method, async_url, count, options['concurrency'])
+                    )
+                )
+                self.stdout.write(
+                    f'{name:>16}: WSGI {wsgi:8.1f} req/s   ASGI {asgi:8.1f} req/s'
+                )
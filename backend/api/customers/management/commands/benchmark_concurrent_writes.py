@@ -0,0 +1,87 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.test.utils import override_settings
+from customers.models import Customer
+from customers.writer import write_queue
+
+
+def set_journal_mode(mode):
+    # Persistent and database-wide; needs no other open connections
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode={mode}')
+
+
+class Command(BaseCommand):
+    help = 'Measure customer write throughput from concurrent threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=100, help='Writes per thread')
+        parser.add_argument(
+            '--modes',
+            nargs='+',
+            default=['baseline', 'tuned', 'queued'],
+            choices=['baseline', 'tuned', 'queued'],
+        )
+
+    def write(self, prefix, i):
+        # Read-then-write, like a typical request handler
+        with transaction.atomic():
+            Customer.objects.filter(email=f'{prefix}{i - 1}@bench.invalid').exists()
+            Customer.objects.create(
+                email=f'{prefix}{i}@bench.invalid', first_name='Bench', last_name=str(i)
+            )
+
+    def worker(self, mode, prefix, writes, errors):
+        if mode == 'baseline':
+            # SQLite's defaults before the connection pragmas were added
+            connection.ensure_connection()
+            connection.transaction_mode = None
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous=FULL')
+        for i in range(writes):
+            try:
+                if mode == 'queued':
+                    write_queue.run(self.write, prefix, i)
+                else:
+                    self.write(prefix, i)
+            except OperationalError:
+                errors.append(i)
+        connection.close()
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['threads']} threads x {options['writes']} writes "
+            f"on {settings.DATABASES['default']['NAME']}"
+        )
+        for mode in options['modes']:
+            run_id = uuid.uuid4().hex[:8]
+            errors = []
+            threads = [
+                threading.Thread(
+                    target=self.worker,
+                    args=(mode, f'{run_id}-{n}-', options['writes'], errors),
+                )
+                for n in range(options['threads'])
+            ]
+            set_journal_mode('DELETE' if mode == 'baseline' else 'WAL')
+            with override_settings(WRITE_QUEUE_ENABLED=mode == 'queued'):
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+
+            written = Customer.objects.filter(email__startswith=run_id).count()
+            self.stdout.write(
+                f'{mode:>9}: {written / elapsed:8.0f} writes/s, '
+                f'{len(errors)} "database is locked" errors, {elapsed:.2f}s'
+            )
+            Customer.objects.filter(email__startswith=run_id).delete()
+        set_journal_mode(settings.SQLITE_PRAGMAS['journal_mode'])
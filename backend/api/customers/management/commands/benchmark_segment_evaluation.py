@@ -0,0 +1,38 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from customers.models import Segment
+from customers.parallel import evaluate_segment
+
+
+class Command(BaseCommand):
+    help = 'Time partitioned segment evaluation with an increasing number of workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('segment_id', type=int)
+        parser.add_argument(
+            '--workers',
+            nargs='+',
+            type=int,
+            default=sorted({1, 2, 4, os.cpu_count() or 1}),
+        )
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        segment = Segment.objects.get(pk=options['segment_id'])
+        self.stdout.write(f'Segment: {segment.name}')
+
+        baseline = None
+        for workers in options['workers']:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                ids = evaluate_segment(segment, collect_ids=True, workers=workers)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            baseline = baseline or best
+            self.stdout.write(
+                f'{workers:>3} workers: {best * 1000:9.1f} ms '
+                f'({len(ids)} customers, {baseline / best:.2f}x)'
+            )
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from customers.lookalike import FeatureStore
+
+
+class Command(BaseCommand):
+    help = 'Build or incrementally refresh the lookalike feature matrix'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true', help='Rebuild instead of refreshing'
+        )
+
+    def handle(self, *args, **options):
+        store = FeatureStore()
+        start = time.perf_counter()
+        rows = store.build() if options['full'] else store.refresh()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Wrote {rows} rows to {store.matrix_path} '
+                f'in {time.perf_counter() - start:.1f}s'
+            )
+        )
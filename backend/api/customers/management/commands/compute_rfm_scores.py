@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from customers.rfm import compute_rfm_scores, READ_CHUNK_SIZE, WRITE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Recompute RFM scores and segments for all customers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=WRITE_BATCH_SIZE)
+        parser.add_argument('--chunk-size', type=int, default=READ_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = compute_rfm_scores(
+            batch_size=options['batch_size'], chunk_size=options['chunk_size']
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Scored {count} customers in {time.perf_counter() - start:.1f}s'
+            )
+        )
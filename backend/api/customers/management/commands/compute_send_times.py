@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from customers.sendtime import compute_send_times
+
+
+class Command(BaseCommand):
+    help = 'Compute each customer\'s best send hour from engagement history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every customer instead of only those with new activity',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated = compute_send_times(full=options['full'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f'Updated send hours of {updated} customers in {elapsed:.1f}s')
+        )
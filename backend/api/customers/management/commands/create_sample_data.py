@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from customers.models import Customer
+from customers.models import Customer, CustomerProfile
 from datetime import datetime, timedelta
 from django.utils import timezone
 import random
@@ -73,11 +73,13 @@ class Command(BaseCommand):
         ]
 
         for customer_data in customers_data:
+            phone = customer_data.pop('phone')
             customer, created = Customer.objects.get_or_create(
                 email=customer_data['email'],
                 defaults=customer_data
             )
             if created:
+                CustomerProfile.objects.create(customer=customer, phone=phone)
                 self.stdout.write(f'Created customer: {customer.full_name}')
             else:
                 self.stdout.write(f'Customer already exists: {customer.full_name}')
@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from customers.forecast import forecast_start, total_forecast
+from customers.models import Campaign
+
+
+class Command(BaseCommand):
+    help = 'Forecast daily and peak-hour send volume of all active campaigns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.FORECAST_DAYS)
+        parser.add_argument(
+            '--campaign',
+            type=int,
+            action='append',
+            default=[],
+            help='Also include this (not yet active) campaign; repeatable',
+        )
+        parser.add_argument(
+            '--hourly', action='store_true', help='Print the sends of every hour'
+        )
+
+    def handle(self, *args, **options):
+        campaigns = Campaign.objects.select_related('segment', 'flow')
+        pending = list(campaigns.filter(pk__in=options['campaign']))
+        missing = set(options['campaign']) - {campaign.pk for campaign in pending}
+        if missing:
+            raise CommandError(f'Unknown campaigns: {sorted(missing)}')
+        selected = list(campaigns.filter(is_active=True)) + [
+            campaign for campaign in pending if not campaign.is_active
+        ]
+
+        start = forecast_start()
+        began = time.perf_counter()
+        hourly = total_forecast(selected, max(options['days'], 1), start)
+        elapsed = time.perf_counter() - began
+
+        self.stdout.write(f'{len(selected)} campaign(s), volumes per UTC day and hour')
+        for day, hours in enumerate(hourly):
+            date = (start.date() + timedelta(days=day)).isoformat()
+            peak = int(hours.argmax())
+            self.stdout.write(
+                f'{date}  {int(hours.sum()):>10,} sends   '
+                f'peak {peak:02d}:00 {int(hours[peak]):>9,}'
+            )
+            if options['hourly']:
+                self.stdout.write('    ' + ' '.join(str(int(n)) for n in hours))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Peak hour: {int(hourly.max()):,} sends '
+                f'({int(hourly.max()) / 3600:.1f}/s); forecast in {elapsed * 1000:.0f}ms'
+            )
+        )
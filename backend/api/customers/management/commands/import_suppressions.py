@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from customers.cache import invalidate_model
+from customers.models import Suppression
+
+
+class Command(BaseCommand):
+    help = 'Add email addresses (one per line) to the suppression list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--reason',
+            default=Suppression.MANUAL,
+            choices=[value for value, _ in Suppression.REASONS],
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path']) as f:
+                emails = {line.strip().lower() for line in f if '@' in line}
+        except OSError as e:
+            raise CommandError(str(e))
+
+        existing = Suppression.objects.count()
+        Suppression.objects.bulk_create(
+            [Suppression(email=email, reason=options['reason']) for email in emails],
+            batch_size=options['batch_size'],
+            ignore_conflicts=True,
+        )
+        # bulk_create doesn't send post_save
+        invalidate_model(Suppression)
+
+        added = Suppression.objects.count() - existing
+        self.stdout.write(self.style.SUCCESS(f'Added {added} suppressed addresses'))
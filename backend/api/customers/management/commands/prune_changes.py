@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from customers.models import ChangeLog
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed entries older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHANGE_LOG_RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Entries are appended in changed_at order, so everything below the
+        # first id to keep can be deleted by primary-key range
+        first_kept = (
+            ChangeLog.objects.filter(changed_at__gte=cutoff)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        expired = ChangeLog.objects.all()
+        if first_kept is not None:
+            expired = expired.filter(pk__lt=first_kept)
+        deleted = expired.delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} changes before {cutoff}'))
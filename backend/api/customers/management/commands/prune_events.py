@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from customers.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Delete events older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.EVENT_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = Event.objects.filter(occurred_at__lt=cutoff)
+
+        # Delete in short batches walking the occurred_at index, so the
+        # table isn't locked for the whole prune
+        deleted = 0
+        while True:
+            batch = list(
+                expired.order_by('occurred_at').values_list('pk', flat=True)[
+                    : options['batch_size']
+                ]
+            )
+            if not batch:
+                break
+            deleted += Event.objects.filter(pk__in=batch).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} events before {cutoff}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from customers.models import Segment
+
+
+class Command(BaseCommand):
+    help = 'Recompute the membership bitmap of every segment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('segment_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        segments = Segment.objects.all()
+        if options['segment_ids']:
+            segments = segments.filter(pk__in=options['segment_ids'])
+
+        for segment in segments:
+            bitmap = segment.refresh_bitmap()
+            self.stdout.write(f'{segment.name}: {bitmap.count()} customers')
+
+        self.stdout.write(self.style.SUCCESS('Segment bitmaps refreshed'))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from customers.changes import DEFAULT_LIMIT, TRACKED_MODELS, changes_since
+
+
+class Command(BaseCommand):
+    help = 'Write customer/segment/campaign changes as NDJSON to stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', type=int, default=0, help='Last change id already processed'
+        )
+        parser.add_argument('--models', nargs='*', choices=list(TRACKED_MODELS))
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_LIMIT)
+        parser.add_argument(
+            '--follow',
+            action='store_true',
+            help='Keep polling for new changes instead of exiting when caught up',
+        )
+        parser.add_argument('--interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        encoder = DjangoJSONEncoder()
+        since = options['since']
+        while True:
+            changes = changes_since(since, options['batch_size'], options['models'])
+            if changes:
+                self.stdout.write(
+                    ''.join(encoder.encode(change) + '\n' for change in changes),
+                    ending='',
+                )
+                self.stdout.flush()
+                since = changes[-1]['id']
+            if len(changes) < options['batch_size']:
+                if not options['follow']:
+                    break
+                time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary into the SQLite replica files (local testing)'
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        replicas = [settings.DATABASES[alias] for alias in settings.DATABASE_REPLICAS]
+        if not replicas:
+            raise CommandError('No DATABASE_REPLICA_URLS configured')
+        if any('sqlite' not in db['ENGINE'] for db in [primary, *replicas]):
+            raise CommandError('Only SQLite primaries and replicas can be synced')
+
+        connections.close_all()
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias, replica in zip(settings.DATABASE_REPLICAS, replicas):
+                target = sqlite3.connect(replica['NAME'])
+                try:
+                    # Online backup: consistent even while the primary is in use
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f'Synced {alias} ({replica["NAME"]})'))
+        finally:
+            source.close()
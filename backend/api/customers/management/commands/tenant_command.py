@@ -0,0 +1,31 @@
+import argparse
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from customers.tenants import use_tenant
+
+
+class Command(BaseCommand):
+    help = 'Run a management command against one tenant\'s database (or "all")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tenant', help='Tenant name, or "all" for every tenant')
+        parser.add_argument('command', help='Command to run')
+        parser.add_argument('command_args', nargs=argparse.REMAINDER)
+
+    def handle(self, *args, **options):
+        tenant = options['tenant']
+        if tenant == 'all':
+            tenants = sorted(settings.TENANTS)
+        elif tenant in settings.TENANTS:
+            tenants = [tenant]
+        else:
+            raise CommandError(f'Unknown tenant: {tenant}')
+
+        for name in tenants:
+            self.stdout.write(f'== {name} ==')
+            with use_tenant(name):
+                call_command(
+                    options['command'], *options['command_args'], stdout=self.stdout
+                )
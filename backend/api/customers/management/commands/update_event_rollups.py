@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from customers.rollups import update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold new events into the hourly and daily rollups'
+
+    def handle(self, *args, **options):
+        processed = update_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {processed} new events'))
@@ -0,0 +1,35 @@
+# Generated manually on 2026-10-19
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def populate_audience_count(apps, schema_editor):
+    Flow = apps.get_model("customers", "Flow")
+    Customer = apps.get_model("customers", "Customer")
+    Enrollment = apps.get_model("customers", "Campaign").customers.through
+    db_alias = schema_editor.connection.alias
+
+    for flow in Flow.objects.using(db_alias):
+        enrollments = Enrollment.objects.using(db_alias).filter(
+            customer_id=OuterRef("pk"), campaign__flow_id=flow.pk
+        )
+        flow.audience_count = (
+            Customer.objects.using(db_alias).filter(Exists(enrollments)).count()
+        )
+        flow.save(using=db_alias, update_fields=["audience_count"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("customers", "0002_campaign_customers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="flow",
+            name="audience_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_audience_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0003_flow_audience_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="segment",
+            name="bitmap_computed_at",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="segment",
+            name="membership_bitmap",
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0004_segment_membership_bitmap"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="rfm_frequency",
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="rfm_monetary",
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="rfm_recency",
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="rfm_score",
+            field=models.PositiveSmallIntegerField(
+                db_index=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="rfm_scored_at",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="rfm_segment",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=30
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0005_customer_rfm_scores"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="customer",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0008_event_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Suppression",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("email", models.EmailField(max_length=254, unique=True)),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("unsubscribe", "Unsubscribe"),
+                            ("bounce", "Bounce"),
+                            ("complaint", "Complaint"),
+                            ("manual", "Manual"),
+                        ],
+                        default="manual",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["customer", "event_type", "occurred_at"],
+                name="customers_e_custome_b751d9_idx",
+            ),
+        ),
+    ]
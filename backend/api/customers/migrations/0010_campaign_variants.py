@@ -0,0 +1,26 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:49
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0009_suppression_frequency_cap"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="campaign",
+            name="holdout_percent",
+            field=models.PositiveSmallIntegerField(
+                default=0, validators=[django.core.validators.MaxValueValidator(100)]
+            ),
+        ),
+        migrations.AddField(
+            model_name="campaign",
+            name="variants",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0010_campaign_variants"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="best_send_hour",
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.2.10 on 2026-10-19 13:27
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import Max
+
+PROFILE_FIELDS = ("phone", "address_line1", "address_line2", "zip_code")
+BATCH_SIZE = 20000
+
+
+def _pk_ranges(model, using):
+    high = model.objects.using(using).aggregate(Max("pk"))["pk__max"] or 0
+    for low in range(0, high, BATCH_SIZE):
+        yield low, low + BATCH_SIZE
+
+
+def copy_profiles(apps, schema_editor):
+    """Copy non-blank details to profiles, one short transaction per batch"""
+    Customer = apps.get_model("customers", "Customer")
+    CustomerProfile = apps.get_model("customers", "CustomerProfile")
+    using = schema_editor.connection.alias
+    customers = Customer.objects.using(using).exclude(
+        phone="", address_line1="", address_line2="", zip_code=""
+    )
+    for low, high in _pk_ranges(Customer, using):
+        rows = customers.filter(pk__gt=low, pk__lte=high).values_list(
+            "pk", *PROFILE_FIELDS
+        )
+        with transaction.atomic(using=using):
+            CustomerProfile.objects.using(using).bulk_create(
+                [
+                    CustomerProfile(customer_id=pk, **dict(zip(PROFILE_FIELDS, values)))
+                    for pk, *values in rows
+                ],
+                ignore_conflicts=True,
+            )
+
+
+def restore_profiles(apps, schema_editor):
+    Customer = apps.get_model("customers", "Customer")
+    CustomerProfile = apps.get_model("customers", "CustomerProfile")
+    using = schema_editor.connection.alias
+    for low, high in _pk_ranges(CustomerProfile, using):
+        rows = (
+            CustomerProfile.objects.using(using)
+            .filter(pk__gt=low, pk__lte=high)
+            .values_list("pk", *PROFILE_FIELDS)
+        )
+        with transaction.atomic(using=using):
+            Customer.objects.using(using).bulk_update(
+                [
+                    Customer(pk=pk, **dict(zip(PROFILE_FIELDS, values)))
+                    for pk, *values in rows
+                ],
+                PROFILE_FIELDS,
+            )
+
+
+class Migration(migrations.Migration):
+    # The copy commits batch by batch, so a live table is never locked for
+    # the whole of it
+    atomic = False
+
+    dependencies = [
+        ("customers", "0012_change_log"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CustomerProfile",
+            fields=[
+                (
+                    "customer",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="profile",
+                        serialize=False,
+                        to="customers.customer",
+                    ),
+                ),
+                ("phone", models.CharField(blank=True, max_length=20)),
+                ("address_line1", models.CharField(blank=True, max_length=200)),
+                ("address_line2", models.CharField(blank=True, max_length=200)),
+                ("zip_code", models.CharField(blank=True, max_length=20)),
+            ],
+        ),
+        migrations.RunPython(copy_profiles, restore_profiles),
+        migrations.RemoveField(
+            model_name="customer",
+            name="address_line1",
+        ),
+        migrations.RemoveField(
+            model_name="customer",
+            name="address_line2",
+        ),
+        migrations.RemoveField(
+            model_name="customer",
+            name="phone",
+        ),
+        migrations.RemoveField(
+            model_name="customer",
+            name="zip_code",
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["lifetime_value", "id"], name="customer_ltv_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["total_orders", "id"], name="customer_orders_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["last_order_date", "id"], name="customer_last_order_id_idx"
+            ),
+        ),
+    ]
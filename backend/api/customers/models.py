@@ -1,24 +1,26 @@
 from django.db import models
 
-from django.db import models
+from django.conf import settings
+from django.core.validators import MaxValueValidator
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import m2m_changed
 from django.utils import timezone
 from datetime import datetime, timedelta
 import json
 
+from .bitmaps import SegmentBitmap
+
 
 class Customer(models.Model):
     # Basic Info
     email = models.EmailField(unique=True)
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
-    phone = models.CharField(max_length=20, blank=True)
 
-    # Address
-    address_line1 = models.CharField(max_length=200, blank=True)
-    address_line2 = models.CharField(max_length=200, blank=True)
+    # Location (street address and phone are in CustomerProfile)
     city = models.CharField(max_length=100, blank=True)
     state = models.CharField(max_length=50, blank=True)
-    zip_code = models.CharField(max_length=20, blank=True)
     country = models.CharField(max_length=50, default="US")
 
     # E-commerce metrics
@@ -31,9 +33,35 @@ class Customer(models.Model):
     email_subscribed = models.BooleanField(default=True)
     acquisition_source = models.CharField(max_length=100, blank=True)
 
+    # RFM scores (1-5 each, 5 is best), maintained by compute_rfm_scores
+    rfm_recency = models.PositiveSmallIntegerField(null=True, editable=False)
+    rfm_frequency = models.PositiveSmallIntegerField(null=True, editable=False)
+    rfm_monetary = models.PositiveSmallIntegerField(null=True, editable=False)
+    rfm_score = models.PositiveSmallIntegerField(
+        null=True, editable=False, db_index=True
+    )
+    rfm_segment = models.CharField(
+        max_length=30, blank=True, editable=False, db_index=True
+    )
+    rfm_scored_at = models.DateTimeField(null=True, editable=False)
+    # Local hour (0-23) the customer engages most, maintained by
+    # compute_send_times; null means DEFAULT_SEND_HOUR
+    best_send_hour = models.PositiveSmallIntegerField(null=True, editable=False)
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # Segment conditions on the order metrics are range filters; with the
+        # id in the index, counts and id lists never read the table
+        indexes = [
+            models.Index(fields=["lifetime_value", "id"], name="customer_ltv_id_idx"),
+            models.Index(fields=["total_orders", "id"], name="customer_orders_id_idx"),
+            models.Index(
+                fields=["last_order_date", "id"], name="customer_last_order_id_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.email})"
@@ -49,16 +77,85 @@ class Customer(models.Model):
         return (timezone.now() - self.last_order_date).days
 
 
+# CustomerProfile columns, exposed (and segmentable) as customer fields
+PROFILE_FIELDS = ("phone", "address_line1", "address_line2", "zip_code")
+
+
+class CustomerProfile(models.Model):
+    """Contact details and street address of a customer.
+
+    Kept out of ``Customer`` so that segment scans, which read every
+    customer row, don't page these wide, rarely read columns through the
+    cache. Only customers with details have a row; single-customer
+    endpoints join it in.
+    """
+
+    customer = models.OneToOneField(
+        Customer, on_delete=models.CASCADE, primary_key=True, related_name="profile"
+    )
+    phone = models.CharField(max_length=20, blank=True)
+    address_line1 = models.CharField(max_length=200, blank=True)
+    address_line2 = models.CharField(max_length=200, blank=True)
+    zip_code = models.CharField(max_length=20, blank=True)
+
+    def __str__(self):
+        return f"Profile of {self.customer_id}"
+
+
+def relative_date_now():
+    """``now`` for relative-date conditions such as ``in_last_days``.
+
+    Floored to ``SEGMENT_DATE_BUCKET_SECONDS`` so that evaluations within
+    one bucket run identical queries and their results can be cached.
+    """
+    now = timezone.now()
+    bucket = settings.SEGMENT_DATE_BUCKET_SECONDS
+    if bucket > 0:
+        now = now.replace(microsecond=0) - timedelta(
+            seconds=int(now.timestamp()) % bucket
+        )
+    return now
+
+
 class Segment(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     conditions = models.JSONField()  # Store segment conditions as JSON
+    # Compressed membership bitmap (see bitmaps.py), refreshed on demand
+    membership_bitmap = models.BinaryField(null=True, editable=False)
+    bitmap_computed_at = models.DateTimeField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def get_bitmap(self):
+        """Membership bitmap, recomputed when missing or older than the max age"""
+        computed_at = self.bitmap_computed_at
+        if (
+            self.membership_bitmap is None
+            or computed_at is None
+            or computed_at < self.updated_at
+            or timezone.now() - computed_at
+            > timedelta(seconds=settings.SEGMENT_BITMAP_MAX_AGE)
+        ):
+            return self.refresh_bitmap()
+        return SegmentBitmap.from_bytes(self.membership_bitmap)
+
+    def refresh_bitmap(self):
+        from .parallel import evaluate_segment
+
+        bitmap = SegmentBitmap.from_ids(evaluate_segment(self, collect_ids=True))
+        self.membership_bitmap = bitmap.to_bytes()
+        self.bitmap_computed_at = timezone.now()
+        # update() so that refreshing doesn't count as editing the segment
+        Segment.objects.filter(pk=self.pk).update(
+            membership_bitmap=self.membership_bitmap,
+            bitmap_computed_at=self.bitmap_computed_at,
+        )
+        return bitmap
+
     def get_customers(self):
         queryset = Customer.objects.all()
 
@@ -66,34 +163,44 @@ class Segment(models.Model):
             field = condition["field"]
             operator = condition["operator"]
             value = condition["value"]
+            lookup = f"profile__{field}" if field in PROFILE_FIELDS else field
 
             # Smart handling for email domains
             if field == "email" and operator == "equals":
                 # If the value doesn't contain @, treat it as a domain and use contains
                 if "@" not in str(value):
-                    queryset = queryset.filter(**{f"{field}__icontains": value})
+                    queryset = queryset.filter(**{f"{lookup}__icontains": value})
                 else:
                     converted_value = self._convert_value(field, value)
-                    queryset = queryset.filter(**{field: converted_value})
+                    queryset = queryset.filter(**{lookup: converted_value})
             else:
                 converted_value = self._convert_value(field, value)
 
                 if operator == "equals":
-                    queryset = queryset.filter(**{field: converted_value})
+                    queryset = queryset.filter(**{lookup: converted_value})
                 elif operator == "contains":
-                    queryset = queryset.filter(**{f"{field}__icontains": value})
+                    queryset = queryset.filter(**{f"{lookup}__icontains": value})
                 elif operator == "greater_than":
-                    queryset = queryset.filter(**{f"{field}__gt": converted_value})
+                    queryset = queryset.filter(**{f"{lookup}__gt": converted_value})
                 elif operator == "less_than":
-                    queryset = queryset.filter(**{f"{field}__lt": converted_value})
+                    queryset = queryset.filter(**{f"{lookup}__lt": converted_value})
                 elif operator == "in_last_days":
-                    days_ago = timezone.now() - timedelta(days=int(value))
-                    queryset = queryset.filter(**{f"{field}__gte": days_ago})
+                    days_ago = relative_date_now() - timedelta(days=int(value))
+                    queryset = queryset.filter(**{f"{lookup}__gte": days_ago})
 
         return queryset
 
     def _convert_value(self, field, value):
-        numeric_fields = ["lifetime_value", "avg_order_value", "total_orders"]
+        numeric_fields = [
+            "lifetime_value",
+            "avg_order_value",
+            "total_orders",
+            "rfm_recency",
+            "rfm_frequency",
+            "rfm_monetary",
+            "rfm_score",
+            "best_send_hour",
+        ]
         boolean_fields = ["email_subscribed"]
 
         if field in numeric_fields:
@@ -116,12 +223,27 @@ class Flow(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=False)
+    # Distinct customers enrolled through this flow's campaigns, kept up to
+    # date on enrollment so previews don't have to count the through table
+    audience_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def get_customers(self):
+        """Customers enrolled in any campaign that uses this flow"""
+        enrollments = Campaign.customers.through.objects.filter(
+            customer_id=OuterRef("pk"), campaign__flow_id=self.pk
+        )
+        return Customer.objects.filter(Exists(enrollments))
+
+    def refresh_audience_count(self):
+        self.audience_count = self.get_customers().count()
+        Flow.objects.filter(pk=self.pk).update(audience_count=self.audience_count)
+        return self.audience_count
+
 
 class FlowStep(models.Model):
     flow = models.ForeignKey(Flow, on_delete=models.CASCADE, related_name="steps")
@@ -144,17 +266,207 @@ class Campaign(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=False)
     customers = models.ManyToManyField(Customer, related_name="campaigns", blank=True)
+    # A/B split, see experiments.py: [{"name": "A", "weight": 1}, ...]
+    variants = models.JSONField(default=list, blank=True)
+    holdout_percent = models.PositiveSmallIntegerField(
+        default=0, validators=[MaxValueValidator(100)]
+    )
 
     def __str__(self):
         return self.name
 
+    def get_recipients(self, variant=None):
+        """Enrolled customers to send to, minus the holdout group"""
+        from .experiments import exclude_holdout, filter_variant
+
+        customers = self.customers.all()
+        if variant is not None:
+            return filter_variant(customers, self, variant)
+        return exclude_holdout(customers, self)
+
     def enroll_customers_from_segment(self):
         if self.segment:
-            segment_customers = self.segment.get_customers()
-            self.customers.add(*segment_customers)
-            return segment_customers.count()
+            from .parallel import evaluate_segment
+
+            customer_ids = evaluate_segment(self.segment, collect_ids=True)
+            self.enroll_customer_ids(customer_ids.tolist())
+            return len(customer_ids)
         return 0
 
+    def enroll_customer_ids(self, customer_ids, batch_size=5000):
+        """Bulk-enroll customers by id, skipping unknown and enrolled ones"""
+        through = Campaign.customers.through
+        customer_ids = list(customer_ids)
+        added = set()
+        with transaction.atomic(using=self._state.db):
+            for start in range(0, len(customer_ids), batch_size):
+                batch = customer_ids[start : start + batch_size]
+                new_ids = set(
+                    Customer.objects.filter(pk__in=batch)
+                    .exclude(campaigns=self)
+                    .values_list("pk", flat=True)
+                )
+                through.objects.bulk_create(
+                    [through(campaign_id=self.pk, customer_id=pk) for pk in new_ids],
+                    ignore_conflicts=True,
+                )
+                added |= new_ids
+        self._prefetched_objects_cache = {}
+        if added:
+            # Let the enrollment/cache signal handlers know, as add() would
+            m2m_changed.send(
+                sender=through,
+                instance=self,
+                action="post_add",
+                reverse=False,
+                model=Customer,
+                pk_set=added,
+                using=self._state.db,
+            )
+        return len(added)
+
     @property
     def customer_count(self):
+        # Use the count annotated by the viewset queryset when available
+        if hasattr(self, "num_customers"):
+            return self.num_customers
         return self.customers.count()
+
+
+class Event(models.Model):
+    """Append-only log of sends and engagement.
+
+    Foreign keys are unconstrained and never cascade so that writes stay
+    cheap and deleting a campaign doesn't have to scan the event table;
+    retention pruning deletes by ``occurred_at`` instead.
+    """
+
+    SEND = "send"
+    OPEN = "open"
+    CLICK = "click"
+    CONVERSION = "conversion"
+    UNSUBSCRIBE = "unsubscribe"
+    EVENT_TYPES = [
+        (SEND, "Send"),
+        (OPEN, "Open"),
+        (CLICK, "Click"),
+        (CONVERSION, "Conversion"),
+        (UNSUBSCRIBE, "Unsubscribe"),
+    ]
+
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    campaign = models.ForeignKey(
+        Campaign,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    flow_step = models.ForeignKey(
+        FlowStep,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    revenue = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True
+    )
+    occurred_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        # Frequency capping counts each customer's recent sends
+        indexes = [models.Index(fields=["customer", "event_type", "occurred_at"])]
+
+    def __str__(self):
+        return f"{self.event_type} ({self.customer_id}) at {self.occurred_at}"
+
+
+class EventRollup(models.Model):
+    """Funnel counters per campaign/flow step and hour or day (see rollups.py)"""
+
+    HOUR = "hour"
+    DAY = "day"
+    PERIODS = [(HOUR, "Hour"), (DAY, "Day")]
+
+    period = models.CharField(max_length=4, choices=PERIODS)
+    bucket = models.DateTimeField()
+    # 0 when the events weren't attributed to a campaign / flow step, so the
+    # unique constraint also covers those rows
+    campaign_id = models.BigIntegerField(default=0)
+    flow_step_id = models.BigIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    opened = models.PositiveIntegerField(default=0)
+    clicked = models.PositiveIntegerField(default=0)
+    converted = models.PositiveIntegerField(default=0)
+    unsubscribed = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["period", "campaign_id", "flow_step_id", "bucket"],
+                name="unique_event_rollup",
+            )
+        ]
+        indexes = [models.Index(fields=["campaign_id", "period", "bucket"])]
+
+
+class RollupWatermark(models.Model):
+    """Highest Event id already folded into the rollups"""
+
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class Suppression(models.Model):
+    """Email address that must never be sent marketing email"""
+
+    UNSUBSCRIBE = "unsubscribe"
+    BOUNCE = "bounce"
+    COMPLAINT = "complaint"
+    MANUAL = "manual"
+    REASONS = [
+        (UNSUBSCRIBE, "Unsubscribe"),
+        (BOUNCE, "Bounce"),
+        (COMPLAINT, "Complaint"),
+        (MANUAL, "Manual"),
+    ]
+
+    email = models.EmailField(unique=True)
+    reason = models.CharField(max_length=20, choices=REASONS, default=MANUAL)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        self.email = self.email.strip().lower()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.email} ({self.reason})"
+
+
+class ChangeLog(models.Model):
+    """Transactional outbox of customer/segment/campaign writes (changes.py)"""
+
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    OPERATIONS = [(CREATE, "Create"), (UPDATE, "Update"), (DELETE, "Delete")]
+
+    # The auto-incrementing id doubles as the consumers' cursor
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=6, choices=OPERATIONS)
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.operation} {self.model} {self.object_id}"
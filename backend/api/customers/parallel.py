@@ -0,0 +1,153 @@
+"""Partitioned segment evaluation across a process pool.
+
+The customer primary-key range is split into contiguous partitions and the
+segment conditions are evaluated on each partition independently, so a
+single long scan becomes several shorter ones running on separate cores,
+each worker process using its own database connection.
+
+The pool is started once per process and kept between calls. Workers are
+spawned rather than forked, so they inherit none of the parent's database
+connections or threads. Still, every process that uses the pool keeps
+``SEGMENT_EVALUATION_WORKERS`` more processes around, so only raise the
+setting for processes that don't serve requests, such as management
+commands.
+"""
+
+import importlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Min
+
+from .tenants import current_tenant, use_tenant
+
+PARTITIONS_PER_WORKER = 4
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def init_worker():
+    import django
+    from django.apps import apps
+
+    # Spawned workers start from scratch
+    if not apps.ready:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
+        django.setup()
+
+
+def _get_pool(workers):
+    """The shared pool, started on first use and when ``workers`` changes"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context("spawn"),
+                initializer=init_worker,
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _call(module, name, args):
+    # Looked up by name, so the function's module is only imported once
+    # ``init_worker`` has set Django up
+    return getattr(importlib.import_module(module), name)(*args)
+
+
+def pool_map(func, tasks, workers):
+    """``[func(*task) for task in tasks]`` on the shared process pool.
+
+    ``func`` must be a module-level function.
+    """
+    pool = _get_pool(workers)
+    try:
+        return list(
+            pool.map(
+                _call,
+                [func.__module__] * len(tasks),
+                [func.__name__] * len(tasks),
+                tasks,
+            )
+        )
+    except BrokenProcessPool:
+        # A worker died; start a new pool on the next call
+        _discard_pool(pool)
+        raise
+
+
+def _evaluate_partition(conditions, low, high, collect_ids, tenant=None):
+    # Imported here: spawned workers import this module before
+    # ``init_worker`` has set Django up (see ``_call``)
+    from .models import Segment
+
+    with use_tenant(tenant):
+        queryset = (
+            Segment(conditions=conditions)
+            .get_customers()
+            .filter(pk__gte=low, pk__lt=high)
+        )
+        if not collect_ids:
+            return queryset.count()
+        return np.fromiter(
+            queryset.values_list("pk", flat=True).iterator(chunk_size=10000),
+            dtype=np.int64,
+        )
+
+
+def partition_ranges(low, high, partitions):
+    """Split [low, high] into at most ``partitions`` half-open ranges"""
+    edges = np.unique(np.linspace(low, high + 1, partitions + 1).astype(np.int64))
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def evaluate_segment(segment, collect_ids=False, workers=None):
+    """Count (or list the ids of) a segment's customers partition by partition.
+
+    Returns an int, or a sorted NumPy array of ids when ``collect_ids`` is
+    set. ``workers`` defaults to ``SEGMENT_EVALUATION_WORKERS``; with a
+    single worker the partitions are evaluated in-process, otherwise on the
+    shared process pool.
+    """
+    from .models import Customer
+
+    workers = workers or settings.SEGMENT_EVALUATION_WORKERS
+    bounds = Customer.objects.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is None:
+        return np.zeros(0, dtype=np.int64) if collect_ids else 0
+
+    ranges = partition_ranges(
+        bounds["low"], bounds["high"], workers * PARTITIONS_PER_WORKER
+    )
+    tenant = current_tenant()
+    tasks = [
+        (segment.conditions, low, high, collect_ids, tenant) for low, high in ranges
+    ]
+
+    if workers == 1:
+        results = [_evaluate_partition(*task) for task in tasks]
+    else:
+        results = pool_map(_evaluate_partition, tasks, workers)
+
+    if not collect_ids:
+        return sum(results)
+    # Partitions are disjoint and ordered, so concatenation stays sorted
+    return np.concatenate(results)
@@ -0,0 +1,178 @@
+"""Query plans and index advice for segment conditions.
+
+``plan_segment`` runs the database's EXPLAIN on a segment's compiled query
+and flags the patterns that make segments slow: full table scans,
+``contains`` filters (compiled to ``icontains``, a LIKE with a leading
+wildcard that no B-tree index can serve) and filters on unindexed columns.
+``recommend_indexes`` aggregates the indexable conditions of all segments
+into composite index suggestions for ``Customer``.
+"""
+
+import json
+from collections import Counter, defaultdict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+
+from .models import PROFILE_FIELDS, Customer
+from .tenants import tenant_database
+
+EQUALITY_OPERATORS = ("equals",)
+RANGE_OPERATORS = ("greater_than", "less_than", "in_last_days")
+MAX_INDEX_COLUMNS = 3
+
+
+def _is_wildcard(condition):
+    """Whether ``Segment.get_customers`` compiles this to ``icontains``"""
+    if condition["operator"] == "contains":
+        return True
+    # Email "equals" without an @ is treated as a domain match
+    return (
+        condition["field"] == "email"
+        and condition["operator"] == "equals"
+        and "@" not in str(condition["value"])
+    )
+
+
+def customer_indexes():
+    """Column lists of the indexes that exist on the customer table"""
+    connection = connections[tenant_database()]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, Customer._meta.db_table
+        )
+    return [
+        tuple(info["columns"])
+        for info in constraints.values()
+        if info["index"] or info["unique"] or info["primary_key"]
+    ]
+
+
+def _column(field_name):
+    try:
+        return Customer._meta.get_field(field_name).column
+    except FieldDoesNotExist:
+        return None
+
+
+def estimate_table_rows():
+    """Approximate customer count without scanning the table"""
+    table = Customer._meta.db_table
+    connection = connections[tenant_database()]
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table]
+            )
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        # Ids are dense enough for an estimate; separate MIN/MAX subqueries
+        # let SQLite read each bound straight off the primary key
+        cursor.execute(
+            f'SELECT (SELECT MAX(id) FROM "{table}")'
+            f' - (SELECT MIN(id) FROM "{table}") + 1'
+        )
+        return cursor.fetchone()[0] or 0
+
+
+def _explain(queryset):
+    """Plan steps, estimated result rows (if reported) and full-scan flag"""
+    table = Customer._meta.db_table
+    if connections[queryset.db].vendor == "postgresql":
+        plan = json.loads(queryset.explain(format="json"))[0]["Plan"]
+        steps, full_scan, nodes = [], False, [(plan, 0)]
+        while nodes:
+            node, depth = nodes.pop()
+            relation = node.get("Relation Name")
+            steps.append(
+                "  " * depth
+                + node["Node Type"]
+                + (f" on {relation}" if relation else "")
+                + f" (rows={node.get('Plan Rows')})"
+            )
+            if node["Node Type"] == "Seq Scan" and relation == table:
+                full_scan = True
+            nodes.extend((child, depth + 1) for child in node.get("Plans", [])[::-1])
+        return steps, plan.get("Plan Rows"), full_scan
+
+    # SQLite's EXPLAIN QUERY PLAN rows are "id parent notused detail"
+    steps = [
+        line.split(maxsplit=3)[-1] for line in queryset.explain().splitlines() if line
+    ]
+    full_scan = any(
+        step.startswith(f"SCAN {table}") and "INDEX" not in step for step in steps
+    )
+    return steps, None, full_scan
+
+
+def plan_segment(segment):
+    """EXPLAIN a segment's query and flag what makes it expensive"""
+    steps, estimated_rows, full_scan = _explain(segment.get_customers())
+    table_rows = estimate_table_rows()
+    indexed = {columns[0] for columns in customer_indexes()}
+
+    warnings = []
+    for condition in segment.conditions:
+        field = condition["field"]
+        column = _column(field)
+        if field in PROFILE_FIELDS:
+            warnings.append({"field": field, "issue": "profile_join"})
+        elif column is None:
+            warnings.append({"field": field, "issue": "unknown_field"})
+        elif _is_wildcard(condition):
+            warnings.append({"field": field, "issue": "leading_wildcard"})
+        elif column not in indexed:
+            warnings.append({"field": field, "issue": "unindexed"})
+
+    if estimated_rows is None and full_scan:
+        estimated_rows = table_rows
+    return {
+        "vendor": connections[tenant_database()].vendor,
+        "plan": steps,
+        "estimated_rows": estimated_rows,
+        "table_rows": table_rows,
+        "full_scan": full_scan,
+        "warnings": warnings,
+    }
+
+
+def index_candidate(conditions):
+    """Composite index columns serving the conditions, or None.
+
+    Equality columns go first (in a stable order) followed by one range
+    column, the layout a B-tree can use for every column. Wildcard
+    conditions can't use an index and are left out.
+    """
+    equality, ranges = set(), []
+    for condition in conditions:
+        column = _column(condition["field"])
+        if column is None or _is_wildcard(condition):
+            continue
+        if condition["operator"] in EQUALITY_OPERATORS:
+            equality.add(column)
+        elif condition["operator"] in RANGE_OPERATORS and column not in ranges:
+            ranges.append(column)
+    columns = sorted(equality) + [c for c in ranges if c not in equality][:1]
+    return tuple(columns[:MAX_INDEX_COLUMNS]) or None
+
+
+def recommend_indexes(segments, existing=None):
+    """Indexes that would serve the segments, most used first.
+
+    Returns ``[(columns, segment names)]``; candidates that are a prefix of
+    an existing index are skipped.
+    """
+    if existing is None:
+        existing = customer_indexes()
+    uses = Counter()
+    names = defaultdict(list)
+    for segment in segments:
+        columns = index_candidate(segment.conditions)
+        if columns is None:
+            continue
+        if any(index[: len(columns)] == columns for index in existing):
+            continue
+        uses[columns] += 1
+        names[columns].append(segment.name)
+    return [(columns, names[columns]) for columns, _ in uses.most_common()]
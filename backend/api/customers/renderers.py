@@ -0,0 +1,66 @@
+"""JSON rendering backed by orjson when it is installed."""
+
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Raw Decimals (e.g. from values() rows) are rendered as strings, the way
+    # serializers.DecimalField represents them
+    if isinstance(obj, Decimal):
+        return str(obj)
+    return _fallback_encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Drop-in JSONRenderer that uses orjson for compact output.
+
+    Falls back to the stdlib-based DRF renderer when orjson is missing or an
+    indented (browsable API / ``; indent=N``) rendering is requested.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=_default,
+            option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+        )
+        # Keep the output a strict javascript subset, as JSONRenderer does
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return ret
+
+
+class CSVRenderer(BaseRenderer):
+    """Content negotiation target for streamed CSV exports"""
+
+    media_type = "text/csv"
+    format = "csv"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Export payloads are streamed by the view; this only renders errors
+        return JSONRenderer().render(data, accepted_media_type, renderer_context)
+
+
+class NDJSONRenderer(CSVRenderer):
+    """Content negotiation target for streamed NDJSON exports"""
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
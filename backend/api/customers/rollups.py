@@ -0,0 +1,215 @@
+"""Incremental hourly/daily funnel rollups over the event log.
+
+``update_rollups`` folds every event with an id above the stored watermark
+into ``EventRollup`` rows, so each run only reads new events and the stats
+endpoint never touches the event table. ``rebuild_days`` recomputes whole
+days from scratch (used by the backfill command).
+
+Where ids can commit out of order (anything but SQLite), an event with a
+lower id may still be in flight when a higher one is folded in. There, each
+run notes the highest id it sees and a later run folds up to that id once
+the note is ``COMMIT_LAG_SECONDS`` old, by when those events have committed.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Coalesce, TruncHour
+from django.utils import timezone
+
+from api.db_routing import commit_lag
+
+from .models import Event, EventRollup, RollupWatermark
+from .parallel import pool_map
+from .tenants import current_tenant, tenant_database, use_tenant
+
+WATERMARK_NAME = "event_rollups"
+# Highest event id seen by a run and when, for databases with a commit lag
+SEEN_NAME = "event_rollups_seen"
+COUNTERS = {
+    "sent": Event.SEND,
+    "opened": Event.OPEN,
+    "clicked": Event.CLICK,
+    "converted": Event.CONVERSION,
+    "unsubscribed": Event.UNSUBSCRIBE,
+}
+METRICS = [*COUNTERS, "revenue"]
+
+
+def aggregate_events(events):
+    """Hourly and daily rollup values for ``events``.
+
+    Events are grouped by campaign, flow step and hour in the database; the
+    daily rows are then summed from the hourly ones rather than scanning the
+    events a second time.
+    """
+    metrics = {
+        name: Count("pk", filter=Q(event_type=event_type))
+        for name, event_type in COUNTERS.items()
+    }
+    metrics["revenue"] = Sum("revenue", filter=Q(event_type=Event.CONVERSION))
+    rows = (
+        events.annotate(
+            bucket=TruncHour("occurred_at"),
+            campaign_key=Coalesce("campaign_id", 0),
+            flow_step_key=Coalesce("flow_step_id", 0),
+        )
+        .values("campaign_key", "flow_step_key", "bucket")
+        .annotate(**metrics)
+        .order_by()
+    )
+
+    hourly, daily = [], {}
+    for row in rows:
+        row["revenue"] = row["revenue"] or 0
+        hour = {
+            "period": EventRollup.HOUR,
+            "bucket": row["bucket"],
+            "campaign_id": row["campaign_key"],
+            "flow_step_id": row["flow_step_key"],
+            **{name: row[name] for name in METRICS},
+        }
+        hourly.append(hour)
+
+        day_bucket = row["bucket"].replace(hour=0)
+        key = (row["campaign_key"], row["flow_step_key"], day_bucket)
+        if key not in daily:
+            daily[key] = {**hour, "period": EventRollup.DAY, "bucket": day_bucket}
+        else:
+            for name in METRICS:
+                daily[key][name] += row[name]
+    return hourly + list(daily.values())
+
+
+def _apply(rows):
+    """Add aggregated values onto existing rollup rows, creating missing ones"""
+    for row in rows:
+        key = {
+            "period": row["period"],
+            "bucket": row["bucket"],
+            "campaign_id": row["campaign_id"],
+            "flow_step_id": row["flow_step_id"],
+        }
+        increments = {name: F(name) + row[name] for name in METRICS}
+        if not EventRollup.objects.filter(**key).update(**increments):
+            EventRollup.objects.create(**row)
+
+
+def update_rollups():
+    """Fold events newer than the watermark into the rollups.
+
+    Returns the number of events processed.
+    """
+    using = tenant_database()
+    lag = commit_lag(using)
+    with transaction.atomic(using=using):
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+            name=WATERMARK_NAME
+        )
+        new_events = Event.objects.filter(pk__gt=watermark.last_event_id)
+        last_event_id = new_events.aggregate(last=Max("pk"))["last"]
+        if lag:
+            last_event_id = _settled_event_id(last_event_id, lag)
+        if last_event_id is None or last_event_id <= watermark.last_event_id:
+            return 0
+
+        batch = new_events.filter(pk__lte=last_event_id)
+        processed = batch.count()
+        _apply(aggregate_events(batch))
+        watermark.last_event_id = last_event_id
+        watermark.save()
+    return processed
+
+
+def _settled_event_id(last_event_id, lag):
+    """The highest id seen at least ``lag`` seconds ago, noting the newest.
+
+    Returns None until there is a note that old.
+    """
+    seen, created = RollupWatermark.objects.select_for_update().get_or_create(
+        name=SEEN_NAME, defaults={"last_event_id": last_event_id or 0}
+    )
+    if created or seen.updated_at > timezone.now() - timedelta(seconds=lag):
+        return None
+    settled = seen.last_event_id
+    if last_event_id is not None:
+        # save() sets updated_at, the time of the new note
+        seen.last_event_id = last_event_id
+        seen.save()
+    return settled
+
+
+def _aggregate_day(day, after_event_id, last_event_id, tenant=None):
+    with use_tenant(tenant):
+        events = Event.objects.filter(
+            pk__gt=after_event_id,
+            pk__lte=last_event_id,
+            occurred_at__gte=day,
+            occurred_at__lt=day + timedelta(days=1),
+        )
+        return aggregate_events(events)
+
+
+def _merge(rows, more):
+    """Rollup rows with ``more`` added onto matching ones"""
+    merged = {}
+    for row in [*rows, *more]:
+        key = (row["period"], row["bucket"], row["campaign_id"], row["flow_step_id"])
+        if key in merged:
+            for name in METRICS:
+                merged[key][name] += row[name]
+        else:
+            merged[key] = dict(row)
+    return list(merged.values())
+
+
+def rebuild_days(days, workers=1):
+    """Recompute the rollups of whole days (midnight datetimes) from events.
+
+    Days are aggregated in parallel across ``workers`` processes (on the
+    shared pool, see ``parallel.pool_map``) and written by the calling
+    process. Pending events are folded in first so that the rebuilt days
+    and the watermark agree. The days are replaced while holding the
+    watermark, and events ``update_rollups`` folded in while they were
+    being aggregated are added, so no increments are lost.
+    """
+    update_rollups()
+    last_event_id = RollupWatermark.objects.get(name=WATERMARK_NAME).last_event_id
+
+    tasks = [(day, 0, last_event_id, current_tenant()) for day in days]
+    if workers > 1:
+        results = pool_map(_aggregate_day, tasks, workers)
+    else:
+        results = [_aggregate_day(*task) for task in tasks]
+
+    written = 0
+    with transaction.atomic(using=tenant_database()):
+        watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+        for day, rows in zip(days, results):
+            if watermark.last_event_id != last_event_id:
+                rows = _merge(
+                    rows,
+                    _aggregate_day(day, last_event_id, watermark.last_event_id),
+                )
+            EventRollup.objects.filter(
+                bucket__gte=day, bucket__lt=day + timedelta(days=1)
+            ).delete()
+            EventRollup.objects.bulk_create(EventRollup(**row) for row in rows)
+            written += len(rows)
+    return written
+
+
+def campaign_stats(campaign):
+    """Funnel totals, per-step totals and a daily series from the rollups"""
+    rollups = EventRollup.objects.filter(
+        campaign_id=campaign.pk, period=EventRollup.DAY
+    )
+    metrics = {name: Sum(name, default=0) for name in METRICS}
+    return {
+        "totals": rollups.aggregate(**metrics),
+        "steps": list(
+            rollups.values("flow_step_id").annotate(**metrics).order_by("flow_step_id")
+        ),
+        "daily": list(rollups.values("bucket").annotate(**metrics).order_by("bucket")),
+    }
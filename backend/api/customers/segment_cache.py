@@ -0,0 +1,80 @@
+"""Cached segment results for previews and counts.
+
+Segment builder UIs preview the same conditions over and over, and each
+evaluation is a query over every customer. Results (the match count and
+the first page of ids) are cached under a key made of the normalized
+conditions, the versions of the customer columns they reference and, for
+relative-date conditions, the current date bucket (see
+``relative_date_now``). A customer write therefore only invalidates
+results that read a column it changed.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import get_field_versions, read_from_primary_if_changed
+from .models import Customer, Segment, relative_date_now
+
+RESULT_KEY_PREFIX = "segment-results"
+PREVIEW_SIZE = 10
+RELATIVE_OPERATORS = ("in_last_days",)
+
+
+def normalize_conditions(conditions):
+    """Conditions in a canonical order, without duplicates (they are ANDed)"""
+    unique = {
+        json.dumps(condition, sort_keys=True, default=str): condition
+        for condition in conditions
+    }
+    return [unique[key] for key in sorted(unique)]
+
+
+def result_versions(conditions):
+    """Versions of the customer columns the conditions' results depend on"""
+    # Every write that adds or removes customers changes the "id" version
+    fields = sorted({"id", *(str(condition["field"]) for condition in conditions)})
+    return get_field_versions(Customer, fields)
+
+
+def result_cache_key(conditions):
+    """Cache key for the conditions' results, or None if they can't be cached"""
+    conditions = normalize_conditions(conditions)
+    parts = [
+        json.dumps(conditions, sort_keys=True, default=str),
+        *result_versions(conditions),
+    ]
+    if any(condition["operator"] in RELATIVE_OPERATORS for condition in conditions):
+        if settings.SEGMENT_DATE_BUCKET_SECONDS <= 0:
+            return None
+        parts.append(relative_date_now().isoformat())
+    digest = hashlib.sha256("|".join(parts).encode()).hexdigest()
+    return f"{RESULT_KEY_PREFIX}:{digest}"
+
+
+def segment_results(conditions):
+    """``{"count": ..., "ids": [...]}`` for the conditions, cached"""
+    key = result_cache_key(conditions)
+    results = cache.get(key) if key else None
+    if results is None:
+        if key:
+            read_from_primary_if_changed(result_versions(conditions))
+        customers = Segment(conditions=conditions).get_customers()
+        results = {
+            "count": customers.count(),
+            "ids": list(
+                customers.order_by("pk").values_list("pk", flat=True)[:PREVIEW_SIZE]
+            ),
+        }
+        if key:
+            cache.set(key, results, settings.SEGMENT_RESULT_CACHE_TIMEOUT)
+    return results
+
+
+def preview_customers(conditions):
+    """Match count and the first page of matching customers"""
+    results = segment_results(conditions)
+    customers = Customer.objects.in_bulk(results["ids"])
+    return results["count"], [customers[pk] for pk in results["ids"] if pk in customers]
@@ -0,0 +1,247 @@
+"""Per-customer send-time optimization.
+
+Each customer's ``best_send_hour`` is the local hour (0-23) in which they
+engage most: opens and clicks over the last ``SEND_TIME_LOOKBACK_DAYS`` are
+summed per UTC hour in the database, shifted to local time and reduced to
+the peak hour with NumPy. Customers without engagement fall back to the
+hour of their last order; customers with neither use ``DEFAULT_SEND_HOUR``
+at send time.
+
+Local time comes from the customer's US state (standard time); unknown
+states are treated as UTC. Runs are incremental: only customers with new
+engagement events or profile changes since the previous run are
+recomputed.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, Count, IntegerField, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from .cache import invalidate_model
+from .changes import record_changes
+from .models import Campaign, Customer, Event, RollupWatermark
+from .tenants import tenant_database
+
+WATERMARK_NAME = "send_times"
+CHUNK_SIZE = 5000
+HOURS = 24
+ENGAGEMENT_WEIGHTS = {Event.OPEN: 1, Event.CLICK: 2}
+
+# Standard-time UTC offsets of US states
+STATE_UTC_OFFSETS = {
+    **dict.fromkeys(
+        "CT DC DE FL GA IN KY MA MD ME MI NC NH NJ NY OH PA RI SC VA VT WV".split(),
+        -5,
+    ),
+    **dict.fromkeys(
+        "AL AR IA IL KS LA MN MO MS ND NE OK SD TN TX WI".split(),
+        -6,
+    ),
+    **dict.fromkeys("AZ CO ID MT NM UT WY".split(), -7),
+    **dict.fromkeys("CA NV OR WA".split(), -8),
+    "AK": -9,
+    "HI": -10,
+}
+
+
+def utc_offset(state):
+    return STATE_UTC_OFFSETS.get(state, 0)
+
+
+def engagement_histograms(events, customer_ids, since):
+    """Weighted opens/clicks per customer and UTC hour, as an (n, 24) array"""
+    index = {pk: i for i, pk in enumerate(customer_ids)}
+    rows = list(
+        events.filter(event_type__in=ENGAGEMENT_WEIGHTS, occurred_at__gte=since)
+        .values_list("customer_id", ExtractHour("occurred_at"))
+        .annotate(
+            score=Sum(
+                Case(
+                    *[
+                        When(event_type=event_type, then=Value(weight))
+                        for event_type, weight in ENGAGEMENT_WEIGHTS.items()
+                    ],
+                    output_field=IntegerField(),
+                )
+            )
+        )
+        .order_by()
+    )
+    histograms = np.zeros((len(customer_ids), HOURS), dtype=np.int64)
+    rows = [row for row in rows if row[0] in index]
+    if rows:
+        pks, hours, scores = (np.array(column) for column in zip(*rows))
+        rows_index = np.array([index[pk] for pk in pks.tolist()])
+        np.add.at(histograms, (rows_index, hours), scores)
+    return histograms
+
+
+def best_local_hours(histograms, offsets, fallback_hours):
+    """Peak local hour per row, else the fallback (-1 for none)"""
+    columns = np.arange(HOURS)
+    # Column h of the local histogram is UTC hour h - offset
+    local = np.take_along_axis(
+        histograms, (columns[None, :] - offsets[:, None]) % HOURS, axis=1
+    )
+    return np.where(local.any(axis=1), local.argmax(axis=1), fallback_hours)
+
+
+def _store_send_hours(pks, hours, stored_hours):
+    # Only rows whose hour moved are written and logged (-1 stands for null)
+    changed = hours != stored_hours
+    pks, hours = pks[changed], hours[changed]
+    if not len(pks):
+        return
+    # At most 25 distinct values, so update by value instead of per row.
+    # The SQL is built directly: resolving thousands of IN parameters through
+    # the ORM costs more than the update itself
+    using = tenant_database()
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    sql = "UPDATE {} SET {} = %s WHERE {} IN ({{}})".format(
+        quote_name(Customer._meta.db_table),
+        quote_name(Customer._meta.get_field("best_send_hour").column),
+        quote_name(Customer._meta.pk.column),
+    )
+    # Each chunk commits on its own, so writers only wait for one chunk
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        record_changes(Customer, pks.tolist())
+        for hour in np.unique(hours):
+            ids = pks[hours == hour].tolist()
+            cursor.execute(
+                sql.format(", ".join(["%s"] * len(ids))),
+                [None if hour < 0 else int(hour), *ids],
+            )
+
+
+def _compute_chunk(since, **pk_lookups):
+    """Recompute the customers selected by ``pk_lookups`` (e.g. in=[...])"""
+    customers = Customer.objects.filter(
+        **{f"pk__{lookup}": value for lookup, value in pk_lookups.items()}
+    )
+    rows = list(
+        customers.values_list("pk", "state", "last_order_date", "best_send_hour")
+    )
+    if not rows:
+        return 0
+    pks = [row[0] for row in rows]
+    offsets = np.array([utc_offset(row[1]) for row in rows], dtype=np.int64)
+    fallback = np.array([row[2].hour if row[2] else -1 for row in rows], dtype=np.int64)
+    fallback = np.where(fallback >= 0, (fallback + offsets) % HOURS, -1)
+
+    events = Event.objects.filter(
+        **{f"customer_id__{lookup}": value for lookup, value in pk_lookups.items()}
+    )
+    stored = np.array(
+        [-1 if row[3] is None else row[3] for row in rows], dtype=np.int64
+    )
+    histograms = engagement_histograms(events, pks, since)
+    _store_send_hours(
+        np.array(pks, dtype=np.int64),
+        best_local_hours(histograms, offsets, fallback),
+        stored,
+    )
+    return len(rows)
+
+
+def compute_send_times(full=False, chunk_size=CHUNK_SIZE):
+    """Recompute ``best_send_hour`` for customers with new activity.
+
+    Everyone is recomputed on the first run or with ``full``. Returns the
+    number of customers updated.
+
+    The database is only locked to read the watermark and to advance it;
+    customers are updated in one short transaction per chunk. The
+    watermark is created once a run completes, so an interrupted first run
+    walks the whole table again.
+    """
+    since = timezone.now() - timedelta(days=settings.SEND_TIME_LOOKBACK_DAYS)
+    using = tenant_database()
+    with transaction.atomic(using=using):
+        watermark = (
+            RollupWatermark.objects.select_for_update()
+            .filter(name=WATERMARK_NAME)
+            .first()
+        )
+        started_at = timezone.now()
+        last_event_id = Event.objects.aggregate(last=Max("pk"))["last"] or 0
+
+    updated = 0
+    if full or watermark is None:
+        # Walk the whole table by primary-key range
+        bounds = Customer.objects.aggregate(low=Min("pk"), high=Max("pk"))
+        if bounds["low"] is not None:
+            for low in range(bounds["low"], bounds["high"] + 1, chunk_size):
+                updated += _compute_chunk(since, gte=low, lt=low + chunk_size)
+    else:
+        engaged = Event.objects.filter(
+            pk__gt=watermark.last_event_id,
+            pk__lte=last_event_id,
+            event_type__in=ENGAGEMENT_WEIGHTS,
+        ).values_list("customer_id", flat=True)
+        changed = Customer.objects.filter(
+            updated_at__gte=watermark.updated_at
+        ).values_list("pk", flat=True)
+        customer_ids = sorted(set(engaged) | set(changed))
+        for start in range(0, len(customer_ids), chunk_size):
+            updated += _compute_chunk(
+                since, **{"in": customer_ids[start : start + chunk_size]}
+            )
+
+    with transaction.atomic(using=using):
+        watermark, created = RollupWatermark.objects.select_for_update().get_or_create(
+            name=WATERMARK_NAME,
+            defaults={"last_event_id": last_event_id},
+        )
+        # update() skips auto_now, so the run's start time becomes the
+        # watermark and customers changed while it ran are picked up next
+        # time. A run that started earlier doesn't move it back.
+        RollupWatermark.objects.filter(
+            pk=watermark.pk, last_event_id__lte=last_event_id
+        ).update(last_event_id=last_event_id, updated_at=started_at)
+
+    if updated:
+        # Queryset updates don't send post_save
+        invalidate_model(Customer, fields=["best_send_hour"])
+        invalidate_model(Campaign)
+    return updated
+
+
+def send_hour_q(utc_hour):
+    """Filter for customers whose local send hour falls in ``utc_hour``"""
+    query = Q()
+    offsets = {}
+    for state, offset in STATE_UTC_OFFSETS.items():
+        offsets.setdefault(offset, []).append(state)
+    for offset, states in offsets.items():
+        local_hour = (utc_hour + offset) % HOURS
+        query |= Q(state__in=states) & _local_hour_q(local_hour)
+    query |= ~Q(state__in=list(STATE_UTC_OFFSETS)) & _local_hour_q(utc_hour)
+    return query
+
+
+def _local_hour_q(local_hour):
+    query = Q(best_send_hour=local_hour)
+    if local_hour == settings.DEFAULT_SEND_HOUR:
+        query |= Q(best_send_hour__isnull=True)
+    return query
+
+
+def send_schedule(customers):
+    """Number of ``customers`` to send to in each UTC hour, in one query"""
+    schedule = [0] * HOURS
+    rows = (
+        customers.values_list("state", "best_send_hour")
+        .annotate(customers=Count("pk"))
+        .order_by()
+    )
+    for state, local_hour, count in rows:
+        if local_hour is None:
+            local_hour = settings.DEFAULT_SEND_HOUR
+        schedule[(local_hour - utc_offset(state)) % HOURS] += count
+    return schedule
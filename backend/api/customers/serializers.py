@@ -1,5 +1,15 @@
 from rest_framework import serializers
-from .models import Customer, Segment, Flow, FlowStep, Campaign
+from .experiments import HOLDOUT
+from .models import (
+    PROFILE_FIELDS,
+    Customer,
+    CustomerProfile,
+    Segment,
+    Flow,
+    FlowStep,
+    Campaign,
+)
+from .segment_cache import segment_results
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -10,16 +20,74 @@ class CustomerSerializer(serializers.ModelSerializer):
         model = Customer
         fields = "__all__"
 
+    def update(self, instance, validated_data):
+        # Saving only the submitted columns keeps caches that depend on the
+        # others (see segment_cache.py) valid
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, "updated_at"])
+        return instance
+
+
+class CustomerDetailSerializer(CustomerSerializer):
+    """Customer with its profile fields, for single-customer endpoints"""
+
+    phone = serializers.CharField(
+        source="profile.phone", max_length=20, required=False, allow_blank=True
+    )
+    address_line1 = serializers.CharField(
+        source="profile.address_line1", max_length=200, required=False, allow_blank=True
+    )
+    address_line2 = serializers.CharField(
+        source="profile.address_line2", max_length=200, required=False, allow_blank=True
+    )
+    zip_code = serializers.CharField(
+        source="profile.zip_code", max_length=20, required=False, allow_blank=True
+    )
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Customers without a profile row have blank details
+        for field in PROFILE_FIELDS:
+            if data.get(field) is None:
+                data[field] = ""
+        return data
+
+    def create(self, validated_data):
+        profile = validated_data.pop("profile", {})
+        customer = super().create(validated_data)
+        self.save_profile(customer, profile)
+        return customer
+
+    def update(self, instance, validated_data):
+        profile = validated_data.pop("profile", {})
+        customer = super().update(instance, validated_data)
+        self.save_profile(customer, profile)
+        return customer
+
+    def save_profile(self, customer, values):
+        if not values:
+            return
+        try:
+            profile = customer.profile
+        except CustomerProfile.DoesNotExist:
+            if not any(values.values()):
+                return
+            profile = CustomerProfile(customer=customer)
+        for attr, value in values.items():
+            setattr(profile, attr, value)
+        profile.save(update_fields=None if profile._state.adding else list(values))
+
 
 class SegmentSerializer(serializers.ModelSerializer):
     customer_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Segment
-        fields = "__all__"
+        exclude = ["membership_bitmap", "bitmap_computed_at"]
 
     def get_customer_count(self, obj):
-        return obj.get_customers().count()
+        return segment_results(obj.conditions)["count"]
 
 
 class FlowStepSerializer(serializers.ModelSerializer):
@@ -34,6 +102,7 @@ class FlowSerializer(serializers.ModelSerializer):
     class Meta:
         model = Flow
         fields = "__all__"
+        read_only_fields = ["audience_count"]
 
 
 class CampaignSerializer(serializers.ModelSerializer):
@@ -44,3 +113,29 @@ class CampaignSerializer(serializers.ModelSerializer):
     class Meta:
         model = Campaign
         fields = "__all__"
+
+    def validate_variants(self, value):
+        if not isinstance(value, list):
+            raise serializers.ValidationError("Must be a list of variants")
+        names = set()
+        for variant in value:
+            if (
+                not isinstance(variant, dict)
+                or not isinstance(variant.get("name"), str)
+                or not variant["name"]
+            ):
+                raise serializers.ValidationError("Each variant needs a name")
+            weight = variant.get("weight", 1)
+            if isinstance(weight, bool) or not isinstance(weight, int) or weight < 1:
+                raise serializers.ValidationError(
+                    "Variant weights must be positive integers"
+                )
+            if variant["name"] in names or variant["name"] == HOLDOUT:
+                raise serializers.ValidationError(
+                    f"Invalid variant name {variant['name']!r}"
+                )
+            names.add(variant["name"])
+        return [
+            {"name": variant["name"], "weight": variant.get("weight", 1)}
+            for variant in value
+        ]
@@ -0,0 +1,217 @@
+from collections import Counter
+
+from django.db.models import Count, Exists, F, OuterRef
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    pre_delete,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .cache import invalidate_model
+from .changes import TRACKED_MODELS, record_changes
+from .models import (
+    PROFILE_FIELDS,
+    Customer,
+    CustomerProfile,
+    Segment,
+    Flow,
+    FlowStep,
+    Campaign,
+    Suppression,
+    ChangeLog,
+)
+
+CACHED_MODELS = (Customer, Segment, Flow, FlowStep, Campaign)
+Enrollment = Campaign.customers.through
+# Customer ids per query when counting a large enrollment's audience change
+AUDIENCE_BATCH_SIZE = 5000
+
+
+def _refresh_flow_audience(flow_ids):
+    for flow in Flow.objects.filter(pk__in=set(flow_ids)):
+        flow.refresh_audience_count()
+
+
+def _audience_changes(enrollments, campaign_ids):
+    """Customers each flow gains with ``enrollments`` (or loses without them).
+
+    A customer only counts if no campaign outside ``campaign_ids`` enrolls
+    them on the same flow.
+    """
+    others = Enrollment.objects.filter(
+        customer_id=OuterRef("customer_id"),
+        campaign__flow_id=OuterRef("campaign__flow_id"),
+    ).exclude(campaign_id__in=campaign_ids)
+    changes = (
+        enrollments.exclude(Exists(others))
+        .values("campaign__flow_id")
+        .annotate(customers=Count("customer_id", distinct=True))
+    )
+    return Counter({row["campaign__flow_id"]: row["customers"] for row in changes})
+
+
+def _enrollment_audience_changes(instance, reverse, pk_set):
+    """Audience changes from the enrollments an m2m signal is about"""
+    if reverse:
+        enrollments = Enrollment.objects.filter(customer_id=instance.pk)
+        if pk_set is None:
+            return _audience_changes(enrollments, enrollments.values("campaign_id"))
+        return _audience_changes(enrollments.filter(campaign_id__in=pk_set), pk_set)
+
+    enrollments = Enrollment.objects.filter(campaign_id=instance.pk)
+    if pk_set is None:
+        return _audience_changes(enrollments, [instance.pk])
+    changes = Counter()
+    customer_ids = list(pk_set)
+    for start in range(0, len(customer_ids), AUDIENCE_BATCH_SIZE):
+        batch = customer_ids[start : start + AUDIENCE_BATCH_SIZE]
+        changes += _audience_changes(
+            enrollments.filter(customer_id__in=batch), [instance.pk]
+        )
+    return changes
+
+
+def _apply_audience_changes(changes, sign=1):
+    for flow_id, customers in changes.items():
+        Flow.objects.filter(pk=flow_id).update(
+            audience_count=F("audience_count") + sign * customers
+        )
+
+
+@receiver(m2m_changed, sender=Enrollment)
+def campaign_enrollment_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Flow.audience_count in sync when customers are (un)enrolled"""
+    if action == "post_add":
+        _apply_audience_changes(_enrollment_audience_changes(instance, reverse, pk_set))
+    elif action in ("pre_remove", "pre_clear"):
+        # Counted while the enrollments still exist; pk_set may also hold
+        # ids that aren't enrolled
+        instance._audience_changes = _enrollment_audience_changes(
+            instance, reverse, pk_set
+        )
+    elif action in ("post_remove", "post_clear"):
+        _apply_audience_changes(instance._audience_changes, -1)
+
+
+@receiver(pre_save, sender=Campaign)
+def remember_previous_flow(sender, instance, **kwargs):
+    instance._previous_flow_id = (
+        Campaign.objects.filter(pk=instance.pk)
+        .values_list("flow_id", flat=True)
+        .first()
+        if instance.pk
+        else None
+    )
+    if instance._previous_flow_id not in (None, instance.flow_id):
+        instance._audience_changes = _enrollment_audience_changes(instance, False, None)
+
+
+@receiver(post_save, sender=Campaign)
+def campaign_saved(sender, instance, created, **kwargs):
+    """Moving a campaign to another flow takes its audience along"""
+    previous_flow_id = instance._previous_flow_id
+    if previous_flow_id and previous_flow_id != instance.flow_id:
+        _apply_audience_changes(instance._audience_changes, -1)
+        _apply_audience_changes(_enrollment_audience_changes(instance, False, None))
+
+
+@receiver(post_delete, sender=Campaign)
+def campaign_deleted(sender, instance, **kwargs):
+    # Recounted: deleting several campaigns sends every pre_delete before any
+    # enrollment goes, so their audiences can't be told apart up front
+    _refresh_flow_audience([instance.flow_id])
+
+
+@receiver(pre_delete, sender=Customer)
+def remember_customer_flows(sender, instance, **kwargs):
+    instance._audience_changes = _enrollment_audience_changes(instance, True, None)
+
+
+@receiver(post_delete, sender=Customer)
+def customer_deleted(sender, instance, **kwargs):
+    _apply_audience_changes(instance._audience_changes, -1)
+
+
+def invalidate_cached_responses(sender, **kwargs):
+    """Drop cached API responses built from the changed model"""
+    if sender is Campaign.customers.through:
+        if not kwargs["action"].startswith("post_"):
+            return
+        invalidate_model(Campaign)
+        invalidate_model(Flow)
+    else:
+        # Saves limited to update_fields only invalidate those columns
+        update_fields = None if kwargs.get("created") else kwargs.get("update_fields")
+        invalidate_model(sender, update_fields and sorted(update_fields))
+        if sender is Customer and "created" not in kwargs:
+            # Deleting a customer silently drops its enrollment rows
+            invalidate_model(Campaign)
+
+
+def invalidate_profile_fields(sender, **kwargs):
+    """Profile fields are served (and segmented on) as customer fields"""
+    update_fields = None if kwargs.get("created") else kwargs.get("update_fields")
+    invalidate_model(Customer, sorted(update_fields or PROFILE_FIELDS))
+
+
+post_save.connect(invalidate_profile_fields, sender=CustomerProfile)
+post_delete.connect(invalidate_profile_fields, sender=CustomerProfile)
+
+
+# Suppression isn't served from the response cache; its version tells the
+# in-memory suppression list to reload
+for model in (*CACHED_MODELS, Suppression):
+    post_save.connect(invalidate_cached_responses, sender=model)
+    post_delete.connect(invalidate_cached_responses, sender=model)
+m2m_changed.connect(invalidate_cached_responses, sender=Campaign.customers.through)
+
+
+def record_saved_change(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        operation = ChangeLog.CREATE if created else ChangeLog.UPDATE
+        record_changes(sender, [instance.pk], operation)
+
+
+def record_deleted_change(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], ChangeLog.DELETE)
+
+
+@receiver(m2m_changed, sender=Campaign.customers.through)
+def record_enrollment_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Enrollment changes are reported as updates of the campaign"""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        record_changes(Campaign, [instance.pk])
+    elif action == "post_clear":
+        record_changes(Campaign, instance._enrolled_campaign_ids)
+    elif pk_set:
+        record_changes(Campaign, sorted(pk_set))
+
+
+@receiver(m2m_changed, sender=Campaign.customers.through)
+def remember_enrolled_campaigns(sender, instance, action, reverse, **kwargs):
+    if reverse and action == "pre_clear":
+        instance._enrolled_campaign_ids = list(
+            instance.campaigns.values_list("pk", flat=True)
+        )
+
+
+def record_profile_change(sender, instance, raw=False, origin=None, **kwargs):
+    """Profile fields are part of the customer's change data"""
+    if raw:
+        return
+    # Deleting the customer cascades to its profile and is logged as such
+    if getattr(origin, "model", type(origin)) is Customer:
+        return
+    record_changes(Customer, [instance.customer_id])
+
+
+for model in TRACKED_MODELS.values():
+    post_save.connect(record_saved_change, sender=model)
+    post_delete.connect(record_deleted_change, sender=model)
+post_save.connect(record_profile_change, sender=CustomerProfile)
+post_delete.connect(record_profile_change, sender=CustomerProfile)
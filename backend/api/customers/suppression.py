@@ -0,0 +1,218 @@
+"""Send-time suppression and frequency capping.
+
+Every recipient is checked against ``email_subscribed``, the suppression
+list and a per-customer cap on marketing sends (``FREQUENCY_CAP_MAX_SENDS``
+across all campaigns in the last ``FREQUENCY_CAP_WINDOW_DAYS``).
+
+The suppression list is held in memory as a sorted array of 64-bit email
+hashes behind a Bloom filter, so the common "not suppressed" answer never
+touches the array. It is reloaded when the table's row count or highest id
+changes, checked in the database before every batch, so additions from
+other processes (``import_suppressions``, other workers) apply right away;
+in-process writes also reload it through the Suppression cache version.
+Recipients are checked in batches with one query per batch, which also
+counts each customer's sends inside the sliding window from the event log.
+"""
+
+import hashlib
+import math
+import threading
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import get_model_versions
+from .events import EventRow, insert_events
+from .models import Customer, Event, Suppression
+from .tenants import current_tenant
+
+CHECK_BATCH_SIZE = 5000
+
+UNKNOWN = "unknown"
+UNSUBSCRIBED = "unsubscribed"
+SUPPRESSED = "suppressed"
+FREQUENCY_CAPPED = "frequency_capped"
+REJECTION_REASONS = [UNKNOWN, UNSUBSCRIBED, SUPPRESSED, FREQUENCY_CAPPED]
+
+CheckResult = namedtuple("CheckResult", ["allowed", "rejected"])
+
+
+def email_hashes(emails):
+    """64-bit hashes of normalized email addresses"""
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(email.strip().lower().encode(), digest_size=8).digest(),
+                "little",
+            )
+            for email in emails
+        ],
+        dtype=np.uint64,
+    )
+
+
+class BloomFilter:
+    """Bloom filter over 64-bit hashes, using double hashing for the k probes"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.probes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, hashes):
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.probes, dtype=np.uint64)
+        return (low[:, None] + steps * high[:, None]) % np.uint64(self.size)
+
+    def add(self, hashes):
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(
+            self.bits,
+            positions >> np.uint64(3),
+            np.left_shift(1, positions & 7).astype(np.uint8),
+        )
+
+    def might_contain(self, hashes):
+        """Boolean array; False means definitely not present"""
+        positions = self._positions(hashes)
+        bits = self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7))
+        return (bits & 1).astype(bool).all(axis=1)
+
+
+class SuppressionList:
+    def __init__(self, emails=()):
+        self.hashes = np.unique(email_hashes(emails))
+        self.bloom = BloomFilter(
+            len(self.hashes), settings.SUPPRESSION_BLOOM_ERROR_RATE
+        )
+        self.bloom.add(self.hashes)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @classmethod
+    def load(cls):
+        emails = Suppression.objects.values_list("email", flat=True)
+        return cls(emails.iterator(chunk_size=50000))
+
+    def contains(self, emails):
+        """Boolean array telling which of ``emails`` are suppressed"""
+        hashes = email_hashes(emails)
+        found = self.bloom.might_contain(hashes)
+        # Confirm the Bloom filter's positives against the exact hashes
+        candidates = np.flatnonzero(found)
+        if len(candidates) and len(self.hashes):
+            positions = np.searchsorted(self.hashes, hashes[candidates])
+            positions = np.minimum(positions, len(self.hashes) - 1)
+            found[candidates] = self.hashes[positions] == hashes[candidates]
+        else:
+            found[:] = False
+        return found
+
+
+# Tenant -> (version, SuppressionList)
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def get_suppression_list():
+    """Process-wide suppression list, reloaded after Suppression writes"""
+    # The cache version may be per process, so the table is checked as well
+    version = (
+        *get_model_versions([Suppression]),
+        *Suppression.objects.aggregate(rows=Count("pk"), last=Max("pk")).values(),
+    )
+    tenant = current_tenant()
+    with _load_lock:
+        loaded_version, suppressions = _loaded.get(tenant, (None, None))
+        if loaded_version != version:
+            suppressions = SuppressionList.load()
+            _loaded[tenant] = (version, suppressions)
+        return suppressions
+
+
+class SendGate:
+    """Decide which customers may be sent a marketing email right now"""
+
+    def __init__(self, max_sends=None, window_days=None, suppressions=None):
+        self.max_sends = (
+            settings.FREQUENCY_CAP_MAX_SENDS if max_sends is None else max_sends
+        )
+        self.window = timedelta(
+            days=(
+                settings.FREQUENCY_CAP_WINDOW_DAYS
+                if window_days is None
+                else window_days
+            )
+        )
+        # None: the current process-wide list, looked up for every batch
+        self.suppressions = suppressions
+
+    def _recent_sends(self, since):
+        sends = (
+            Event.objects.filter(
+                customer_id=OuterRef("pk"),
+                event_type=Event.SEND,
+                campaign__isnull=False,
+                occurred_at__gte=since,
+            )
+            .order_by()
+            .values("customer_id")
+            .annotate(sends=Count("pk"))
+            .values("sends")
+        )
+        return Coalesce(Subquery(sends, output_field=IntegerField()), 0)
+
+    def check(self, customer_ids, batch_size=CHECK_BATCH_SIZE):
+        """Split ``customer_ids`` into allowed ids and rejections by reason.
+
+        Returns a CheckResult of (allowed ids, {reason: [ids]}).
+        """
+        customer_ids = list(dict.fromkeys(customer_ids))
+        allowed, rejected = [], {reason: [] for reason in REJECTION_REASONS}
+        since = timezone.now() - self.window
+        for start in range(0, len(customer_ids), batch_size):
+            batch = customer_ids[start : start + batch_size]
+            rows = list(
+                Customer.objects.filter(pk__in=batch)
+                .annotate(recent_sends=self._recent_sends(since))
+                .values_list("pk", "email", "email_subscribed", "recent_sends")
+            )
+            found = {row[0] for row in rows}
+            rejected[UNKNOWN].extend(pk for pk in batch if pk not in found)
+            if not rows:
+                continue
+
+            suppressions = self.suppressions
+            if suppressions is None:
+                suppressions = get_suppression_list()
+            suppressed = suppressions.contains([row[1] for row in rows])
+            for (pk, _, subscribed, sends), is_suppressed in zip(rows, suppressed):
+                if not subscribed:
+                    rejected[UNSUBSCRIBED].append(pk)
+                elif is_suppressed:
+                    rejected[SUPPRESSED].append(pk)
+                elif sends >= self.max_sends:
+                    rejected[FREQUENCY_CAPPED].append(pk)
+                else:
+                    allowed.append(pk)
+        return CheckResult(allowed, rejected)
+
+    def record_sends(self, customer_ids, campaign_id, flow_step_id=None):
+        """Log sends immediately so the next check counts them"""
+        now = timezone.now()
+        insert_events(
+            [
+                EventRow(Event.SEND, campaign_id, flow_step_id, pk, None, now)
+                for pk in customer_ids
+            ]
+        )
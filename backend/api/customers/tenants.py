@@ -0,0 +1,79 @@
+"""Tenant-partitioned storage.
+
+Each tenant (brand) listed in ``TENANTS`` keeps its customers, segments,
+campaigns and events in its own database alias: a separate SQLite file
+locally, or a separate Postgres database or schema elsewhere. Requests pick
+their tenant from the ``TENANT_HEADER`` header or a ``TENANT_HOSTS`` host
+name; ``PrimaryReplicaRouter`` then sends every query for the ``customers``
+app to that tenant's database, so one tenant's queries never scan another's
+rows and a tenant can be moved to another node by changing its URL.
+Requests without a tenant use the default database.
+
+Outside of a request (management commands, background jobs) wrap the work
+in ``use_tenant(name)``, or run ``manage.py tenant_command``.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+# App whose tables live in the tenant databases; everything else (auth,
+# sessions, admin) stays in the default database
+TENANT_APPS = ("customers",)
+
+_tenant = ContextVar("tenant", default=None)
+
+
+def current_tenant():
+    return _tenant.get()
+
+
+def tenant_database(tenant=None):
+    """Database alias holding the (current) tenant's data"""
+    tenant = tenant or _tenant.get()
+    return settings.TENANTS[tenant] if tenant else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_tenant(tenant):
+    """Route queries made inside the block to ``tenant``'s database"""
+    if tenant is not None and tenant not in settings.TENANTS:
+        raise ValueError(f"Unknown tenant: {tenant}")
+    token = _tenant.set(tenant)
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def tenant_from_request(request):
+    """Tenant named by the request, or None; unknown names raise ValueError"""
+    tenant = request.headers.get(settings.TENANT_HEADER)
+    if not tenant:
+        tenant = settings.TENANT_HOSTS.get(request.get_host().split(":")[0])
+    if tenant and tenant not in settings.TENANTS:
+        raise ValueError(f"Unknown tenant: {tenant}")
+    return tenant or None
+
+
+class TenantMiddleware(MiddlewareMixin):
+    """Select the request's tenant database"""
+
+    def process_request(self, request):
+        try:
+            request.tenant = tenant_from_request(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=404)
+        _tenant.set(request.tenant)
+
+    def process_response(self, request, response):
+        # As with replica routing, streamed responses keep the tenant while
+        # they are consumed, and under ASGI the state is cleared rather than
+        # reset with a token
+        if not response.streaming:
+            _tenant.set(None)
+        return response
@@ -1,3 +1,1749 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import sys
+import tempfile
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.db_routing import PrimaryReplicaRouter, ReplicaRoutingMiddleware
+
+from .ai import AIProvider, RuleBasedProvider, get_provider
+from .bitmaps import SegmentBitmap
+from .cache import get_model_versions, invalidate_model
+from .events import event_buffer
+from .forecast import forecast_start
+from .experiments import annotate_variant, assignment_bucket, variant_counts
+from .export import iter_ndjson
+from .lookalike import FeatureStore
+from .models import (
+    Customer,
+    CustomerProfile,
+    Segment,
+    Flow,
+    FlowStep,
+    Campaign,
+    Event,
+    EventRollup,
+    RollupWatermark,
+    Suppression,
+    ChangeLog,
+    relative_date_now,
+)
+from .parallel import (
+    _discard_pool,
+    _get_pool,
+    evaluate_segment,
+    partition_ranges,
+)
+from .planner import index_candidate, recommend_indexes
+from .rfm import compute_rfm_scores, quintile_scores
+from .rollups import _aggregate_day, rebuild_days, update_rollups
+from .segment_cache import normalize_conditions, result_versions
+from .sendtime import compute_send_times, send_hour_q
+from .serializers import CustomerSerializer
+from .suppression import BloomFilter, SendGate, email_hashes
+from .tenants import current_tenant, use_tenant
+from .views import CustomerViewSet
+from .writer import write_queue
+
+
+def create_customers(count, prefix="customer"):
+    return [
+        Customer.objects.create(
+            email=f"{prefix}{i}@example.com",
+            first_name="Test",
+            last_name=f"Customer {i}",
+        )
+        for i in range(count)
+    ]
+
+
+def create_campaign(name, customers=()):
+    segment = Segment.objects.create(name=f"{name} segment", conditions=[])
+    flow = Flow.objects.create(name=f"{name} flow")
+    for step_number in range(1, 4):
+        FlowStep.objects.create(
+            flow=flow,
+            step_number=step_number,
+            email_subject=f"Step {step_number}",
+            email_content="Hello",
+        )
+    campaign = Campaign.objects.create(name=name, segment=segment, flow=flow)
+    campaign.customers.add(*customers)
+    return campaign
+
+
+# Replica and writer-thread connections can't see data written inside a
+# test's transaction
+@override_settings(DATABASE_REPLICAS=[], WRITE_QUEUE_ENABLED=False)
+class APITestCase(TestCase):
+    def setUp(self):
+        # Cached responses outlive the per-test database rollback
+        cache.clear()
+        self.client = APIClient()
+
+
+class ListQueryCountTests(APITestCase):
+    """Listing endpoints must not issue a query per row."""
+
+    def setUp(self):
+        super().setUp()
+        self.customers = create_customers(3)
+
+    def assert_constant_queries(self, url, num_queries):
+        create_campaign("first", self.customers)
+        with self.assertNumQueries(num_queries):
+            self.client.get(url)
+
+        for i in range(5):
+            create_campaign(f"extra {i}", self.customers[:i])
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_campaign_list(self):
+        response = self.assert_constant_queries("/api/campaigns/", 2)
+        counts = {row["name"]: row["customer_count"] for row in response.json()}
+        self.assertEqual(counts["first"], 3)
+        self.assertEqual(counts["extra 2"], 2)
+        self.assertEqual(response.json()[0]["segment_name"], "first segment")
+
+    def test_flow_list(self):
+        response = self.assert_constant_queries("/api/flows/", 2)
+        self.assertEqual(len(response.json()[0]["steps"]), 3)
+
+    def test_flow_step_list(self):
+        response = self.assert_constant_queries("/api/flow-steps/", 1)
+        self.assertNotIn("steps", response.json()[0])
+
+
+class FlowAudienceTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customers = create_customers(4)
+
+    def test_audience_count_follows_enrollment(self):
+        first = create_campaign("first", self.customers[:3])
+        flow = first.flow
+        second = Campaign.objects.create(
+            name="second", segment=first.segment, flow=flow
+        )
+        second.customers.add(*self.customers[1:])
+        flow.refresh_from_db()
+        self.assertEqual(flow.audience_count, 4)
+
+        second.customers.remove(self.customers[3])
+        self.customers[0].campaigns.clear()
+        flow.refresh_from_db()
+        self.assertEqual(flow.audience_count, 2)
+
+        second.flow = Flow.objects.create(name="other")
+        second.save()
+        flow.refresh_from_db()
+        self.assertEqual(flow.audience_count, 2)
+        second.flow.refresh_from_db()
+        self.assertEqual(second.flow.audience_count, 2)
+
+        self.customers[1].delete()
+        flow.refresh_from_db()
+        self.assertEqual(flow.audience_count, 1)
+
+    def test_enrollment_changes_apply_deltas(self):
+        campaign = create_campaign("first", self.customers[:2])
+        other = Campaign.objects.create(
+            name="other", segment=campaign.segment, flow=campaign.flow
+        )
+        other.customers.add(self.customers[1])
+        flow = campaign.flow
+        # Deltas apply on top of the stored count instead of recounting it
+        Flow.objects.filter(pk=flow.pk).update(audience_count=10)
+
+        campaign.customers.add(*self.customers[2:])
+        flow.refresh_from_db()
+        self.assertEqual(flow.audience_count, 12)
+        # Still enrolled through the other campaign
+        campaign.customers.remove(self.customers[1])
+        # Not enrolled at all
+        other.customers.remove(self.customers[3])
+        flow.refresh_from_db()
+        self.assertEqual(flow.audience_count, 12)
+        self.customers[2].campaigns.clear()
+        campaign.customers.clear()
+        flow.refresh_from_db()
+        self.assertEqual(flow.audience_count, 9)
+
+    def test_previews_return_distinct_customers(self):
+        campaign = create_campaign("first", self.customers[:3])
+        Campaign.objects.create(
+            name="second", segment=campaign.segment, flow=campaign.flow
+        ).customers.add(*self.customers)
+        step = campaign.flow.steps.first()
+
+        for url in (
+            f"/api/flows/{campaign.flow_id}/preview_customers/",
+            f"/api/flow-steps/{step.pk}/preview/",
+        ):
+            data = self.client.get(url).json()
+            self.assertEqual(data["count"], 4)
+            self.assertEqual(len(data["customers"]), 4)
+
+
+class ResponseCacheTests(APITestCase):
+    def test_repeated_reads_are_cached_with_etag(self):
+        create_campaign("first", create_customers(2))
+        response = self.client.get("/api/campaigns/")
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            cached = self.client.get("/api/campaigns/")
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached["ETag"], etag)
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get("/api/campaigns/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_query_params_are_part_of_the_key(self):
+        create_customers(1)
+        self.client.get("/api/customers/")
+        with self.assertNumQueries(1):
+            self.client.get("/api/customers/?page=2")
+
+    def test_writes_invalidate_dependent_endpoints(self):
+        campaign = create_campaign("first")
+        etag = self.client.get("/api/campaigns/")["ETag"]
+        self.client.get("/api/customers/")
+
+        campaign.segment.name = "renamed"
+        campaign.segment.save()
+        response = self.client.get("/api/campaigns/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()[0]["segment_name"], "renamed")
+
+        # Customers don't depend on segments, so that entry is still valid
+        with self.assertNumQueries(0):
+            self.client.get("/api/customers/")
+
+        campaign.customers.add(*create_customers(2))
+        data = self.client.get("/api/campaigns/").json()
+        self.assertEqual(data[0]["customer_count"], 2)
+
+    def test_versions_change_again_on_commit(self):
+        (customer,) = create_customers(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                customer.first_name = "Changed"
+                customer.save()
+                # What a reader caching before the commit would be keyed by
+                during = get_model_versions([Customer])
+                segment_versions = result_versions([])
+            self.assertEqual(get_model_versions([Customer]), during)
+        self.assertNotEqual(get_model_versions([Customer]), during)
+        self.assertNotEqual(result_versions([]), segment_versions)
+
+
+class FastListTests(APITestCase):
+    def test_fast_customer_list_matches_serializer(self):
+        customers = create_customers(3)
+        customers[0].lifetime_value = Decimal("1250.50")
+        customers[0].last_order_date = timezone.now() - timedelta(days=45, hours=3)
+        customers[0].first_name = "Zoë\u2028"
+        customers[0].save()
+
+        response = self.client.get("/api/customers/")
+        expected = CustomerSerializer(Customer.objects.all(), many=True).data
+        self.assertEqual(response.json(), json.loads(JSONRenderer().render(expected)))
+        self.assertEqual(response.json()[0]["days_since_last_order"], 45)
+        self.assertEqual(response.json()[0]["lifetime_value"], "1250.50")
+        self.assertNotIn(b"\xe2\x80\xa8", response.content)
+
+
+class SegmentExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        create_customers(5)
+        Customer.objects.filter(email="customer3@example.com").update(
+            email_subscribed=False
+        )
+        self.segment = Segment.objects.create(
+            name="subscribed",
+            conditions=[
+                {"field": "email_subscribed", "operator": "equals", "value": True}
+            ],
+        )
+        self.url = f"/api/segments/{self.segment.pk}/export/"
+
+    def test_csv_export(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:2], ["id", "email"])
+        self.assertEqual(len(lines), 5)
+
+    def test_ndjson_export_in_chunks(self):
+        chunks = list(iter_ndjson(self.segment.get_customers(), chunk_size=2))
+        self.assertEqual(len(chunks), 2)
+
+        response = self.client.get(self.url, {"format": "ndjson"})
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(len(rows), 4)
+        self.assertNotIn("customer3@example.com", [row["email"] for row in rows])
+
+    def test_gzip_export(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        body = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(len(body.splitlines()), 5)
+
+
+class SegmentBitmapTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customers = create_customers(6)
+        for i, customer in enumerate(self.customers):
+            customer.total_orders = i
+            customer.email_subscribed = i % 2 == 0
+            customer.save()
+        self.frequent = Segment.objects.create(
+            name="frequent",
+            conditions=[
+                {"field": "total_orders", "operator": "greater_than", "value": 2}
+            ],
+        )
+        self.subscribed = Segment.objects.create(
+            name="subscribed",
+            conditions=[
+                {"field": "email_subscribed", "operator": "equals", "value": True}
+            ],
+        )
+
+    def test_bitmap_roundtrip(self):
+        ids = [c.pk for c in self.customers[3:]]
+        bitmap = SegmentBitmap.from_bytes(SegmentBitmap.from_ids(ids).to_bytes())
+        self.assertEqual(bitmap.ids(), ids)
+        self.assertEqual(bitmap.count(), 3)
+
+        self.frequent.get_bitmap()
+        self.frequent.refresh_from_db()
+        self.assertIsNotNone(self.frequent.membership_bitmap)
+        self.assertEqual(self.frequent.get_bitmap().ids(), ids)
+
+    def test_combine(self):
+        def combine(operation):
+            expression = {
+                "operation": operation,
+                "segments": [self.frequent.pk, self.subscribed.pk],
+            }
+            return self.client.post(
+                "/api/segments/combine/", {"expression": expression}, format="json"
+            ).json()["count"]
+
+        self.assertEqual(combine("union"), 5)
+        self.assertEqual(combine("intersection"), 1)
+        self.assertEqual(combine("difference"), 2)
+
+    def test_overlap_and_errors(self):
+        data = self.client.post(
+            "/api/segments/overlap/",
+            {"segments": [self.frequent.pk, self.subscribed.pk]},
+            format="json",
+        ).json()
+        self.assertEqual(data["overlap"], [[3, 1], [1, 3]])
+
+        response = self.client.post(
+            "/api/segments/combine/",
+            {"expression": {"operation": "xor", "segments": [self.frequent.pk]}},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            "/api/segments/overlap/", {"segments": [999]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_enroll_campaign_from_expression(self):
+        campaign = create_campaign("first", self.customers[:1])
+        expression = {
+            "operation": "difference",
+            "segments": [self.subscribed.pk, self.frequent.pk],
+        }
+        data = self.client.post(
+            f"/api/campaigns/{campaign.pk}/enroll/",
+            {"expression": expression},
+            format="json",
+        ).json()
+        self.assertEqual(data, {"enrolled": 1, "customer_count": 2})
+        campaign.flow.refresh_from_db()
+        self.assertEqual(campaign.flow.audience_count, 2)
+
+    @override_settings(ENROLL_CHUNK_SIZE=2)
+    def test_large_enrollments_are_queued_in_chunks(self):
+        campaign = create_campaign("first")
+        segment = Segment.objects.create(name="everyone", conditions=[])
+        with mock.patch.object(
+            write_queue, "submit", wraps=write_queue.submit
+        ) as submit:
+            data = self.client.post(
+                f"/api/campaigns/{campaign.pk}/enroll/",
+                {"expression": segment.pk},
+                format="json",
+            ).json()
+        self.assertEqual(data["enrolled"], len(self.customers))
+        self.assertEqual(data["customer_count"], len(self.customers))
+        chunks = [call.args[1] for call in submit.call_args_list]
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 2])
+
+
+class ParallelEvaluationTests(APITestCase):
+    def test_partitions_cover_the_id_range(self):
+        ranges = partition_ranges(3, 20, 4)
+        self.assertEqual(ranges[0][0], 3)
+        self.assertEqual(ranges[-1][1], 21)
+        for (_, high), (low, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(high, low)
+        self.assertEqual(partition_ranges(5, 5, 8), [(5, 6)])
+
+    def test_pool_is_kept_between_calls(self):
+        pool = _get_pool(2)
+        self.assertIs(_get_pool(2), pool)
+        self.assertEqual(pool._mp_context.get_start_method(), "spawn")
+        resized = _get_pool(3)
+        self.addCleanup(_discard_pool, resized)
+        self.assertIsNot(resized, pool)
+        self.assertIs(_get_pool(3), resized)
+
+    def test_partitioned_results_match_a_single_scan(self):
+        customers = create_customers(30)
+        for customer in customers[::3]:
+            customer.email_subscribed = False
+            customer.save()
+        segment = Segment.objects.create(
+            name="subscribed",
+            conditions=[
+                {"field": "email_subscribed", "operator": "equals", "value": True}
+            ],
+        )
+        expected = list(segment.get_customers().values_list("pk", flat=True))
+
+        self.assertEqual(evaluate_segment(segment), 20)
+        self.assertEqual(evaluate_segment(segment, collect_ids=True).tolist(), expected)
+
+        campaign = Campaign.objects.create(
+            name="subscribed", segment=segment, flow=Flow.objects.create(name="f")
+        )
+        self.assertEqual(campaign.enroll_customers_from_segment(), 20)
+        self.assertEqual(campaign.customers.count(), 20)
+
+
+class RFMScoringTests(APITestCase):
+    def test_quintile_scores(self):
+        values = np.arange(10, dtype=np.float64)
+        self.assertEqual(
+            quintile_scores(values).tolist(), [1, 1, 2, 2, 3, 3, 4, 4, 5, 5]
+        )
+        self.assertEqual(
+            quintile_scores(values, higher_is_better=False).tolist()[:2], [5, 5]
+        )
+        self.assertEqual(quintile_scores(np.array([np.inf, np.inf])).tolist(), [1, 1])
+
+    def test_scores_are_stored_and_usable_in_segments(self):
+        customers = create_customers(10)
+        now = timezone.now()
+        for i, customer in enumerate(customers):
+            customer.total_orders = i
+            customer.lifetime_value = Decimal(i * 100)
+            customer.last_order_date = now - timedelta(days=i * 30) if i else None
+            customer.save()
+
+        self.assertEqual(compute_rfm_scores(batch_size=3, chunk_size=4), 10)
+
+        best, lapsed = Customer.objects.get(pk=customers[9].pk), customers[0]
+        lapsed.refresh_from_db()
+        self.assertEqual(best.rfm_frequency, 5)
+        self.assertEqual(best.rfm_monetary, 5)
+        self.assertEqual(best.rfm_recency, 1)
+        self.assertEqual(best.rfm_segment, "cant_lose")
+        self.assertEqual(lapsed.rfm_score, 111)
+
+        segment = Segment.objects.create(
+            name="lapsed high value",
+            conditions=[
+                {"field": "rfm_segment", "operator": "equals", "value": "cant_lose"},
+                {"field": "rfm_score", "operator": "greater_than", "value": "100"},
+            ],
+        )
+        self.assertIn(best, segment.get_customers())
+
+    def test_batches_commit_separately(self):
+        create_customers(3)
+        with mock.patch(
+            "customers.rfm.record_changes", side_effect=[None, RuntimeError]
+        ):
+            with self.assertRaises(RuntimeError):
+                compute_rfm_scores(batch_size=1)
+        self.assertEqual(Customer.objects.filter(rfm_score__isnull=False).count(), 1)
+        self.assertEqual(compute_rfm_scores(batch_size=1), 3)
+        self.assertFalse(Customer.objects.filter(rfm_score__isnull=True).exists())
+
+    def test_only_moved_scores_are_logged(self):
+        customers = create_customers(5)
+        for i, customer in enumerate(customers):
+            Customer.objects.filter(pk=customer.pk).update(total_orders=i)
+        logged = ChangeLog.objects.filter(model="customer")
+        compute_rfm_scores()
+        self.assertEqual(logged.count(), 5 + 5)
+
+        compute_rfm_scores()
+        self.assertEqual(logged.count(), 10)
+        Customer.objects.filter(pk=customers[0].pk).update(total_orders=10)
+        compute_rfm_scores()
+        # The first customer now has the most orders, everyone else moves down
+        self.assertEqual(logged.count(), 15)
+        Customer.objects.filter(pk=customers[0].pk).update(total_orders=11)
+        compute_rfm_scores()
+        self.assertEqual(logged.count(), 15)
+
+
+class LookalikeTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.features_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.features_dir.cleanup)
+        override = override_settings(LOOKALIKE_FEATURES_DIR=self.features_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.customers = create_customers(12)
+        for i, customer in enumerate(self.customers):
+            customer.lifetime_value = Decimal(1000 + i if i < 6 else i)
+            customer.total_orders = 10 if i < 6 else 1
+            customer.state = "TX" if i < 6 else "CA"
+            customer.save()
+        self.segment = Segment.objects.create(
+            name="big spenders",
+            conditions=[
+                {"field": "lifetime_value", "operator": "greater_than", "value": 1002}
+            ],
+        )
+
+    def lookalike(self):
+        return self.client.post(
+            f"/api/segments/{self.segment.pk}/lookalike/", {"size": 3}, format="json"
+        )
+
+    def test_lookalike_ranks_similar_non_members_first(self):
+        self.assertEqual(self.lookalike().status_code, 503)
+
+        FeatureStore().build()
+        data = self.lookalike().json()
+        self.assertEqual(data["seed_count"], 3)
+        self.assertEqual(
+            sorted(data["customer_ids"]), [c.pk for c in self.customers[:3]]
+        )
+        self.assertEqual(len(data["customers"]), 3)
+
+    def test_stale_features_refresh_in_the_background(self):
+        FeatureStore().build()
+        threads = []
+        start = FeatureStore.refresh_in_background
+
+        def refresh_in_background(store, max_age):
+            threads.append(start(store, max_age))
+            return threads[-1]
+
+        with mock.patch.object(
+            FeatureStore, "refresh_in_background", refresh_in_background
+        ), mock.patch.object(FeatureStore, "refresh") as refresh:
+            self.assertEqual(self.lookalike().status_code, 200)
+            self.assertEqual(threads, [None])
+            with override_settings(LOOKALIKE_REFRESH_SECONDS=0):
+                self.assertEqual(self.lookalike().status_code, 200)
+            threads[-1].join(timeout=5)
+        refresh.assert_called_once_with()
+
+    def test_refresh_patches_changed_rows(self):
+        store = FeatureStore()
+        self.assertEqual(store.refresh(), 12)
+        self.assertEqual(store.refresh(), 0)
+
+        ids, matrix, _ = store.load()
+        before = np.array(matrix[0])
+        customer = self.customers[0]
+        customer.state = "CA"
+        customer.save()
+        self.assertEqual(store.refresh(), 1)
+        ids, matrix, _ = store.load()
+        self.assertFalse(np.array_equal(before, matrix[0]))
+
+        # New customers are appended without a rebuild
+        new = create_customers(2, prefix="new")
+        with mock.patch.object(store, "_build") as build:
+            self.assertEqual(store.refresh(), 2)
+        build.assert_not_called()
+        ids, matrix, _ = store.load()
+        self.assertEqual(ids[-2:].tolist(), [c.pk for c in new])
+        self.assertEqual(matrix.shape[0], 14)
+        self.assertEqual(
+            sorted(path.name for path in store.directory.iterdir()),
+            ["features.npy", "ids.npy", "meta.json", "swap.lock", "write.lock"],
+        )
+
+
+@override_settings(EVENT_FLUSH_INTERVAL=0, EVENT_BUFFER_SIZE=3)
+class EventIngestionTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.campaign = create_campaign("first")
+        self.customer = create_customers(1)[0]
+
+    def event(self, event_type, **extra):
+        return {
+            "event_type": event_type,
+            "campaign": self.campaign.pk,
+            "customer": self.customer.pk,
+            **extra,
+        }
+
+    def test_events_are_buffered_coalesced_and_flushed(self):
+        response = self.client.post(
+            "/api/events/batch/",
+            {"events": [self.event("open"), self.event("open")]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"received": 2, "accepted": 1})
+        self.assertEqual(Event.objects.count(), 0)
+
+        self.client.post(
+            "/api/events/batch/",
+            {"events": [self.event("click"), self.event("conversion", revenue="9.99")]},
+            format="json",
+        )
+        self.assertEqual(Event.objects.count(), 3)
+        self.assertEqual(
+            Event.objects.get(event_type="conversion").revenue, Decimal("9.99")
+        )
+
+        self.client.post(
+            "/api/events/batch/", {"events": [self.event("open")]}, format="json"
+        )
+        self.assertEqual(event_buffer.flush(), 1)
+
+    def test_invalid_events_are_rejected(self):
+        for event in (
+            self.event("bounce"),
+            {"event_type": "open"},
+            self.event("send", occurred_at="yesterday"),
+            self.event("conversion", revenue="NaN"),
+            self.event("conversion", revenue="Infinity"),
+            self.event("conversion", revenue="1e20"),
+            self.event("conversion", revenue="1.005"),
+        ):
+            response = self.client.post(
+                "/api/events/batch/", {"events": [event]}, format="json"
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(event_buffer), 0)
+
+    def test_failed_flush_keeps_the_events(self):
+        self.client.post(
+            "/api/events/batch/",
+            {"events": [self.event("open"), self.event("click")]},
+            format="json",
+        )
+        with mock.patch(
+            "customers.events.insert_events", side_effect=IntegrityError("down")
+        ):
+            with self.assertRaises(IntegrityError):
+                event_buffer.flush()
+        self.assertEqual(len(event_buffer), 2)
+        # Still coalesced with the requeued open
+        self.client.post(
+            "/api/events/batch/", {"events": [self.event("open")]}, format="json"
+        )
+        self.assertEqual(event_buffer.flush(), 2)
+        self.assertEqual(Event.objects.count(), 2)
+
+    def test_prune_events(self):
+        Event.objects.bulk_create(
+            [
+                Event(
+                    event_type="send",
+                    customer=self.customer,
+                    occurred_at=timezone.now() - timedelta(days=days),
+                )
+                for days in (1, 100, 400)
+            ]
+        )
+        call_command("prune_events", days=90, batch_size=1, stdout=io.StringIO())
+        self.assertEqual(Event.objects.count(), 1)
+
+
+class EventRollupTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.campaign = create_campaign("first")
+        self.step = self.campaign.flow.steps.first()
+        self.customer = create_customers(1)[0]
+        self.day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def log(self, event_type, hours=1, **extra):
+        return Event.objects.create(
+            event_type=event_type,
+            campaign=self.campaign,
+            flow_step=self.step,
+            customer=self.customer,
+            occurred_at=self.day - timedelta(hours=hours),
+            **extra,
+        )
+
+    def test_incremental_rollups_and_stats(self):
+        self.log("send")
+        self.log("open")
+        self.assertEqual(update_rollups(), 2)
+        self.assertEqual(update_rollups(), 0)
+
+        self.log("send", hours=30)
+        self.log("conversion", revenue=Decimal("20.50"))
+        self.assertEqual(update_rollups(), 2)
+
+        with self.assertNumQueries(4):
+            stats = self.client.get(f"/api/campaigns/{self.campaign.pk}/stats/").json()
+        self.assertEqual(stats["totals"]["sent"], 2)
+        self.assertEqual(stats["totals"]["opened"], 1)
+        self.assertEqual(stats["totals"]["converted"], 1)
+        self.assertEqual(Decimal(str(stats["totals"]["revenue"])), Decimal("20.50"))
+        self.assertEqual(len(stats["daily"]), 2)
+        self.assertEqual(stats["steps"][0]["flow_step_id"], self.step.pk)
+        self.assertEqual(
+            EventRollup.objects.filter(period="hour", sent__gt=0).count(), 2
+        )
+
+    def test_stats_follow_new_rollups(self):
+        url = f"/api/campaigns/{self.campaign.pk}/stats/"
+        self.assertEqual(self.client.get(url).json()["totals"]["sent"], 0)
+        self.log("send")
+        update_rollups()
+        self.assertEqual(self.client.get(url).json()["totals"]["sent"], 1)
+
+    def test_events_settle_before_folding_outside_sqlite(self):
+        seen = RollupWatermark.objects.filter(name="event_rollups_seen")
+
+        def age_note():
+            seen.update(updated_at=timezone.now() - timedelta(minutes=2))
+
+        with mock.patch("customers.rollups.commit_lag", return_value=60):
+            self.log("send")
+            # The first run only notes the highest id
+            self.assertEqual(update_rollups(), 0)
+            self.log("open")
+            self.assertEqual(update_rollups(), 0)
+            # Once that note is old enough its events are folded, and the
+            # newer event waits for the next note to age
+            age_note()
+            self.assertEqual(update_rollups(), 1)
+            self.assertEqual(update_rollups(), 0)
+            age_note()
+            self.assertEqual(update_rollups(), 1)
+            age_note()
+            self.assertEqual(update_rollups(), 0)
+        self.assertEqual(EventRollup.objects.get(period="day").opened, 1)
+
+    def test_backfill_rebuilds_days(self):
+        for hours in (1, 2, 26):
+            self.log("click", hours=hours)
+        update_rollups()
+        EventRollup.objects.update(clicked=0)
+
+        self.log("click", hours=3)
+        call_command("backfill_event_rollups", stdout=io.StringIO())
+        rebuilt = EventRollup.objects.values_list("period", "clicked")
+        self.assertEqual(len(rebuilt), 6)
+        self.assertEqual(sum(c for period, c in rebuilt if period == "day"), 4)
+        self.assertEqual(sum(c for period, c in rebuilt if period == "hour"), 4)
+        self.assertEqual(update_rollups(), 0)
+
+    def test_rebuild_keeps_events_folded_meanwhile(self):
+        self.log("click")
+        calls = []
+
+        def fold_another(*args):
+            if not calls:
+                # update_rollups running while the day is being aggregated
+                self.log("click", hours=2)
+                update_rollups()
+            calls.append(args)
+            return _aggregate_day(*args)
+
+        with mock.patch("customers.rollups._aggregate_day", fold_another):
+            rebuild_days([self.day - timedelta(days=1)])
+        # The events folded meanwhile are aggregated again under the lock
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(EventRollup.objects.get(period="day").clicked, 2)
+        self.assertEqual(
+            sorted(EventRollup.objects.filter(period="hour").values_list("clicked")),
+            [(1,), (1,)],
+        )
+
+
+class SendGateTests(APITestCase):
+    def test_bloom_filter_has_no_false_negatives(self):
+        hashes = email_hashes([f"user{i}@example.com" for i in range(1000)])
+        bloom = BloomFilter(1000, 0.01)
+        bloom.add(hashes)
+        self.assertTrue(bloom.might_contain(hashes).all())
+        others = email_hashes([f"other{i}@example.com" for i in range(1000)])
+        self.assertLess(bloom.might_contain(others).sum(), 50)
+
+    def test_check_applies_unsubscribes_suppressions_and_caps(self):
+        subscribed, unsubscribed, suppressed, capped = create_customers(4)
+        Customer.objects.filter(pk=unsubscribed.pk).update(email_subscribed=False)
+        Suppression.objects.create(email=suppressed.email.upper())
+        campaign = create_campaign("capped")
+
+        gate = SendGate(max_sends=2)
+        gate.record_sends([capped.pk, capped.pk], campaign.pk)
+        # Sends outside the window don't count
+        Event.objects.create(
+            event_type="send",
+            campaign=campaign,
+            customer=subscribed,
+            occurred_at=timezone.now() - timedelta(days=30),
+        )
+
+        ids = [subscribed.pk, unsubscribed.pk, suppressed.pk, capped.pk, 999999]
+        # Per batch the recipients and the suppression list's row count,
+        # plus loading the list once
+        with self.assertNumQueries(5):
+            result = SendGate(max_sends=2).check(ids, batch_size=3)
+        self.assertEqual(result.allowed, [subscribed.pk])
+        self.assertEqual(result.rejected["unsubscribed"], [unsubscribed.pk])
+        self.assertEqual(result.rejected["suppressed"], [suppressed.pk])
+        self.assertEqual(result.rejected["frequency_capped"], [capped.pk])
+        self.assertEqual(result.rejected["unknown"], [999999])
+
+    def test_suppressions_added_elsewhere_apply_right_away(self):
+        customers = create_customers(2)
+        gate = SendGate()
+        self.assertEqual(
+            gate.check([c.pk for c in customers]).allowed, [c.pk for c in customers]
+        )
+
+        # As written by another process: no signals, and this process's
+        # cache version is unchanged
+        Suppression.objects.bulk_create([Suppression(email=customers[0].email)])
+        self.assertEqual(
+            gate.check([c.pk for c in customers]).allowed, [customers[1].pk]
+        )
+
+    def test_check_recipients_endpoint(self):
+        customers = create_customers(2)
+        campaign = create_campaign("enrolled", customers)
+        Suppression.objects.create(email=customers[1].email)
+        response = self.client.post(
+            f"/api/campaigns/{campaign.pk}/check_recipients/", {}, format="json"
+        )
+        self.assertEqual(response.json()["allowed"], [customers[0].pk])
+        self.assertEqual(response.json()["rejected"], {"suppressed": [customers[1].pk]})
+
+        response = self.client.post(
+            f"/api/campaigns/{campaign.pk}/check_recipients/",
+            {"customer_ids": "1,2"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class VariantAssignmentTests(APITestCase):
+    def test_sql_buckets_match_python(self):
+        create_customers(50)
+        campaign = create_campaign("split")
+        campaign.variants = [{"name": "A", "weight": 1}, {"name": "B", "weight": 3}]
+        campaign.holdout_percent = 10
+        campaign.save()
+
+        rows = annotate_variant(Customer.objects.all(), campaign).values_list(
+            "pk", "assignment_bucket", "variant"
+        )
+        for pk, bucket, variant in rows:
+            self.assertEqual(bucket, assignment_bucket(campaign.pk, pk))
+            if bucket < 1000:
+                expected = "holdout"
+            else:
+                expected = "A" if bucket < 3250 else "B"
+            self.assertEqual(variant, expected)
+
+    def test_sql_buckets_match_python_for_large_ids(self):
+        customers = create_customers(22)
+        # Ids above PRIME wrap around in both versions
+        Customer.objects.filter(pk=customers[0].pk).update(id=2**40 + 3)
+
+        rows = annotate_variant(
+            Customer.objects.all(), Campaign(pk=777777)
+        ).values_list("pk", "assignment_bucket")
+        for pk, bucket in rows:
+            self.assertEqual(bucket, assignment_bucket(777777, pk))
+
+    def test_split_is_stable_and_counted_in_one_query(self):
+        customers = create_customers(400)
+        campaign = create_campaign("split", customers)
+        response = self.client.patch(
+            f"/api/campaigns/{campaign.pk}/",
+            {"variants": [{"name": "A"}, {"name": "B"}], "holdout_percent": 20},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        campaign.refresh_from_db()
+
+        with self.assertNumQueries(1):
+            counts = variant_counts(campaign, campaign.customers.all())
+        self.assertEqual(sum(counts.values()), 400)
+        self.assertTrue(50 < counts["holdout"] < 110, counts)
+        self.assertEqual(
+            self.client.get(f"/api/campaigns/{campaign.pk}/variants/").json(), counts
+        )
+
+        variant_a = set(campaign.get_recipients("A").values_list("pk", flat=True))
+        recipients = set(campaign.get_recipients().values_list("pk", flat=True))
+        self.assertEqual(len(recipients), 400 - counts["holdout"])
+        campaign.customers.clear()
+        campaign.enroll_customer_ids([customer.pk for customer in customers])
+        self.assertEqual(
+            set(campaign.get_recipients("A").values_list("pk", flat=True)), variant_a
+        )
+
+    def test_invalid_variants_are_rejected(self):
+        campaign = create_campaign("split")
+        for variants in ([{"weight": 1}], [{"name": "A"}, {"name": "A"}]):
+            response = self.client.patch(
+                f"/api/campaigns/{campaign.pk}/", {"variants": variants}, format="json"
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class SendTimeTests(APITestCase):
+    def engage(self, customer, hour, event_type="open"):
+        occurred_at = timezone.now().replace(hour=hour) - timedelta(days=1)
+        Event.objects.create(
+            event_type=event_type, customer=customer, occurred_at=occurred_at
+        )
+
+    def test_best_hours_are_computed_incrementally(self):
+        texan, unknown, orderer, idle = create_customers(4)
+        Customer.objects.filter(pk=texan.pk).update(state="TX")
+        self.engage(texan, 15)
+        self.engage(texan, 20, "click")
+        self.engage(unknown, 8)
+        Customer.objects.filter(pk=orderer.pk).update(
+            last_order_date=timezone.now().replace(hour=18), state="CA"
+        )
+
+        self.assertEqual(compute_send_times(), 4)
+        hours = dict(Customer.objects.values_list("pk", "best_send_hour"))
+        # UTC 20:00 is 14:00 in Texas; a click outweighs an open
+        self.assertEqual(hours[texan.pk], 14)
+        self.assertEqual(hours[unknown.pk], 8)
+        self.assertEqual(hours[orderer.pk], 10)
+        self.assertIsNone(hours[idle.pk])
+
+        self.assertEqual(compute_send_times(), 0)
+        for _ in range(3):
+            self.engage(unknown, 22)
+        self.assertEqual(compute_send_times(), 1)
+        self.assertEqual(Customer.objects.get(pk=unknown.pk).best_send_hour, 22)
+
+    def test_chunks_commit_separately(self):
+        first, second = create_customers(2)
+        self.engage(first, 8)
+        self.engage(second, 9)
+        with mock.patch(
+            "customers.sendtime.record_changes", side_effect=[None, RuntimeError]
+        ):
+            with self.assertRaises(RuntimeError):
+                compute_send_times(chunk_size=1)
+        self.assertEqual(Customer.objects.get(pk=first.pk).best_send_hour, 8)
+        self.assertIsNone(Customer.objects.get(pk=second.pk).best_send_hour)
+        # The interrupted first run left no watermark, so everyone is redone
+        self.assertFalse(RollupWatermark.objects.exists())
+        self.assertEqual(compute_send_times(), 2)
+        self.assertEqual(Customer.objects.get(pk=second.pk).best_send_hour, 9)
+
+    def test_unchanged_hours_are_not_logged(self):
+        texan, idle = create_customers(2)
+        self.engage(texan, 15)
+        logged = ChangeLog.objects.filter(model="customer")
+        before = logged.count()
+        compute_send_times()
+        # The idle customer keeps the default (null) hour
+        self.assertEqual(
+            list(logged[before:].values_list("object_id", flat=True)), [texan.pk]
+        )
+        self.assertEqual(compute_send_times(full=True), 2)
+        self.assertEqual(logged.count(), before + 1)
+
+    def test_send_schedule(self):
+        texan, idle = create_customers(2)
+        Customer.objects.filter(pk=texan.pk).update(state="TX", best_send_hour=14)
+        campaign = create_campaign("timed", [texan, idle])
+
+        hours = self.client.get(f"/api/campaigns/{campaign.pk}/send_schedule/").json()
+        self.assertEqual(hours["hours"][20], 1)
+        self.assertEqual(hours["hours"][10], 1)
+        self.assertEqual(sum(hours["hours"]), 2)
+        self.assertEqual(
+            list(Customer.objects.filter(send_hour_q(20)).values_list("pk", flat=True)),
+            [texan.pk],
+        )
+
+
+class ChangeFeedTests(APITestCase):
+    def test_writes_are_logged_and_served_incrementally(self):
+        customer = create_customers(1)[0]
+        campaign = create_campaign("cdc")
+        start = self.client.get("/api/changes/").json()["next"]
+
+        customer.first_name = "Changed"
+        customer.save()
+        campaign.enroll_customer_ids([customer.pk])
+        compute_rfm_scores()
+        segment_id = campaign.segment.pk
+        campaign.segment.delete()
+
+        response = self.client.get(f"/api/changes/?since={start}").json()
+        changes = [
+            (c["model"], c["object_id"], c["operation"]) for c in response["changes"]
+        ]
+        self.assertEqual(
+            changes,
+            [
+                ("customer", customer.pk, "update"),
+                ("campaign", campaign.pk, "update"),
+                ("customer", customer.pk, "update"),
+                ("campaign", campaign.pk, "delete"),
+                ("segment", segment_id, "delete"),
+            ],
+        )
+        self.assertEqual(response["changes"][0]["data"]["first_name"], "Changed")
+        self.assertIsNotNone(response["changes"][2]["data"]["rfm_score"])
+        self.assertIsNone(response["changes"][3]["data"])
+
+        page = self.client.get(
+            f"/api/changes/?since={start}&limit=2&models=customer"
+        ).json()
+        self.assertEqual(len(page["changes"]), 2)
+        self.assertTrue(page["has_more"])
+        self.assertEqual(
+            self.client.get("/api/changes/?models=orders").status_code, 400
+        )
+
+    def test_profile_fields_are_part_of_customer_changes(self):
+        start = self.client.get("/api/changes/").json()["next"]
+        self.client.post(
+            "/api/customers/",
+            {
+                "email": "p@example.com",
+                "first_name": "P",
+                "last_name": "Q",
+                "phone": "555-0100",
+                "zip_code": "78701",
+            },
+            format="json",
+        )
+        customer = Customer.objects.get(email="p@example.com")
+        self.client.patch(
+            f"/api/customers/{customer.pk}/", {"zip_code": "78702"}, format="json"
+        )
+        changes = self.client.get(f"/api/changes/?since={start}").json()["changes"]
+        self.assertEqual(changes[0]["operation"], "create")
+        self.assertEqual(changes[-1]["operation"], "update")
+        for change in changes:
+            self.assertEqual(change["object_id"], customer.pk)
+            self.assertEqual(
+                (change["data"]["phone"], change["data"]["zip_code"]),
+                ("555-0100", "78702"),
+            )
+
+        # Direct profile writes are logged as customer updates
+        start = changes[-1]["id"]
+        customer.profile.phone = "555-0199"
+        customer.profile.save()
+        (change,) = self.client.get(f"/api/changes/?since={start}").json()["changes"]
+        self.assertEqual(
+            (change["object_id"], change["operation"]), (customer.pk, "update")
+        )
+        self.assertEqual(change["data"]["phone"], "555-0199")
+        CustomerProfile.objects.filter(pk=customer.pk).delete()
+        (change,) = self.client.get(f"/api/changes/?since={change['id']}").json()[
+            "changes"
+        ]
+        self.assertEqual(change["data"]["phone"], "")
+
+        # Deleting the customer logs only the delete
+        customer.profile = CustomerProfile.objects.create(customer=customer)
+        start = self.client.get("/api/changes/").json()["next"]
+        customer.delete()
+        changes = self.client.get(f"/api/changes/?since={start}").json()["changes"]
+        self.assertEqual([c["operation"] for c in changes], ["delete"])
+
+    def test_stream_and_prune_changes(self):
+        create_customers(3)
+        out = io.StringIO()
+        call_command("stream_changes", batch_size=2, models=["customer"], stdout=out)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([line["operation"] for line in lines], ["create"] * 3)
+
+        ChangeLog.objects.filter(pk__lt=lines[-1]["id"]).update(
+            changed_at=timezone.now() - timedelta(days=30)
+        )
+        call_command("prune_changes", days=7, stdout=io.StringIO())
+        self.assertEqual(ChangeLog.objects.filter(model="customer").count(), 1)
+
+    def test_recent_changes_are_held_back_outside_sqlite(self):
+        first, second = create_customers(2)
+        start = ChangeLog.objects.order_by("pk").last().pk
+        first.save()
+        second.save()
+        low, high = ChangeLog.objects.filter(pk__gt=start).order_by("pk")
+
+        def age(*changes):
+            ChangeLog.objects.filter(pk__in=[c.pk for c in changes]).update(
+                changed_at=timezone.now() - timedelta(minutes=2)
+            )
+
+        with mock.patch("customers.changes.commit_lag", return_value=60):
+            self.assertEqual(
+                self.client.get(f"/api/changes/?since={start}").json()["changes"], []
+            )
+            # An old enough change still waits behind a lower, recent one
+            age(high)
+            self.assertEqual(
+                self.client.get(f"/api/changes/?since={start}").json()["changes"], []
+            )
+            age(low)
+            response = self.client.get(f"/api/changes/?since={start}").json()
+        self.assertEqual(
+            [c["object_id"] for c in response["changes"]], [first.pk, second.pk]
+        )
+        self.assertEqual(response["next"], high.pk)
+
+
+@override_settings(DATABASE_REPLICAS=["replica0"], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+    def route(self, request, write=False):
+        router = PrimaryReplicaRouter()
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Customer))
+            if write:
+                router.db_for_write(Customer)
+                reads.append(router.db_for_read(Customer))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return reads, response
+
+    def test_reads_go_to_replicas_until_a_write(self):
+        factory = RequestFactory()
+        reads, response = self.route(factory.get("/api/customers/"))
+        self.assertEqual(reads, ["replica0"])
+        self.assertNotIn("primary_until", response.cookies)
+
+        reads, response = self.route(factory.post("/api/customers/"), write=True)
+        self.assertEqual(reads, ["default", "default"])
+        self.assertIn("primary_until", response.cookies)
+
+        # The same client reads its own writes from the primary for a while
+        request = factory.get("/api/customers/")
+        request.COOKIES["primary_until"] = response.cookies["primary_until"].value
+        self.assertEqual(self.route(request)[0], ["default"])
+
+        reads, _ = self.route(factory.get("/api/customers/"), write=True)
+        self.assertEqual(reads, ["replica0", "default"])
+        # Outside of a request everything uses the primary
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(Customer), "default")
+
+    def test_sticky_header_for_cross_origin_clients(self):
+        factory = RequestFactory()
+        _, response = self.route(factory.post("/api/customers/"), write=True)
+        until = response["X-Primary-Until"]
+        self.assertEqual(until, response.cookies["primary_until"].value)
+
+        request = factory.get("/api/customers/", headers={"X-Primary-Until": until})
+        self.assertEqual(self.route(request)[0], ["default"])
+        request = factory.get("/api/customers/", headers={"X-Primary-Until": "1"})
+        self.assertEqual(self.route(request)[0], ["replica0"])
+
+    def test_cached_responses_are_read_from_the_primary(self):
+        create_customers(2)
+        cache.clear()
+        router = PrimaryReplicaRouter()
+        view = CustomerViewSet.as_view({"get": "list"})
+        reads = []
+
+        def recording_view(request):
+            response = view(request)
+            reads.append(router.db_for_read(Customer))
+            return response
+
+        middleware = ReplicaRoutingMiddleware(recording_view)
+        first = middleware(RequestFactory().get("/api/customers/"))
+        second = middleware(RequestFactory().get("/api/customers/"))
+        # Right after a write the miss fills the cache from the primary, the
+        # hit doesn't touch the database
+        self.assertEqual(reads, ["default", "replica0"])
+        self.assertEqual(len(first.data), 2)
+        self.assertEqual(second.content, first.rendered_content)
+
+    def test_reads_reach_replicas(self):
+        customers = create_customers(3)
+        campaign = create_campaign("replicated", customers)
+        segment_id = campaign.segment_id
+        aliases = []
+        db_for_read = PrimaryReplicaRouter.db_for_read
+
+        def recording_db_for_read(router, model, **hints):
+            aliases.append(db_for_read(router, model, **hints))
+            # The test database has no replica alias
+            return "default"
+
+        def read(url):
+            aliases.clear()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            self.assertTrue(aliases)
+            return set(aliases)
+
+        export_url = f"/api/segments/{segment_id}/export/?format=csv"
+        with mock.patch.object(
+            PrimaryReplicaRouter, "db_for_read", recording_db_for_read
+        ):
+            # Exports aren't cached, so recent writes don't pin them
+            self.assertEqual(read(export_url), {"replica0"})
+            self.assertEqual(read("/api/customers/"), {"default"})
+            # Once the writes are older than the replica lag, fills use replicas
+            with override_settings(REPLICA_STICKY_SECONDS=0):
+                cache.clear()
+                for url in [
+                    "/api/campaigns/",
+                    f"/api/segments/{segment_id}/preview/",
+                    "/api/customers/",
+                    export_url,
+                ]:
+                    self.assertEqual(read(url), {"replica0"}, url)
+
+
+@override_settings(WRITE_QUEUE_ENABLED=True)
+class WriteQueueTests(TransactionTestCase):
+    def test_queued_writes_commit_independently(self):
+        def create(i):
+            return Customer.objects.create(
+                email=f"queued{i}@example.com", first_name="Q", last_name=str(i)
+            ).pk
+
+        futures = [write_queue.submit(create, i) for i in range(20)]
+        # A failing write doesn't roll back the rest of its batch
+        failed = write_queue.submit(create, 0)
+        futures.append(write_queue.submit(create, 20))
+
+        self.assertEqual(len({future.result(timeout=5) for future in futures}), 21)
+        with self.assertRaises(IntegrityError):
+            failed.result(timeout=5)
+        self.assertEqual(Customer.objects.count(), 21)
+
+    def test_api_writes_go_through_the_queue(self):
+        response = APIClient().post(
+            "/api/customers/",
+            {"email": "api@example.com", "first_name": "A", "last_name": "B"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Customer.objects.filter(email="api@example.com").exists())
+
+
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        customers = create_customers(3)
+        customers[0].last_order_date = timezone.now() - timedelta(days=3)
+        customers[0].save()
+        self.campaign = create_campaign("async", customers[:2])
+        self.campaign.segment.conditions = [
+            {"field": "last_name", "operator": "contains", "value": "Customer"}
+        ]
+        self.campaign.segment.save()
+
+    async def test_payloads_match_sync_endpoints(self):
+        segment_id = self.campaign.segment_id
+        for sync_url, async_url in [
+            ("/api/customers/", "/api/async/customers/"),
+            ("/api/campaigns/", "/api/async/campaigns/"),
+            (
+                f"/api/segments/{segment_id}/preview/",
+                f"/api/async/segments/{segment_id}/preview/",
+            ),
+        ]:
+            expected = await sync_to_async(self.client.get)(sync_url)
+            response = await self.async_client.get(async_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected.json())
+
+        response = await self.async_client.get(
+            f"/api/async/segments/{segment_id}/count/"
+        )
+        self.assertEqual(response.json(), {"count": 3})
+        response = await self.async_client.get("/api/async/segments/0/count/")
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get("/api/async/health/")
+        self.assertEqual(response.json()["status"], "healthy")
+
+    async def test_generate_awaits_the_provider(self):
+        provider = mock.Mock(note=None)
+        provider.agenerate_campaign = mock.AsyncMock(
+            return_value={"segment": {"name": "S"}, "campaign": {"subject": "C"}}
+        )
+        with mock.patch("customers.async_views.get_provider", return_value=provider):
+            response = await self.async_client.post(
+                "/api/async/generate/",
+                {"prompt": "win back"},
+                content_type="application/json",
+            )
+        self.assertEqual(
+            response.json(), {"segment": {"name": "S"}, "campaign": {"subject": "C"}}
+        )
+        provider.agenerate_campaign.assert_awaited_once_with("win back")
+
+        response = await self.async_client.post(
+            "/api/async/generate/", {}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(AI_PROVIDER="auto", GEMINI_API_KEY=None)
+class AIProviderTests(APITestCase):
+    def test_rule_based_provider_is_used_without_a_key(self):
+        provider = get_provider()
+        self.assertIsInstance(provider, RuleBasedProvider)
+        self.assertIs(get_provider("rule_based"), provider)
+        # The Gemini SDK is only imported once a Gemini provider is used
+        self.assertNotIn("customers.gemini", sys.modules)
+        with self.assertRaises(ImproperlyConfigured):
+            get_provider("missing")
+
+        response = self.client.post(
+            "/api/generate/", {"prompt": "subscribed, haven't purchased"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["note"], provider.note)
+        fields = [c["field"] for c in response.json()["segment"]["conditions"]]
+        self.assertEqual(fields, ["email_subscribed", "last_order_date"])
+
+
+class PackingProvider(AIProvider):
+    pack_size = 2
+    calls = []
+
+    def generate_campaigns(self, prompts):
+        self.calls.append(list(prompts))
+        if "fail" in prompts:
+            raise ValueError("model error")
+        return [{"segment": p.upper(), "campaign": p} for p in prompts]
+
+
+@override_settings(
+    AI_PROVIDER="packing",
+    AI_PROVIDERS={"packing": "customers.tests.PackingProvider"},
+    AI_BATCH_WORKERS=4,
+)
+class BatchGenerationTests(APITestCase):
+    def post(self, prompts):
+        return self.client.post(
+            "/api/generate/batch/", {"prompts": prompts}, format="json"
+        )
+
+    def test_prompts_are_deduplicated_packed_and_streamed(self):
+        PackingProvider.calls.clear()
+        response = self.post(["a", " a  ", "b", "c", "fail", "d"])
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = {
+            row["index"]: row
+            for row in map(
+                json.loads, b"".join(response.streaming_content).splitlines()
+            )
+        }
+
+        self.assertEqual(sorted(rows), list(range(6)))
+        self.assertEqual(rows[1]["prompt"], " a  ")
+        self.assertEqual(rows[1]["segment"], "A")
+        self.assertEqual(rows[5]["campaign"], "d")
+        # The failed pack is retried per prompt, so "c" still succeeds
+        self.assertEqual(rows[3]["segment"], "C")
+        self.assertEqual(rows[4]["error"], "model error")
+        calls = sorted(PackingProvider.calls)
+        self.assertEqual(calls, [["a", "b"], ["c"], ["c", "fail"], ["d"], ["fail"]])
+
+    def test_invalid_batches_are_rejected(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post(["ok", ""]).status_code, 400)
+        with override_settings(AI_BATCH_MAX_PROMPTS=2):
+            self.assertEqual(self.post(["a", "b", "c"]).status_code, 400)
+
+
+@override_settings(SEGMENT_DATE_BUCKET_SECONDS=3600)
+class SegmentResultCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customers = create_customers(3)
+        self.segment = Segment.objects.create(
+            name="Recent",
+            conditions=[
+                {"field": "last_name", "operator": "contains", "value": "Customer"},
+                {"field": "created_at", "operator": "in_last_days", "value": 7},
+            ],
+        )
+        self.url = f"/api/segments/{self.segment.pk}/preview/"
+
+    def test_relative_dates_are_bucketed(self):
+        now = relative_date_now()
+        self.assertEqual((now.minute, now.second, now.microsecond), (0, 0, 0))
+        self.assertEqual(
+            str(self.segment.get_customers().query),
+            str(self.segment.get_customers().query),
+        )
+        self.assertEqual(
+            normalize_conditions(self.segment.conditions[::-1] * 2),
+            normalize_conditions(self.segment.conditions),
+        )
+
+    def test_preview_is_invalidated_by_writes_to_referenced_fields(self):
+        self.assertEqual(self.client.get(self.url).json()["count"], 3)
+
+        # Other columns changing only drops the response cache
+        customer = self.customers[0]
+        self.client.patch(
+            f"/api/customers/{customer.pk}/", {"state": "TX"}, format="json"
+        )
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()["count"], 3)
+        self.assertEqual(response.json()["customers"][0]["state"], "TX")
+
+        self.client.patch(
+            f"/api/customers/{customer.pk}/", {"last_name": "Other"}, format="json"
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()["count"], 2)
+        create_customers(1, prefix="new")
+        self.assertEqual(self.client.get(self.url).json()["count"], 3)
+
+
+class SegmentPlanTests(APITestCase):
+    def test_plan_flags_scans_and_wildcards(self):
+        create_customers(3)
+        segment = Segment.objects.create(
+            name="Wildcard",
+            conditions=[
+                {"field": "last_name", "operator": "contains", "value": "1"},
+                {"field": "country", "operator": "equals", "value": "US"},
+            ],
+        )
+        response = self.client.get(f"/api/segments/{segment.pk}/plan/")
+        self.assertEqual(response.status_code, 200)
+        plan = response.json()
+        self.assertTrue(plan["full_scan"])
+        self.assertEqual(plan["table_rows"], 3)
+        self.assertEqual(
+            plan["warnings"],
+            [
+                {"field": "last_name", "issue": "leading_wildcard"},
+                {"field": "country", "issue": "unindexed"},
+            ],
+        )
+
+        segment.conditions = [{"field": "rfm_score", "operator": "equals", "value": 5}]
+        segment.save()
+        plan = self.client.get(f"/api/segments/{segment.pk}/plan/").json()
+        self.assertFalse(plan["full_scan"])
+        self.assertEqual(plan["warnings"], [])
+
+    def test_index_recommendations(self):
+        conditions = [
+            {"field": "lifetime_value", "operator": "greater_than", "value": 10},
+            {"field": "email_subscribed", "operator": "equals", "value": True},
+            {"field": "city", "operator": "equals", "value": "Austin"},
+            {"field": "first_name", "operator": "contains", "value": "a"},
+        ]
+        self.assertEqual(
+            index_candidate(conditions), ("city", "email_subscribed", "lifetime_value")
+        )
+        segments = [
+            Segment(name="a", conditions=conditions),
+            Segment(name="b", conditions=conditions[:2]),
+            Segment(name="c", conditions=conditions[:2][::-1]),
+            Segment(name="d", conditions=[conditions[3]]),
+            # Served by the existing rfm_score index
+            Segment(
+                name="e",
+                conditions=[{"field": "rfm_score", "operator": "equals", "value": 1}],
+            ),
+        ]
+        self.assertEqual(
+            recommend_indexes(segments),
+            [
+                (("email_subscribed", "lifetime_value"), ["b", "c"]),
+                (("city", "email_subscribed", "lifetime_value"), ["a"]),
+            ],
+        )
+
+
+class ForecastTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        customers = create_customers(4)
+        Customer.objects.update(state="TX")
+        self.campaign = create_campaign("Launch", customers)
+        # Steps go out on days 0, 2 and 5 after enrollment
+        for step, delay in zip(self.campaign.flow.steps.all(), (0, 2, 3)):
+            step.delay_days = delay
+            step.save()
+        self.url = f"/api/campaigns/{self.campaign.pk}/forecast/"
+
+    def test_forecast_follows_step_delays(self):
+        data = self.client.get(self.url, {"days": 7}).json()
+        self.assertEqual(data["campaign"]["daily"], [4, 0, 4, 0, 0, 4, 0])
+        # Default 10:00 local in Texas (UTC-6)
+        self.assertEqual(
+            data["campaign"]["peak"],
+            {"date": data["start"], "hour": 16, "sends": 4},
+        )
+
+        # Another active campaign adds to the combined volume; its three
+        # steps have no delays
+        other = create_campaign("Running", create_customers(2, prefix="other"))
+        other.is_active = True
+        other.save()
+        data = self.client.get(self.url, {"days": 7}).json()
+        self.assertEqual(data["combined"]["daily"], [10, 0, 4, 0, 0, 4, 0])
+        self.assertEqual(self.client.get(self.url, {"days": "x"}).status_code, 400)
+
+    def test_sent_steps_come_from_rollups(self):
+        first, second, _ = self.campaign.flow.steps.all()
+        yesterday = forecast_start() - timedelta(days=1)
+        EventRollup.objects.create(
+            period=EventRollup.DAY,
+            bucket=yesterday,
+            campaign_id=self.campaign.pk,
+            flow_step_id=first.pk,
+            sent=4,
+        )
+        data = self.client.get(self.url, {"days": 6}).json()
+        self.assertEqual(data["campaign"]["daily"], [0, 4, 0, 0, 4, 0])
+
+        # Step 2 is overdue for a cohort from 3 days ago, so it goes out today
+        EventRollup.objects.filter(campaign_id=self.campaign.pk).update(
+            bucket=yesterday - timedelta(days=2)
+        )
+        data = self.client.get(self.url, {"days": 6}).json()
+        # and step 3 follows three days after that catch-up send
+        self.assertEqual(data["campaign"]["daily"], [4, 0, 0, 4, 0, 0])
+
+        out = io.StringIO()
+        call_command(
+            "forecast_send_volume", days=3, campaign=[self.campaign.pk], stdout=out
+        )
+        self.assertIn("Peak hour: 4 sends", out.getvalue())
+
+
+class CustomerProfileTests(APITestCase):
+    def test_profile_fields_are_served_on_detail_only(self):
+        response = self.client.post(
+            "/api/customers/",
+            {
+                "email": "p@example.com",
+                "first_name": "P",
+                "last_name": "Q",
+                "phone": "555-0100",
+                "zip_code": "78701",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["phone"], "555-0100")
+        customer = Customer.objects.get(email="p@example.com")
+        self.assertEqual(customer.profile.zip_code, "78701")
+
+        self.assertNotIn("phone", self.client.get("/api/customers/").json()[0])
+        url = f"/api/customers/{customer.pk}/"
+        self.client.patch(url, {"address_line1": "1 Main St"}, format="json")
+        data = self.client.get(url).json()
+        self.assertEqual(
+            (data["phone"], data["address_line1"]), ("555-0100", "1 Main St")
+        )
+
+        # Customers without details have no profile row
+        (other,) = create_customers(1)
+        self.assertEqual(
+            self.client.get(f"/api/customers/{other.pk}/").json()["phone"], ""
+        )
+        self.assertEqual(CustomerProfile.objects.count(), 1)
+
+    def test_segments_on_profile_fields(self):
+        customers = create_customers(3)
+        CustomerProfile.objects.create(customer=customers[1], zip_code="78701")
+        segment = Segment.objects.create(
+            name="Zip",
+            conditions=[{"field": "zip_code", "operator": "equals", "value": "78701"}],
+        )
+        url = f"/api/segments/{segment.pk}/preview/"
+        self.assertEqual(self.client.get(url).json()["count"], 1)
+        CustomerProfile.objects.create(customer=customers[2], zip_code="78701")
+        self.assertEqual(self.client.get(url).json()["count"], 2)
+        self.assertEqual(
+            self.client.get(f"/api/segments/{segment.pk}/plan/").json()["warnings"],
+            [{"field": "zip_code", "issue": "profile_join"}],
+        )
+
+
+@override_settings(
+    TENANTS={"acme": "default"},
+    TENANT_HOSTS={"acme.example.com": "acme"},
+    ALLOWED_HOSTS=["testserver", "acme.example.com"],
+)
+class TenantTests(APITestCase):
+    def test_requests_select_their_tenant(self):
+        create_customers(2)
+        response = self.client.get("/api/customers/", HTTP_X_TENANT="acme")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+        response = self.client.get("/api/customers/", HTTP_HOST="acme.example.com")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get("/api/customers/", HTTP_X_TENANT="initech")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "Unknown tenant: initech"})
+        self.assertIsNone(current_tenant())
+
+    @override_settings(TENANTS={"acme": "tenant_acme"})
+    def test_router_keeps_tenant_apps_in_their_database(self):
+        router = PrimaryReplicaRouter()
+        with use_tenant("acme"):
+            self.assertEqual(router.db_for_read(Customer), "tenant_acme")
+            self.assertEqual(router.db_for_write(Segment), "tenant_acme")
+            self.assertEqual(router.db_for_read(User), "default")
+        self.assertEqual(router.db_for_read(Customer), "default")
+
+        self.assertTrue(router.allow_migrate("tenant_acme", "customers"))
+        self.assertFalse(router.allow_migrate("tenant_acme", "auth"))
+        self.assertTrue(router.allow_migrate("default", "auth"))
+        with self.assertRaises(ValueError):
+            with use_tenant("initech"):
+                pass
+
+    def test_cache_versions_are_per_tenant(self):
+        (default,) = get_model_versions([Customer])
+        with use_tenant("acme"):
+            (acme,) = get_model_versions([Customer])
+            invalidate_model(Customer)
+            self.assertNotEqual(get_model_versions([Customer]), [acme])
+        self.assertEqual(get_model_versions([Customer]), [default])
+
+    def test_tenant_command(self):
+        out = io.StringIO()
+        call_command(
+            "tenant_command", "all", "prune_events", "--days", "30", stdout=out
+        )
+        self.assertIn("== acme ==", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("tenant_command", "initech", "prune_events")
+
+
+@override_settings(
+    EVENT_FLUSH_INTERVAL=0, DATABASE_REPLICAS=[], WRITE_QUEUE_ENABLED=True
+)
+class TenantIsolationTests(TransactionTestCase):
+    """Two tenants on separate databases, set up in api/settings.py for tests"""
+
+    databases = {"default", "tenant_acme", "tenant_globex"}
+    tenants = {"acme": "tenant_acme", "globex": "tenant_globex"}
+    event_types = {"acme": "open", "globex": "click"}
+
+    def test_tenants_only_see_their_own_data(self):
+        client = APIClient()
+        customers = {}
+        for tenant in self.tenants:
+            # Created through the write queue
+            response = client.post(
+                "/api/customers/",
+                {
+                    "email": f"{tenant}@example.com",
+                    "first_name": tenant,
+                    "last_name": "T",
+                },
+                format="json",
+                HTTP_X_TENANT=tenant,
+            )
+            self.assertEqual(response.status_code, 201)
+            customers[tenant] = response.json()["id"]
+
+        for tenant, alias in self.tenants.items():
+            response = client.get("/api/customers/", HTTP_X_TENANT=tenant)
+            self.assertEqual(
+                [c["email"] for c in response.json()], [f"{tenant}@example.com"]
+            )
+            self.assertEqual(
+                list(Customer.objects.using(alias).values_list("email", flat=True)),
+                [f"{tenant}@example.com"],
+            )
+        self.assertFalse(Customer.objects.exists())
+        self.assertEqual(client.get("/api/customers/").json(), [])
+
+        for tenant in self.tenants:
+            client.post(
+                "/api/events/batch/",
+                {
+                    "events": [
+                        {
+                            "event_type": self.event_types[tenant],
+                            "customer": customers[tenant],
+                        }
+                    ]
+                },
+                format="json",
+                HTTP_X_TENANT=tenant,
+            )
+        # One flush writes each tenant's events to its own database
+        self.assertEqual(event_buffer.flush(), 2)
+        for tenant, alias in self.tenants.items():
+            self.assertEqual(
+                list(Event.objects.using(alias).values_list("event_type", "customer")),
+                [(self.event_types[tenant], customers[tenant])],
+            )
+        self.assertFalse(Event.objects.exists())
@@ -1,85 +1,256 @@
-import sys
-import os
+from django.conf import settings
+from django.core.exceptions import FieldError
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
+from .ai import get_provider
+from .batch import generate_batch
+from .bitmaps import evaluate_expression, overlap_matrix
+from .cache import CachedResponseMixin
+from .events import event_buffer, parse_event
+from .export import iter_csv, iter_ndjson, gzip_stream
+from .changes import DEFAULT_LIMIT, MAX_LIMIT, TRACKED_MODELS, changes_since
+from .experiments import variant_counts
+from .forecast import campaign_forecast
+from .fastpath import FastListMixin
+from .lookalike import FeatureStore
 from .models import Customer, Segment, Flow, FlowStep, Campaign
+from .planner import plan_segment
+from .renderers import CSVRenderer, NDJSONRenderer
+from .rollups import campaign_stats
+from .segment_cache import preview_customers
+from .sendtime import send_schedule
+from .suppression import SendGate
+from .writer import write_queue
 from .serializers import (
     CustomerSerializer,
+    CustomerDetailSerializer,
     SegmentSerializer,
     FlowSerializer,
+    FlowStepSerializer,
     CampaignSerializer,
 )
 import json
-from datetime import datetime, timedelta
-from django.utils import timezone
-
-# Add parent directory to path for gemini_campaign_agent import
-sys.path.insert(
-    0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from django.db.models import (
+    Count,
+    DateTimeField,
+    DurationField,
+    ExpressionWrapper,
+    F,
+    Prefetch,
+    Value,
 )
-from gemini_campaign_agent import GeminiCampaignAgent
+from django.db.models.functions import Concat
+from django.utils import timezone
 
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+    cache_dependencies = (Customer,)
+    fast_list = True
+    fast_list_converters = {
+        "days_since_last_order": lambda delta: delta.days if delta is not None else None
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != "list":
+            queryset = queryset.select_related("profile")
+        return queryset
 
+    def get_serializer_class(self):
+        # Lists leave out the profile fields, which live in another table
+        if self.action == "list":
+            return CustomerSerializer
+        return CustomerDetailSerializer
+
+    # Single-row writes are funneled through the per-process writer
+    def perform_create(self, serializer):
+        write_queue.run(serializer.save)
+
+    def perform_update(self, serializer):
+        write_queue.run(serializer.save)
+
+    def perform_destroy(self, instance):
+        write_queue.run(instance.delete)
 
-class SegmentViewSet(viewsets.ModelViewSet):
+    def get_fast_list_annotations(self):
+        # Database equivalents of Customer.full_name / days_since_last_order
+        return {
+            "full_name": Concat("first_name", Value(" "), "last_name"),
+            "days_since_last_order": ExpressionWrapper(
+                Value(timezone.now(), output_field=DateTimeField())
+                - F("last_order_date"),
+                output_field=DurationField(),
+            ),
+        }
+
+
+class SegmentViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Segment.objects.all()
     serializer_class = SegmentSerializer
+    cache_dependencies = (Segment, Customer)
+    # Exports stream CSV/NDJSON, which is never cached
+    uncached_actions = ("export",)
 
     @action(detail=True, methods=["get"])
     def preview(self, request, pk=None):
         """Preview customers that match this segment"""
         segment = self.get_object()
-        customers = segment.get_customers()
+        count, customers = preview_customers(segment.conditions)
         return Response(
             {
-                "count": customers.count(),
+                "count": count,
+                "customers": CustomerSerializer(customers, many=True).data,
+            }
+        )
+
+    @action(detail=True, methods=["get"])
+    def plan(self, request, pk=None):
+        """Database query plan and cost warnings for this segment"""
+        segment = self.get_object()
+        try:
+            return Response(plan_segment(segment))
+        except (FieldError, KeyError, TypeError, ValueError) as e:
+            return Response(
+                {"error": f"Invalid conditions: {e}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+    @action(detail=False, methods=["post"])
+    def combine(self, request):
+        """Count and preview customers matching a set expression over segments"""
+        try:
+            bitmap = evaluate_expression(
+                request.data.get("expression"), segment_bitmap_loader()
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        customers = Customer.objects.filter(pk__in=bitmap.ids(limit=10))
+        return Response(
+            {
+                "count": bitmap.count(),
+                "customers": CustomerSerializer(customers, many=True).data,
+            }
+        )
+
+    @action(detail=False, methods=["post"])
+    def overlap(self, request):
+        """Pairwise overlap counts between several segments"""
+        segment_ids = request.data.get("segments") or []
+        load_bitmap = segment_bitmap_loader()
+        try:
+            bitmaps = [evaluate_expression(pk, load_bitmap) for pk in segment_ids]
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"segments": segment_ids, "overlap": overlap_matrix(bitmaps)})
+
+    @action(detail=True, methods=["post"])
+    def lookalike(self, request, pk=None):
+        """Find the non-members most similar to this segment's customers"""
+        segment = self.get_object()
+        try:
+            size = int(request.data.get("size", 100))
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "size must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        size = max(1, min(size, settings.LOOKALIKE_MAX_SIZE))
+
+        store = FeatureStore()
+        if not store.exists():
+            return Response(
+                {
+                    "error": "Lookalike features haven't been built yet, "
+                    "run build_lookalike_features"
+                },
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        store.refresh_in_background(settings.LOOKALIKE_REFRESH_SECONDS)
+        bitmap = segment.get_bitmap()
+        # Over-fetch a little: customers deleted since the last refresh
+        # are still in the feature matrix
+        matches = store.search(bitmap.to_mask(), size + size // 10 + 10)
+        existing = Customer.objects.in_bulk([pk for pk, _ in matches])
+        matches = [(pk, distance) for pk, distance in matches if pk in existing]
+        matches = matches[:size]
+
+        return Response(
+            {
+                "seed_count": bitmap.count(),
+                "count": len(matches),
+                "customer_ids": [pk for pk, _ in matches],
+                "distances": [round(distance, 4) for _, distance in matches],
                 "customers": CustomerSerializer(
-                    customers[:10], many=True
-                ).data,  # First 10 for preview
+                    [existing[pk] for pk, _ in matches[:10]], many=True
+                ).data,
             }
         )
 
+    @action(
+        detail=True, methods=["get"], renderer_classes=[CSVRenderer, NDJSONRenderer]
+    )
+    def export(self, request, pk=None):
+        """Stream every customer in this segment as CSV or NDJSON"""
+        segment = self.get_object()
+        renderer = request.accepted_renderer
+        rows = segment.get_customers()
+        chunks = iter_ndjson(rows) if renderer.format == "ndjson" else iter_csv(rows)
+
+        gzip = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+        response = StreamingHttpResponse(
+            gzip_stream(chunks) if gzip else chunks,
+            content_type=renderer.media_type,
+        )
+        if gzip:
+            response["Content-Encoding"] = "gzip"
+        response["Vary"] = "Accept-Encoding"
+        response["Content-Disposition"] = (
+            f'attachment; filename="segment-{segment.pk}.{renderer.format}"'
+        )
+        return response
 
-class FlowViewSet(viewsets.ModelViewSet):
-    queryset = Flow.objects.all()
+
+class FlowViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = Flow.objects.prefetch_related("steps")
     serializer_class = FlowSerializer
+    cache_dependencies = (Flow, FlowStep, Campaign, Customer)
 
     @action(detail=True, methods=["get"])
     def steps(self, request, pk=None):
         """Get all steps for this flow"""
         flow = self.get_object()
         steps = flow.steps.all()
-        from .serializers import FlowStepSerializer
 
         return Response(
-            {"count": steps.count(), "steps": FlowStepSerializer(steps, many=True).data}
+            {"count": len(steps), "steps": FlowStepSerializer(steps, many=True).data}
         )
 
     @action(detail=True, methods=["get"])
     def preview_customers(self, request, pk=None):
         """Preview customers enrolled in this flow's campaigns"""
         flow = self.get_object()
-        campaigns = flow.campaign_set.all()
-        customers = Customer.objects.filter(campaigns__in=campaigns).distinct()
-        from .serializers import CustomerSerializer
 
         return Response(
             {
-                "count": customers.count(),
-                "customers": CustomerSerializer(customers[:10], many=True).data,
+                "count": flow.audience_count,
+                "customers": CustomerSerializer(
+                    flow.get_customers()[:10], many=True
+                ).data,
             }
         )
 
 
-class FlowStepViewSet(viewsets.ModelViewSet):
+class FlowStepViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = FlowStep.objects.all()
-    serializer_class = FlowSerializer
+    serializer_class = FlowStepSerializer
+    cache_dependencies = (FlowStep, Flow, Campaign, Customer)
 
     def get_queryset(self):
         """Order steps by step_number by default"""
@@ -93,14 +264,13 @@ class FlowStepViewSet(viewsets.ModelViewSet):
         """Preview customers who will receive this step (based on flow's segment)"""
         step = self.get_object()
         flow = step.flow
-        campaigns = flow.campaign_set.all()
-        customers = Customer.objects.filter(campaigns__in=campaigns).distinct()
-        from .serializers import CustomerSerializer
 
         return Response(
             {
-                "count": customers.count(),
-                "customers": CustomerSerializer(customers[:10], many=True).data,
+                "count": flow.audience_count,
+                "customers": CustomerSerializer(
+                    flow.get_customers()[:10], many=True
+                ).data,
                 "step_info": {
                     "step_number": step.step_number,
                     "email_subject": step.email_subject,
@@ -110,110 +280,136 @@ class FlowStepViewSet(viewsets.ModelViewSet):
         )
 
 
-class CampaignViewSet(viewsets.ModelViewSet):
-    queryset = Campaign.objects.all()
+class CampaignViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = (
+        Campaign.objects.select_related("segment", "flow")
+        .prefetch_related(Prefetch("customers", queryset=Customer.objects.only("id")))
+        .annotate(num_customers=Count("customers"))
+    )
     serializer_class = CampaignSerializer
+    cache_dependencies = (Campaign, Segment, Flow)
+    # Stats and forecasts are read from the event rollups, which change
+    # without writes to the cache dependencies (forecasts also move with the
+    # date and flow step delays)
+    uncached_actions = ("stats", "forecast")
 
+    def get_queryset(self):
+        # Actions that don't serialize campaigns skip the joins and prefetch
+        plain_actions = (
+            "stats",
+            "enroll",
+            "check_recipients",
+            "variants",
+            "send_schedule",
+            "forecast",
+        )
+        if self.action in plain_actions:
+            return Campaign.objects.all()
+        return super().get_queryset()
 
-@api_view(["POST"])
-def generate_segment_and_campaign(request):
-    """AI agent endpoint to generate segments and campaigns using Gemini API"""
-    prompt = request.data.get("prompt", "")
-
-    if not prompt:
+    @action(detail=True, methods=["get"])
+    def stats(self, request, pk=None):
+        """Funnel metrics for this campaign, read from the event rollups"""
+        return Response(campaign_stats(self.get_object()))
+
+    @action(detail=True, methods=["post"])
+    def enroll(self, request, pk=None):
+        """Enroll the customers matching a segment set expression"""
+        campaign = self.get_object()
+        try:
+            bitmap = evaluate_expression(
+                request.data.get("expression"), segment_bitmap_loader()
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One queued operation per chunk, so a large enrollment is several
+        # short transactions that other writes can run between
+        customer_ids = bitmap.ids()
+        chunk_size = settings.ENROLL_CHUNK_SIZE
+        enrolled = sum(
+            write_queue.run(
+                campaign.enroll_customer_ids, customer_ids[start : start + chunk_size]
+            )
+            for start in range(0, len(customer_ids), chunk_size)
+        )
         return Response(
-            {"error": "Prompt is required"}, status=status.HTTP_400_BAD_REQUEST
+            {"enrolled": enrolled, "customer_count": campaign.customers.count()}
         )
 
-    try:
-        # Use GeminiCampaignAgent for intelligent generation
-        agent = GeminiCampaignAgent()
-        result = agent.generate_complete_campaign(prompt)
-
-        return Response({"segment": result["segment"], "campaign": result["campaign"]})
+    @action(detail=True, methods=["get"])
+    def variants(self, request, pk=None):
+        """Enrolled customers per A/B variant and in the holdout group"""
+        campaign = self.get_object()
+        return Response(variant_counts(campaign, campaign.customers.all()))
 
-    except ValueError as e:
-        # Fallback to rule-based generation if Gemini API key is not configured
-        if "API key not provided" in str(e):
-            segment_data = analyze_prompt_for_segment(prompt)
-            campaign_data = generate_campaign_from_prompt(prompt)
+    @action(detail=True, methods=["get"])
+    def send_schedule(self, request, pk=None):
+        """Recipients per UTC hour, sending at each one's best local hour"""
+        campaign = self.get_object()
+        return Response({"hours": send_schedule(campaign.get_recipients())})
 
+    @action(detail=True, methods=["get"])
+    def forecast(self, request, pk=None):
+        """Projected sends per day and UTC hour, alone and with active campaigns"""
+        try:
+            days = int(request.query_params.get("days", settings.FORECAST_DAYS))
+        except ValueError:
             return Response(
-                {
-                    "segment": segment_data,
-                    "campaign": campaign_data,
-                    "note": "Using rule-based generation. Set GEMINI_API_KEY for AI-powered generation.",
-                }
+                {"error": "days must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        else:
-            raise
+        days = max(1, min(days, settings.FORECAST_MAX_DAYS))
+        return Response(campaign_forecast(self.get_object(), days))
 
+    @action(detail=True, methods=["post"])
+    def check_recipients(self, request, pk=None):
+        """Apply unsubscribes, suppressions and frequency caps to recipients.
 
-def analyze_prompt_for_segment(prompt):
-    """Simple rule-based segment generation"""
-    conditions = []
-
-    if "high lifetime value" in prompt.lower() or "ltv" in prompt.lower():
-        # Get 75th percentile LTV
-        customers = Customer.objects.all()
-        if customers.exists():
-            ltv_values = [c.lifetime_value for c in customers]
-            percentile_75 = sorted(ltv_values)[int(len(ltv_values) * 0.75)]
-            conditions.append(
-                {
-                    "field": "lifetime_value",
-                    "operator": "greater_than",
-                    "value": float(percentile_75),
-                }
+        Checks ``customer_ids`` from the body, or everyone enrolled outside
+        the holdout group.
+        """
+        campaign = self.get_object()
+        customer_ids = request.data.get("customer_ids")
+        if customer_ids is None:
+            customer_ids = campaign.get_recipients().values_list("pk", flat=True)
+        elif not isinstance(customer_ids, list) or not all(
+            isinstance(pk, int) and not isinstance(pk, bool) for pk in customer_ids
+        ):
+            return Response(
+                {"error": "customer_ids must be a list of integers"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-    if "subscribed" in prompt.lower():
-        conditions.append(
-            {"field": "email_subscribed", "operator": "equals", "value": True}
-        )
-
-    if "haven't purchased" in prompt.lower() or "not ordered" in prompt.lower():
-        days = 60  # default
-        if "60 days" in prompt:
-            days = 60
-        elif "30 days" in prompt:
-            days = 30
-        elif "90 days" in prompt:
-            days = 90
-
-        conditions.append(
+        result = SendGate().check(customer_ids)
+        return Response(
             {
-                "field": "last_order_date",
-                "operator": "less_than",
-                "value": (timezone.now() - timedelta(days=days)).isoformat(),
+                "allowed": result.allowed,
+                "rejected": {
+                    reason: ids for reason, ids in result.rejected.items() if ids
+                },
             }
         )
 
-    return {
-        "name": "High LTV Inactive Customers",
-        "description": "Customers with high lifetime value who haven't purchased recently",
-        "conditions": conditions,
-    }
 
+def segment_bitmap_loader():
+    """Load segment bitmaps by id, once per request"""
+    bitmaps = {}
 
-def generate_campaign_from_prompt(prompt):
-    """Generate campaign elements"""
-    return {
-        "subject": "We Miss You! Special Offer Inside",
-        "send_time": "10:00",
-        "send_date": (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
-        "content_ideas": [
-            "Personalized product recommendations based on past purchases",
-            "Exclusive discount code for returning customers",
-            "Highlight new arrivals in their favorite categories",
-            "Social proof with customer reviews and testimonials",
-        ],
-    }
+    def load(segment_id):
+        if segment_id not in bitmaps:
+            try:
+                bitmaps[segment_id] = Segment.objects.get(pk=segment_id).get_bitmap()
+            except Segment.DoesNotExist:
+                raise ValueError(f"Segment {segment_id} does not exist")
+        return bitmaps[segment_id]
+
+    return load
 
 
 @api_view(["POST"])
-def generate_flow(request):
-    """Generate a multi-step email flow using Gemini AI"""
+def generate_segment_and_campaign(request):
+    """AI agent endpoint to generate segments and campaigns"""
     prompt = request.data.get("prompt", "")
 
     if not prompt:
@@ -221,91 +417,122 @@ def generate_flow(request):
             {"error": "Prompt is required"}, status=status.HTTP_400_BAD_REQUEST
         )
 
-    try:
-        # Create Gemini agent for flow generation
-        agent = GeminiCampaignAgent()
-
-        # Generate flow steps with delays
-        prompt_text = f"""
-        Generate a multi-step email marketing flow based on the following business objective:
-
-        Business Objective: {prompt}
-
-        Requirements:
-        1. Create a sequence of 3-5 email steps with delays between them
-        2. Each step should have an email subject and content guidelines
-        3. Include specific delays (in days) between steps
-        4. Make each step progressively move the customer toward the goal
-        5. Each step should have a clear purpose (e.g., awareness, engagement, conversion, retention)
-
-        Output Format:
-        Return only the flow definition in JSON format like:
-        {{
-          "flow_name": "Descriptive name for the flow",
-          "description": "Brief description of the flow's purpose",
-          "steps": [
-            {{
-              "step_number": 1,
-              "email_subject": "Engaging subject line (max 50 chars)",
-              "email_content_guidelines": "Specific guidelines for email content",
-              "delay_days": 0  // Days to wait before this step (0 for first step)
-            }},
-            {{
-              "step_number": 2,
-              "email_subject": "Engaging subject line (max 50 chars)",
-              "email_content_guidelines": "Specific guidelines for email content",
-              "delay_days": 10  // Days to wait after step 1
-            }}
-          ]
-        }}
-        """
+    provider = get_provider()
+    result = provider.generate_campaign(prompt)
+    data = {"segment": result["segment"], "campaign": result["campaign"]}
+    if provider.note:
+        data["note"] = provider.note
+    return Response(data)
 
-        response = agent.model.generate_content(prompt_text)
-        flow_data = agent._extract_json_from_response(response.text)
 
-        return Response({"flow": flow_data})
+@api_view(["POST"])
+def generate_segment_and_campaign_batch(request):
+    """Generate for many prompts, streaming one NDJSON line per prompt"""
+    prompts = request.data.get("prompts") if isinstance(request.data, dict) else None
+    if (
+        not isinstance(prompts, list)
+        or not prompts
+        or not all(isinstance(prompt, str) and prompt.strip() for prompt in prompts)
+    ):
+        return Response(
+            {"error": "prompts must be a non-empty list of strings"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(prompts) > settings.AI_BATCH_MAX_PROMPTS:
+        return Response(
+            {"error": f"At most {settings.AI_BATCH_MAX_PROMPTS} prompts per batch"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    provider = get_provider()
+
+    def lines():
+        for index, result, error in generate_batch(prompts, provider):
+            row = {"index": index, "prompt": prompts[index]}
+            if error is not None:
+                row["error"] = str(error)
+            else:
+                row["segment"] = result["segment"]
+                row["campaign"] = result["campaign"]
+                if provider.note:
+                    row["note"] = provider.note
+            yield (json.dumps(row) + "\n").encode()
+
+    return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
 
-    except ValueError as e:
-        if "API key not provided" in str(e):
-            # Fallback to rule-based flow generation
-            flow_data = generate_rule_based_flow(prompt)
+
+@api_view(["POST"])
+def ingest_events(request):
+    """Queue a batch of send/engagement events for the buffered writer"""
+    payload = request.data.get("events") if isinstance(request.data, dict) else None
+    if not isinstance(payload, list):
+        return Response(
+            {"error": "events must be a list"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    events = []
+    for index, data in enumerate(payload):
+        try:
+            events.append(parse_event(data))
+        except ValueError as e:
             return Response(
-                {
-                    "flow": flow_data,
-                    "note": "Using rule-based generation. Set GEMINI_API_KEY for AI-powered generation.",
-                }
+                {"error": f"Event {index}: {e}"}, status=status.HTTP_400_BAD_REQUEST
             )
-        else:
-            raise
-    except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    accepted = event_buffer.add(events)
+    return Response(
+        {"received": len(events), "accepted": accepted},
+        status=status.HTTP_202_ACCEPTED,
+    )
 
-def generate_rule_based_flow(prompt):
-    """Generate a simple rule-based flow for fallback"""
-    steps = [
-        {
-            "step_number": 1,
-            "email_subject": "We Miss You!",
-            "email_content_guidelines": "Send a friendly reminder about your brand with a special offer",
-            "delay_days": 0,
-        },
-        {
-            "step_number": 2,
-            "email_subject": "Exclusive Just for You",
-            "email_content_guidelines": "Provide a personalized discount code to encourage return purchase",
-            "delay_days": 5,
-        },
-        {
-            "step_number": 3,
-            "email_subject": "Last Chance!",
-            "email_content_guidelines": "Create urgency with a time-limited offer highlighting bestsellers",
-            "delay_days": 5,
-        },
+
+@api_view(["GET"])
+def list_changes(request):
+    """Changes to customers, segments and campaigns after the ``since`` cursor"""
+    try:
+        since = int(request.query_params.get("since", 0))
+        limit = int(request.query_params.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        return Response(
+            {"error": "since and limit must be integers"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    models = [
+        name for name in request.query_params.get("models", "").split(",") if name
     ]
+    unknown = set(models) - set(TRACKED_MODELS)
+    if unknown:
+        return Response(
+            {"error": f"Unknown models: {', '.join(sorted(unknown))}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    return {
-        "flow_name": "Win-Back Campaign",
-        "description": "Multi-step campaign to re-engage inactive customers",
-        "steps": steps,
-    }
+    limit = max(1, min(limit, MAX_LIMIT))
+    changes = changes_since(since, limit, models)
+    return Response(
+        {
+            "changes": changes,
+            "next": changes[-1]["id"] if changes else since,
+            "has_more": len(changes) == limit,
+        }
+    )
+
+
+@api_view(["POST"])
+def generate_flow(request):
+    """Generate a multi-step email flow with the configured AI provider"""
+    prompt = request.data.get("prompt", "")
+
+    if not prompt:
+        return Response(
+            {"error": "Prompt is required"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    provider = get_provider()
+    try:
+        data = {"flow": provider.generate_flow(prompt)}
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if provider.note:
+        data["note"] = provider.note
+    return Response(data)
@@ -0,0 +1,116 @@
+"""Single-writer queue for small writes.
+
+SQLite allows one writer at a time, so concurrent request threads that each
+open their own write transaction end up waiting on (or failing with)
+"database is locked". Instead, small writes are submitted to a per-process
+writer thread, which runs whatever is queued (up to
+``WRITE_QUEUE_BATCH_SIZE`` operations, waiting at most
+``WRITE_QUEUE_MAX_DELAY`` seconds for more) in one short transaction. Each
+operation gets its own savepoint, so a failing one doesn't roll back the
+others. With ``WRITE_QUEUE_ENABLED`` off, operations run inline.
+
+Operations run in a copy of the submitting thread's context, so they write
+to the submitter's tenant database; a batch commits once per database.
+"""
+
+import contextvars
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .tenants import tenant_database
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, func, *args, **kwargs):
+        """Queue ``func(*args, **kwargs)``; returns a Future of its result"""
+        future = Future()
+        if not settings.WRITE_QUEUE_ENABLED:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_writer()
+        context = contextvars.copy_context()
+        self._queue.put((future, context, func, args, kwargs))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """Run ``func`` on the writer and wait for its result"""
+        return self.submit(func, *args, **kwargs).result()
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="db-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + settings.WRITE_QUEUE_MAX_DELAY
+        while len(batch) < settings.WRITE_QUEUE_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            by_database = defaultdict(list)
+            for item in batch:
+                by_database[item[1].run(tenant_database)].append(item)
+            results = []
+            try:
+                for using, items in by_database.items():
+                    results.extend(self._run_batch(using, items))
+            finally:
+                close_old_connections()
+
+            # Only report results once the batch is committed
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def _run_batch(self, using, batch):
+        results = []
+        try:
+            with transaction.atomic(using=using):
+                for future, context, func, args, kwargs in batch:
+                    try:
+                        with transaction.atomic(using=using):
+                            result = context.run(func, *args, **kwargs)
+                        results.append((future, result, None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            logger.exception("Write batch failed")
+            results = [(future, None, e) for future, *_ in batch]
+        return results
+
+
+write_queue = WriteQueue()
@@ -2,6 +2,7 @@
 
 import { useState } from 'react'
 import Link from 'next/link'
+import { apiFetch } from '@/lib/api'
 
 export default function AIAssistantPage() {
   const [prompt, setPrompt] = useState('')
@@ -13,7 +14,7 @@ export default function AIAssistantPage() {
     
     setLoading(true)
     try {
-      const response = await fetch('http://localhost:8000/api/generate/', {
+      const response = await apiFetch('http://localhost:8000/api/generate/', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -20,6 +20,7 @@ import {
   SelectValue,
 } from '@/components/ui/select'
 import { toast } from 'sonner'
+import { apiFetch } from '@/lib/api'
 
 interface Segment {
   id: number
@@ -88,7 +89,7 @@ export default function CampaignsPage() {
 
   const fetchCampaigns = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/campaigns/')
+      const response = await apiFetch('http://localhost:8000/api/campaigns/')
       const data = await response.json()
       setCampaigns(data)
     } catch (error) {
@@ -99,7 +100,7 @@ export default function CampaignsPage() {
 
   const fetchSegments = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/segments/')
+      const response = await apiFetch('http://localhost:8000/api/segments/')
       const data = await response.json()
       setSegments(data)
     } catch (error) {
@@ -109,7 +110,7 @@ export default function CampaignsPage() {
 
   const fetchFlows = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/flows/')
+      const response = await apiFetch('http://localhost:8000/api/flows/')
       const data = await response.json()
       setFlows(data)
     } catch (error) {
@@ -146,7 +147,7 @@ export default function CampaignsPage() {
     
     setIsSubmitting(true)
     try {
-      const response = await fetch(`http://localhost:8000/api/campaigns/${campaignToDelete.id}/`, {
+      const response = await apiFetch(`http://localhost:8000/api/campaigns/${campaignToDelete.id}/`, {
         method: 'DELETE',
       })
       
@@ -192,7 +193,7 @@ export default function CampaignsPage() {
     
     try {
       if (editingCampaign) {
-        const response = await fetch(`http://localhost:8000/api/campaigns/${editingCampaign.id}/`, {
+        const response = await apiFetch(`http://localhost:8000/api/campaigns/${editingCampaign.id}/`, {
           method: 'PUT',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify(data),
@@ -209,7 +210,7 @@ export default function CampaignsPage() {
           toast.error(errorData.detail || 'Failed to update campaign')
         }
       } else {
-        const response = await fetch('http://localhost:8000/api/campaigns/', {
+        const response = await apiFetch('http://localhost:8000/api/campaigns/', {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify(data),
@@ -235,7 +236,7 @@ export default function CampaignsPage() {
 
   const handleToggleActive = async (campaign: Campaign) => {
     try {
-      const response = await fetch(`http://localhost:8000/api/campaigns/${campaign.id}/`, {
+      const response = await apiFetch(`http://localhost:8000/api/campaigns/${campaign.id}/`, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
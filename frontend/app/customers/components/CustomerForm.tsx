@@ -24,6 +24,7 @@ import { Input } from '@/components/ui/input'
 import { Button } from '@/components/ui/button'
 import { Switch } from '@/components/ui/switch'
 import { Textarea } from '@/components/ui/textarea'
+import { apiFetch } from '@/lib/api'
 
 interface Customer {
   id: number
@@ -108,7 +109,7 @@ export function CustomerForm({
         : 'http://localhost:8000/api/customers/'
       const method = isEditing ? 'PUT' : 'POST'
       
-      const response = await fetch(url, {
+      const response = await apiFetch(url, {
         method,
         headers: {
           'Content-Type': 'application/json',
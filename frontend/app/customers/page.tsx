@@ -3,6 +3,7 @@
 import { useState, useEffect } from 'react'
 import Link from 'next/link'
 import { CustomerForm } from './components/CustomerForm'
+import { apiFetch } from '@/lib/api'
 
 interface Customer {
   id: number
@@ -29,7 +30,7 @@ export default function CustomersPage() {
 
   const fetchCustomers = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/customers/')
+      const response = await apiFetch('http://localhost:8000/api/customers/')
       const data = await response.json()
       setCustomers(data)
     } catch (error) {
@@ -25,6 +25,7 @@ import { Input } from '@/components/ui/input'
 import { Button } from '@/components/ui/button'
 import { Textarea } from '@/components/ui/textarea'
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card'
+import { apiFetch } from '@/lib/api'
 
 const flowStepSchema = z.object({
   step_number: z.number().min(1, 'Step number is required'),
@@ -88,7 +89,7 @@ export function FlowForm({
         : 'http://localhost:8000/api/flows/'
       const method = isEditing ? 'PUT' : 'POST'
       
-      const response = await fetch(url, {
+      const response = await apiFetch(url, {
         method,
         headers: {
           'Content-Type': 'application/json',
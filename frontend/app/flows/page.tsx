@@ -3,6 +3,7 @@
 import { useState, useEffect } from 'react'
 import Link from 'next/link'
 import { FlowForm } from './components/FlowForm'
+import { apiFetch } from '@/lib/api'
 
 interface Flow {
   id: number
@@ -32,7 +33,7 @@ export default function FlowsPage() {
 
   const fetchFlows = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/flows/')
+      const response = await apiFetch('http://localhost:8000/api/flows/')
       const data = await response.json()
       setFlows(data)
     } catch (error) {
@@ -31,6 +31,7 @@ import {
   SelectValue,
 } from '@/components/ui/select'
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card'
+import { apiFetch } from '@/lib/api'
 
 const segmentSchema = z.object({
   name: z.string().min(1, 'Segment name is required'),
@@ -56,6 +57,8 @@ const AVAILABLE_FIELDS = [
   { value: 'total_orders', label: 'Total Orders' },
   { value: 'email_subscribed', label: 'Email Subscribed' },
   { value: 'last_order_date', label: 'Last Order Date' },
+  { value: 'rfm_score', label: 'RFM Score' },
+  { value: 'rfm_segment', label: 'RFM Segment' },
   { value: 'acquisition_source', label: 'Acquisition Source' },
 ] as const
 
@@ -103,7 +106,7 @@ export function SegmentForm({
         : 'http://localhost:8000/api/segments/'
       const method = isEditing ? 'PUT' : 'POST'
       
-      const response = await fetch(url, {
+      const response = await apiFetch(url, {
         method,
         headers: {
           'Content-Type': 'application/json',
@@ -10,6 +10,7 @@ import {
   DialogTitle,
   DialogDescription,
 } from '@/components/ui/dialog'
+import { apiFetch } from '@/lib/api'
 
 interface Segment {
   id: number
@@ -46,7 +47,7 @@ export default function SegmentsPage() {
 
   const fetchSegments = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/segments/')
+      const response = await apiFetch('http://localhost:8000/api/segments/')
       const data = await response.json()
       setSegments(data)
     } catch (error) {
@@ -65,7 +66,7 @@ export default function SegmentsPage() {
     setPreviewSegment(segment)
     setPreviewLoading(true)
     try {
-      const response = await fetch(`http://localhost:8000/api/segments/${segment.id}/preview/`)
+      const response = await apiFetch(`http://localhost:8000/api/segments/${segment.id}/preview/`)
       const data = await response.json()
       setPreviewData(data)
     } catch (error) {
@@ -0,0 +1,19 @@
+// After a write the API answers with X-Primary-Until; sending it back on
+// the following requests keeps their reads on the primary database until
+// then, so this client sees its own writes despite replica lag
+const STICKY_HEADER = 'X-Primary-Until'
+
+let primaryUntil: string | null = null
+
+export async function apiFetch(input: RequestInfo | URL, init: RequestInit = {}) {
+  const headers = new Headers(init.headers)
+  if (primaryUntil && Number(primaryUntil) * 1000 > Date.now()) {
+    headers.set(STICKY_HEADER, primaryUntil)
+  }
+  const response = await fetch(input, { ...init, headers })
+  const until = response.headers.get(STICKY_HEADER)
+  if (until) {
+    primaryUntil = until
+  }
+  return response
+}